@@ -1,4 +1,30 @@
-from .__version__ import __version__
-from .chatgpt_prompt_wrapper import main
+from __future__ import annotations
+
+import sys
+from typing import Any
 
 __all__ = ["main", "__version__"]
+
+
+def main() -> int:
+    # Try the server (`cg serve`) first, before importing the modules which
+    # are needed only to run the command in this process.
+    from .client import forward
+
+    code = forward(sys.argv[1:])
+    if code is not None:
+        return code
+
+    from .chatgpt_prompt_wrapper import main as run
+
+    return run()
+
+
+def __getattr__(name: str) -> Any:
+    if name == "__version__":
+        from .__version__ import __version__ as version
+
+        # Importing the submodule sets it as the package attribute.
+        globals()["__version__"] = version
+        return version
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -5,9 +5,11 @@ true_false_params = [
     ("show", "hide"),
     ("multiline", "no_multiline"),
     ("vi", "emacs"),
+    ("cache", "no_cache"),
+    ("prefetch", "no_prefetch"),
 ]
 
-true_params = ["show_cost"]
+true_params = ["show_cost", "refresh", "profile_memory"]
 
 
 def get_arg_parser() -> ArgumentParser:
@@ -70,6 +72,16 @@ def get_arg_parser() -> ArgumentParser:
         help="The minimum of output tokens for the completion. The input tokens must be less than conext_window - min_output_tokens (- a few tokens for the model to process).",
         type=int,
     )
+    arg_parser.add_argument(
+        "--prompt-budget",
+        help="The target of prompt tokens of the history for `chat` and `discuss` modes. 0 uses context_window - min_output_tokens.",
+        type=int,
+    )
+    arg_parser.add_argument(
+        "--summary-model",
+        help="The model to summarize dropped messages for `chat` and `discuss` modes.",
+        type=str,
+    )
     arg_parser.add_argument(
         "--show",
         help="Show prompt for `ask` mode.",
@@ -100,6 +112,112 @@ def get_arg_parser() -> ArgumentParser:
         help="Use emacs mode at `chat`.",
         action="store_true",
     )
+    arg_parser.add_argument(
+        "--resume",
+        help="ID of the session to resume for `chat` mode (`last` for the latest one).",
+        type=str,
+    )
+    arg_parser.add_argument(
+        "--cache",
+        help="Use the response cache.",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        help="Do not use the response cache.",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--refresh",
+        help="Ignore cached responses and update the response cache.",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--prefetch",
+        help="Request the next reply in background for `discuss` mode.",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--no-prefetch",
+        help="Request the next reply after Enter for `discuss` mode.",
+        action="store_true",
+    )
+    arg_parser.add_argument(
+        "--rounds",
+        help="Run `discuss` without input for this number of rounds.",
+        type=int,
+    )
+    arg_parser.add_argument(
+        "--themes",
+        help="File of themes (one per line, `-` for stdin) for headless `discuss`.",
+        type=str,
+    )
+    arg_parser.add_argument(
+        "--transcript-dir",
+        help="Directory to write transcripts of headless `discuss`.",
+        type=str,
+    )
+    arg_parser.add_argument(
+        "--batch-cmd",
+        help="Command whose configuration and prompt are used for `batch`.",
+        type=str,
+    )
+    arg_parser.add_argument(
+        "--concurrency",
+        help="The maximum number of concurrent requests for `batch`, `ask --file` and `ask --candidates`, or discussions for headless `discuss`.",
+        type=int,
+    )
+    arg_parser.add_argument(
+        "--file",
+        help="Input file (`-` for stdin) for `ask` mode, which is split into chunks sent concurrently and whose results are combined.",
+        type=str,
+    )
+    arg_parser.add_argument(
+        "--chunk-tokens",
+        help="The maximum tokens of a chunk of `--file` (0: fit in the context window).",
+        type=int,
+    )
+    arg_parser.add_argument(
+        "--chunk-overlap",
+        help="Tokens shared by consecutive chunks of `--file`.",
+        type=int,
+    )
+    arg_parser.add_argument(
+        "--candidates",
+        help="The number of candidate answers to generate in `ask` mode, shown side by side or chosen by `--scorer`.",
+        type=int,
+    )
+    arg_parser.add_argument(
+        "--scorer",
+        help="How to choose one of the candidates: shortest, regex (the most matches of `--score-pattern`) or judge (asked to the model).",
+        type=str,
+    )
+    arg_parser.add_argument(
+        "--score-pattern",
+        help="Regular expression for `--scorer regex`.",
+        type=str,
+    )
+    arg_parser.add_argument(
+        "--output",
+        help="Output JSONL file for `batch` (default: stdout).",
+        type=str,
+    )
+    arg_parser.add_argument(
+        "--order",
+        help="Output order for `batch`: `input` or `completion`.",
+        type=str,
+        choices=["input", "completion"],
+    )
+    arg_parser.add_argument(
+        "--profile",
+        help="Write the CPU profile (pstats) to the file and its summary to the file + `.txt`.",
+        type=str,
+    )
+    arg_parser.add_argument(
+        "--profile-memory",
+        help="Trace memory allocations in the profile.",
+        action="store_true",
+    )
     arg_parser.add_argument(
         "--show_cost",
         help="Show cost used.",
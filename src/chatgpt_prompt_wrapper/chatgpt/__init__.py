@@ -1,6 +1,41 @@
-from .ask import Ask
-from .chat import Chat
-from .chatgpt import ChatGPT, Messages
-from .discuss import Discuss
+from __future__ import annotations
 
-__all__ = ["ChatGPT", "Messages", "Ask", "Chat", "Discuss"]
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .ask import Ask
+    from .batch import Batch
+    from .chat import Chat
+    from .chatgpt import ChatGPT, Messages
+    from .discuss import Discuss
+    from .window import MessageWindow
+
+__all__ = [
+    "ChatGPT",
+    "Messages",
+    "Ask",
+    "Batch",
+    "Chat",
+    "Discuss",
+    "MessageWindow",
+]
+
+# Submodules import openai, tiktoken and prompt_toolkit, which take hundreds
+# of milliseconds. Load them only when they are used.
+_modules = {
+    "Ask": "ask",
+    "Batch": "batch",
+    "Chat": "chat",
+    "ChatGPT": "chatgpt",
+    "Messages": "chatgpt",
+    "Discuss": "discuss",
+    "MessageWindow": "window",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _modules:
+        module = importlib.import_module(f".{_modules[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,14 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import re
+import shutil
+import sys
+import textwrap
+import time
 from dataclasses import dataclass
+from itertools import zip_longest
 from typing import TYPE_CHECKING
 
 from inherit_docstring import inherit_docstring
@@ -11,6 +19,59 @@ from .chatgpt import ChatGPT, Messages
 if TYPE_CHECKING:
     from openai.types.chat import ChatCompletion
 
+REDUCE_PROMPT = (
+    "The following are the results of the request above for consecutive "
+    "parts of a long input. Combine them into one result for the whole input."
+)
+# Characters of the input encoded by one thread.
+ENCODE_BLOCK_CHARS = 100000
+JUDGE_PROMPT = (
+    "The following are candidate answers to the request above. Choose the "
+    "best one. Answer only the number of the best candidate."
+)
+SCORERS = ["", "shortest", "regex", "judge"]
+# Candidates are shown one after another if the columns are narrower.
+MIN_COLUMN_WIDTH = 20
+
+
+def side_by_side(texts: list[str], width: int, sep: str = " | ") -> str:
+    """Lay out texts in columns which fit in the width.
+
+    Parameters
+    ----------
+    texts : list[str]
+        Texts to show.
+    width : int
+        Width of the output.
+    sep : str
+        Separator of the columns.
+
+    Returns
+    -------
+    str
+        The texts with their headers in columns, or one after another if
+        the columns are narrower than MIN_COLUMN_WIDTH.
+
+    """
+    column = (width - len(sep) * (len(texts) - 1)) // len(texts)
+    if column < MIN_COLUMN_WIDTH:
+        return "\n\n".join(
+            f"Candidate {i}:\n{x}" for i, x in enumerate(texts, 1)
+        )
+    columns = [
+        [f"Candidate {i}", "-" * column]
+        + [
+            wrapped
+            for line in x.splitlines()
+            for wrapped in textwrap.wrap(line, column) or [""]
+        ]
+        for i, x in enumerate(texts, 1)
+    ]
+    return "\n".join(
+        sep.join(x.ljust(column) for x in row).rstrip()
+        for row in zip_longest(*columns, fillvalue="")
+    )
+
 
 @inherit_docstring
 @dataclass
@@ -21,34 +82,448 @@ class Ask(ChatGPT):
     ----------
     show: bool
         Whether to show the prompt.
+    file: str
+        Input file to split into chunks which are sent with the prompt concurrently (map), and whose results are combined by reduce_prompt (reduce). `-` reads from stdin. If empty, send the prompt only.
+    chunk_tokens: int
+        The maximum tokens of a chunk. 0 uses the maximum which fits in the context window with the prompt and the output (max_output_tokens up to a half of the context window, or a quarter of the context window if max_output_tokens is not set).
+    chunk_overlap: int
+        Tokens shared by consecutive chunks.
+    concurrency: int
+        The maximum number of concurrent requests for chunks or candidates.
+    reduce_prompt: str
+        Instruction to combine the results of chunks.
+    candidates: int
+        The number of candidate answers to generate.
+    candidates_n: bool
+        Whether to generate candidates in one request by `n`. If False, or if the server returns fewer choices, candidates are generated by concurrent requests.
+    scorer: str
+        How to choose the answer from the candidates: shortest, regex (the most matches of score_pattern) or judge (asked by judge_prompt). If empty, all candidates are shown side by side.
+    score_pattern: str
+        Regular expression for the regex scorer.
+    judge_prompt: str
+        Instruction to choose the best candidate for the judge scorer.
 
     """
 
     show: bool = False
+    file: str = ""
+    chunk_tokens: int = 0
+    chunk_overlap: int = 100
+    concurrency: int = 8
+    reduce_prompt: str = REDUCE_PROMPT
+    candidates: int = 1
+    candidates_n: bool = True
+    scorer: str = ""
+    score_pattern: str = ""
+    judge_prompt: str = JUDGE_PROMPT
 
-    def get_tokens(self, response: ChatCompletion) -> tuple[int, int]:
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        if self.chunk_tokens < 0:
+            raise ChatGPTPromptWrapperError(
+                f"chunk_tokens must not be negative: {self.chunk_tokens}",
+            )
+        if self.chunk_overlap < 0:
+            raise ChatGPTPromptWrapperError(
+                f"chunk_overlap must not be negative: {self.chunk_overlap}",
+            )
+        if self.concurrency < 1:
+            raise ChatGPTPromptWrapperError(
+                f"concurrency must be positive: {self.concurrency}",
+            )
+        if self.candidates < 1:
+            raise ChatGPTPromptWrapperError(
+                f"candidates must be positive: {self.candidates}",
+            )
+        if self.scorer not in SCORERS:
+            raise ChatGPTPromptWrapperError(
+                f"Invalid scorer: {self.scorer}. Please choose from {', '.join(x for x in SCORERS if x)}.",
+            )
+        if self.scorer == "regex":
+            if not self.score_pattern:
+                raise ChatGPTPromptWrapperError(
+                    "The regex scorer needs score_pattern.",
+                )
+            try:
+                self.score_regex = re.compile(self.score_pattern)
+            except re.error as e:
+                raise ChatGPTPromptWrapperError(
+                    f"Invalid score_pattern: {self.score_pattern}: {e}",
+                ) from e
+
+    def get_tokens(self, response: ChatCompletion) -> tuple[int, int, int]:
+        """Prompt, completion and cached prompt tokens of the response."""
         if response.usage:
             prompt_tokens = response.usage.prompt_tokens
             completion_tokens = response.usage.completion_tokens
+            cached_tokens = self.get_cached_tokens(response.usage)
         else:
             self.log.warning("API response does not have usage information")
             prompt_tokens = 0
             completion_tokens = 0
-        return prompt_tokens, completion_tokens
+            cached_tokens = 0
+        return prompt_tokens, completion_tokens, cached_tokens
 
-    def run(self, messages: Messages) -> float:  # noqa: C901
-        messages = self.fix_messages(messages)
-        max_size = max(
-            10,
-            max(len(self.get_name(message)) for message in messages),
+    def read_input(self) -> str:
+        try:
+            if self.file == "-":
+                return sys.stdin.read()
+            with open(self.file) as f:
+                return f.read()
+        except OSError as e:
+            raise ChatGPTPromptWrapperError(str(e)) from e
+
+    def get_output_reserve(self) -> int:
+        """Tokens left for the outputs of chunks and of combining results.
+
+        max_output_tokens (at most a half of the context window) or a
+        quarter of the context window if max_output_tokens is not set.
+        """
+        reserve = (
+            min(self.max_output_tokens, self.context_window // 2)
+            if self.max_output_tokens
+            else self.context_window // 4
         )
-        if self.show:
-            for message in messages:
-                self.log.info(self.get_output(message, max_size))
-        response = self.completion_message(messages)
-        prompt_tokens, completion_tokens = self.get_tokens(response)
+        return max(reserve, self.min_output_tokens)
+
+    def get_input_limit(
+        self,
+        messages: Messages,
+        output_tokens: int | None = None,
+    ) -> int:
+        """Tokens of a message which can be added to the messages.
+
+        `output_tokens` (min_output_tokens if None) are left for the output.
+        """
+        if self.encoding is None:
+            raise ChatGPTPromptWrapperError(
+                "Splitting the input needs the context window of the model. Please set context_window (or model_context_window).",
+            )
+        if output_tokens is None:
+            output_tokens = self.min_output_tokens
+        return (
+            self.context_window
+            - output_tokens
+            - self.num_tokens_from_messages(
+                [*messages, {"role": "user", "content": ""}],
+            )
+        )
+
+    def get_chunk_size(self, messages: Messages) -> int:
+        size = (
+            min(self.chunk_tokens, self.get_input_limit(messages))
+            if self.chunk_tokens
+            else self.get_input_limit(messages, self.get_output_reserve())
+        )
+        if size <= self.chunk_overlap:
+            raise ChatGPTPromptWrapperError(
+                f"Chunk tokens ({size}) must be larger than chunk_overlap ({self.chunk_overlap}). The prompt may be too long for context_window ({self.context_window}).",
+            )
+        return size
+
+    def split_input(self, text: str, size: int) -> list[str]:
+        """Split the text into chunks of `size` tokens.
+
+        Blocks of lines are encoded in threads and consecutive chunks share
+        `chunk_overlap` tokens.
+
+        Parameters
+        ----------
+        text : str
+            The input.
+        size : int
+            The maximum tokens of a chunk.
+
+        Returns
+        -------
+        list[str]
+            The chunks.
+
+        """
+        if self.encoding is None:  # pragma: no cover
+            return [text]
+        blocks = [""]
+        for line in text.splitlines(keepends=True):
+            if len(blocks[-1]) >= ENCODE_BLOCK_CHARS:
+                blocks.append("")
+            blocks[-1] += line
+        tokens = [
+            token
+            for block in self.encoding.encode_ordinary_batch(
+                blocks,
+                num_threads=min(self.tokenizer_threads, os.cpu_count() or 1),
+            )
+            for token in block
+        ]
+        chunks = []
+        for start in range(0, len(tokens), size - self.chunk_overlap):
+            chunks.append(self.encoding.decode(tokens[start : start + size]))
+            if start + size >= len(tokens):
+                break
+        return chunks
+
+    async def complete_part(
+        self,
+        messages: Messages,
+        slots: asyncio.Semaphore,
+    ) -> tuple[str, float]:
+        async with slots:
+            start = time.monotonic()
+            response, cached = await self.async_completion_message(messages)
+            latency = time.monotonic() - start
+        if response.choices[0].finish_reason == "length":
+            self.log.warning(
+                "A partial result was truncated due to the tokens limit. Please set smaller chunk_tokens or larger max_output_tokens.",
+            )
+        prompt_tokens, completion_tokens, cached_tokens = self.get_tokens(
+            response,
+        )
+        return response.choices[0].message.content or "", self.add_usage(
+            prompt_tokens,
+            completion_tokens,
+            latency,
+            cached,
+            cached_tokens=cached_tokens,
+        )
+
+    def make_reduce_messages(
+        self,
+        messages: Messages,
+        results: list[str],
+    ) -> Messages:
+        parts = "\n\n".join(
+            f"Result {i}:\n{x}" for i, x in enumerate(results, 1)
+        )
+        return [
+            *messages,
+            {"role": "user", "content": f"{self.reduce_prompt}\n\n{parts}"},
+        ]
 
-        finish_reason = response.choices[0].finish_reason
+    def group_results(self, results: list[str], size: int) -> list[list[str]]:
+        groups: list[list[str]] = [[]]
+        tokens = 0
+        for result in results:
+            # With the header of the result.
+            num_tokens = self.count_tokens(result) + 10
+            if groups[-1] and tokens + num_tokens > size:
+                groups.append([])
+                tokens = 0
+            groups[-1].append(result)
+            tokens += num_tokens
+        return groups
+
+    async def map_reduce(self, messages: Messages) -> tuple[str, float]:
+        text = self.read_input()
+        if not text.strip():
+            raise ChatGPTPromptWrapperError("The input is empty.")
+        size = self.get_chunk_size(messages)
+        chunks = self.split_input(text, size)
+        slots = asyncio.Semaphore(self.concurrency)
+        self.async_client = self.make_async_client()
+        try:
+            parts = await asyncio.gather(
+                *[
+                    self.complete_part(
+                        [*messages, {"role": "user", "content": x}],
+                        slots,
+                    )
+                    for x in chunks
+                ],
+            )
+            results = [x for x, _ in parts]
+            cost = sum(x for _, x in parts)
+            # Results which do not fit in one request are combined in
+            # groups until they do.
+            reduce_size = self.get_input_limit(
+                messages,
+                self.get_output_reserve(),
+            ) - self.count_tokens(self.reduce_prompt)
+            while len(results) > 1:
+                groups = self.group_results(results, reduce_size)
+                if len(groups) == len(results):
+                    raise ChatGPTPromptWrapperError(
+                        "The partial results are too long to be combined. Please set smaller max_output_tokens or larger chunk_tokens.",
+                    )
+                parts = await asyncio.gather(
+                    *[
+                        self.complete_part(
+                            self.make_reduce_messages(messages, x),
+                            slots,
+                        )
+                        for x in groups
+                    ],
+                )
+                results = [x for x, _ in parts]
+                cost += sum(x for _, x in parts)
+        finally:
+            await self.async_client.close()
+        return results[0], cost
+
+    async def complete_choices(
+        self,
+        messages: Messages,
+        n: int,
+        slots: asyncio.Semaphore,
+    ) -> tuple[list[str], float]:
+        async with slots:
+            start = time.monotonic()
+            response, cached = await self.async_completion_message(
+                messages,
+                n=n,
+            )
+            latency = time.monotonic() - start
+        if any(x.finish_reason == "length" for x in response.choices):
+            self.log.warning(
+                "A candidate was truncated due to the tokens limit.",
+            )
+        prompt_tokens, completion_tokens, cached_tokens = self.get_tokens(
+            response,
+        )
+        return [x.message.content or "" for x in response.choices], (
+            self.add_usage(
+                prompt_tokens,
+                completion_tokens,
+                latency,
+                cached,
+                cached_tokens=cached_tokens,
+            )
+        )
+
+    async def generate_candidates(
+        self,
+        messages: Messages,
+        slots: asyncio.Semaphore,
+    ) -> tuple[list[str], float]:
+        """Generate candidates by `n`, or by concurrent requests.
+
+        Parameters
+        ----------
+        messages : Messages
+            Messages to send.
+        slots : asyncio.Semaphore
+            Slots of concurrent requests.
+
+        Returns
+        -------
+        tuple[list[str], float]
+            The candidates and the cost of all requests.
+
+        """
+        sizes = (
+            [self.candidates] if self.candidates_n else [1] * self.candidates
+        )
+        parts = await asyncio.gather(
+            *[self.complete_choices(messages, n, slots) for n in sizes],
+        )
+        candidates = [x for contents, _ in parts for x in contents]
+        cost = sum(x for _, x in parts)
+        if (missing := self.candidates - len(candidates)) > 0:
+            # Servers which ignore `n` return only one choice.
+            self.log.warning(
+                f"The server returned {len(candidates)} of {self.candidates} candidates. Set candidates_n = false if it does not support `n`.",
+            )
+            parts = await asyncio.gather(
+                *[
+                    self.complete_choices(messages, 1, slots)
+                    for _ in range(missing)
+                ],
+            )
+            candidates += [x for contents, _ in parts for x in contents]
+            cost += sum(x for _, x in parts)
+        return candidates[: self.candidates], cost
+
+    async def judge(
+        self,
+        messages: Messages,
+        candidates: list[str],
+        slots: asyncio.Semaphore,
+    ) -> tuple[int, float]:
+        parts = "\n\n".join(
+            f"Candidate {i}:\n{x}" for i, x in enumerate(candidates, 1)
+        )
+        reply, cost = await self.complete_part(
+            [
+                *messages,
+                {"role": "user", "content": f"{self.judge_prompt}\n\n{parts}"},
+            ],
+            slots,
+        )
+        match = re.search(r"\d+", reply)
+        index = int(match.group()) - 1 if match else -1
+        if not 0 <= index < len(candidates):
+            self.log.warning(
+                f"The judge did not choose a candidate: {reply}. The first one is used.",
+            )
+            index = 0
+        return index, cost
+
+    async def select_candidate(
+        self,
+        messages: Messages,
+        candidates: list[str],
+        slots: asyncio.Semaphore,
+    ) -> tuple[int, float]:
+        """Choose a candidate by the scorer.
+
+        Parameters
+        ----------
+        messages : Messages
+            Messages sent to generate the candidates.
+        candidates : list[str]
+            The candidates.
+        slots : asyncio.Semaphore
+            Slots of concurrent requests.
+
+        Returns
+        -------
+        tuple[int, float]
+            Index of the chosen candidate and the cost of the judge.
+
+        """
+        if self.scorer == "shortest":
+            return min(
+                range(len(candidates)),
+                key=lambda i: len(candidates[i]),
+            ), 0.0
+        if self.scorer == "regex":
+            matches = [len(self.score_regex.findall(x)) for x in candidates]
+            return matches.index(max(matches)), 0.0
+        return await self.judge(messages, candidates, slots)
+
+    async def best_of(self, messages: Messages) -> tuple[list[str], float]:
+        """Generate candidates and choose one if the scorer is set.
+
+        Returns
+        -------
+        tuple[list[str], float]
+            The chosen candidate (or all candidates without the scorer) and
+            the cost.
+
+        """
+        slots = asyncio.Semaphore(self.concurrency)
+        self.async_client = self.make_async_client()
+        try:
+            candidates, cost = await self.generate_candidates(messages, slots)
+            if not self.scorer:
+                return candidates, cost
+            index, judge_cost = await self.select_candidate(
+                messages,
+                candidates,
+                slots,
+            )
+        finally:
+            await self.async_client.close()
+        self.log.debug(
+            f"Candidate {index + 1} of {len(candidates)} was chosen by {self.scorer}.",
+        )
+        return [candidates[index]], cost + judge_cost
+
+    def warn_finish_reason(
+        self,
+        finish_reason: str | None,
+        messages: Messages,
+        prompt_tokens: int,
+    ) -> None:
         if finish_reason == "stop":
             pass
         elif finish_reason == "length":
@@ -67,8 +542,54 @@ class Ask(ChatGPT):
             self.log.warning("API response is incomplete")
         else:
             raise ChatGPTPromptWrapperError(
-                f"Unknown finish_reason: {response.choices[0].finish_reason}",
+                f"Unknown finish_reason: {finish_reason}",
             )
+
+    def run_file(self, messages: Messages, max_size: int) -> float:
+        answer, cost = asyncio.run(self.map_reduce(messages))
+        if self.show:
+            message = {"role": "assistant", "content": answer}
+            answer = self.get_output(message, max_size)
+        self.log.info(answer)
+        return cost
+
+    def run_candidates(self, messages: Messages, max_size: int) -> float:
+        answers, cost = asyncio.run(self.best_of(messages))
+        if len(answers) > 1:
+            width = shutil.get_terminal_size().columns
+            self.log.info(side_by_side(answers, width))
+        elif self.show:
+            message = {"role": "assistant", "content": answers[0]}
+            self.log.info(self.get_output(message, max_size))
+        else:
+            self.log.info(answers[0])
+        return cost
+
+    def run(self, messages: Messages) -> float:
+        messages = self.fix_messages(messages)
+        max_size = max(
+            10,
+            max((len(self.get_name(x)) for x in messages), default=0),
+        )
+        if self.show:
+            for message in messages:
+                self.log.info(self.get_output(message, max_size))
+        if self.file:
+            return self.run_file(messages, max_size)
+        if self.candidates > 1:
+            return self.run_candidates(messages, max_size)
+        start = time.monotonic()
+        response = self.completion_message(messages)
+        latency = time.monotonic() - start
+        prompt_tokens, completion_tokens, cached_tokens = self.get_tokens(
+            response,
+        )
+
+        self.warn_finish_reason(
+            response.choices[0].finish_reason,
+            messages,
+            prompt_tokens,
+        )
         if self.show:
             answer = self.get_output(
                 response.choices[0].message.to_dict(),
@@ -80,10 +601,13 @@ class Ask(ChatGPT):
             answer = ""
         self.log.info(answer)
 
-        if self.model in self.prices:
-            return (
-                self.prices[self.model][0] * prompt_tokens / 1000.0
-                + self.prices[self.model][1] * completion_tokens / 1000.0
+        return (
+            self.add_usage(
+                prompt_tokens,
+                completion_tokens,
+                latency,
+                self.from_cache,
+                cached_tokens=cached_tokens,
             )
-        else:
-            return 0
+            + self.hedge_cost
+        )
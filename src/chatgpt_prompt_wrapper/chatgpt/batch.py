@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import IO, Any
+
+import openai
+from inherit_docstring import inherit_docstring
+
+from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+from .chatgpt import ChatGPT, Messages
+
+
+@inherit_docstring
+@dataclass
+class Batch(ChatGPT):
+    """Batch class to send many requests concurrently.
+
+    Each line of the input is a JSON of a list of messages, an object with
+    `messages`, or a string (or an object with `input`) which is sent as a
+    user message after the predefined messages of the command.
+
+    Parameters
+    ----------
+    batch_input: str
+        Input JSONL file. `-` reads from stdin.
+    output: str
+        Output JSONL file. If empty or `-`, write to stdout.
+    concurrency: int
+        The maximum number of concurrent requests.
+    order: str
+        Output order, `input` (same order as the input) or `completion`
+        (as soon as each request is completed).
+
+    """
+
+    batch_input: str = "-"
+    output: str = ""
+    concurrency: int = 8
+    order: str = "input"
+
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        if self.concurrency < 1:
+            raise ChatGPTPromptWrapperError(
+                f"concurrency must be positive: {self.concurrency}",
+            )
+        if self.order not in ["input", "completion"]:
+            raise ChatGPTPromptWrapperError(
+                f"Invalid order: {self.order}. Please choose from input, completion.",
+            )
+
+    def make_messages(self, messages: Messages, data: Any) -> Messages:
+        if isinstance(data, dict) and "messages" in data:
+            data = data["messages"]
+        elif isinstance(data, dict) and "input" in data:
+            data = data["input"]
+        if isinstance(data, str):
+            new_messages = [dict(x) for x in messages]
+            new_messages.append({"role": "user", "content": data})
+        elif isinstance(data, list) and all(isinstance(x, dict) for x in data):
+            new_messages = [dict(x) for x in data]
+        else:
+            raise ChatGPTPromptWrapperError(f"Invalid input: {data}")
+        return self.fix_messages(new_messages)
+
+    async def complete(
+        self,
+        index: int,
+        messages: Messages,
+        line: str,
+    ) -> dict[str, Any]:
+        try:
+            start = time.monotonic()
+            response, cached = await self.async_completion_message(
+                self.make_messages(messages, json.loads(line)),
+            )
+        except (
+            ValueError,
+            ChatGPTPromptWrapperError,
+            openai.OpenAIError,
+        ) as e:
+            return {"index": index, "error": str(e)}
+        result: dict[str, Any] = {
+            "index": index,
+            "content": response.choices[0].message.content or "",
+            "finish_reason": response.choices[0].finish_reason,
+        }
+        latency = time.monotonic() - start
+        if cached:
+            result["cached"] = True
+            self.add_usage(0, 0, latency, cached=True)
+        elif response.usage:
+            result["prompt_tokens"] = response.usage.prompt_tokens
+            result["completion_tokens"] = response.usage.completion_tokens
+            result["cached_tokens"] = self.get_cached_tokens(response.usage)
+            result["cost"] = self.add_usage(
+                response.usage.prompt_tokens,
+                response.usage.completion_tokens,
+                latency,
+                cached_tokens=result["cached_tokens"],
+            )
+        return result
+
+    async def run_batch(
+        self,
+        messages: Messages,
+        in_f: IO[str],
+        out_f: IO[str],
+    ) -> float:
+        # A slot is released only after the result is written, so that the
+        # results waiting for earlier ones in the input order are also
+        # bounded by concurrency.
+        slots = asyncio.Semaphore(self.concurrency)
+        results: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+        cost = 0.0
+
+        async def worker(index: int, line: str) -> None:
+            try:
+                result = await self.complete(index, messages, line)
+            except Exception as e:  # noqa: BLE001
+                # Always put a result not to keep the slot and the later
+                # results waiting forever.
+                result = {"index": index, "error": f"{type(e).__name__}: {e}"}
+            await results.put(result)
+
+        async def writer() -> None:
+            nonlocal cost
+            waiting: dict[int, dict[str, Any]] = {}
+            next_index = 0
+            while (result := await results.get()) is not None:
+                cost += result.pop("cost", 0)
+                if self.order == "completion":
+                    ready = [result]
+                else:
+                    waiting[result["index"]] = result
+                    ready = []
+                    while next_index in waiting:
+                        ready.append(waiting.pop(next_index))
+                        next_index += 1
+                for x in ready:
+                    out_f.write(json.dumps(x, ensure_ascii=False) + "\n")
+                    slots.release()
+                out_f.flush()
+
+        try:
+            writer_task = asyncio.create_task(writer())
+            tasks = []
+            index = 0
+            # Read in a thread not to block the running requests while waiting
+            # for stdin.
+            while line := await asyncio.to_thread(in_f.readline):
+                if not line.strip():
+                    continue
+                await slots.acquire()
+                tasks.append(asyncio.create_task(worker(index, line)))
+                index += 1
+            await asyncio.gather(*tasks)
+            await results.put(None)
+            await writer_task
+        finally:
+            await self.async_client.close()
+        return cost
+
+    def run(self, messages: Messages) -> float:
+        self.async_client = self.make_async_client()
+        with ExitStack() as stack:
+            try:
+                in_f = (
+                    sys.stdin
+                    if self.batch_input == "-"
+                    else stack.enter_context(open(self.batch_input))
+                )
+                out_f = (
+                    sys.stdout
+                    if self.output in ["", "-"]
+                    else stack.enter_context(open(self.output, "w"))
+                )
+            except OSError as e:
+                raise ChatGPTPromptWrapperError(str(e)) from e
+            return asyncio.run(self.run_batch(messages, in_f, out_f))
@@ -1,4 +1,7 @@
+import time
 from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
 
 from inherit_docstring import inherit_docstring
 from prompt_toolkit import prompt
@@ -8,8 +11,11 @@ from prompt_toolkit.key_binding.bindings.named_commands import accept_line
 from prompt_toolkit.key_binding.key_processor import KeyPressEvent
 from prompt_toolkit.styles import Style
 
-from .chatgpt import Messages
+from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+from ..session_store import SessionStore
+from .chatgpt import Message, Messages
 from .stream import Stream
+from .window import MessageWindow
 
 
 @inherit_docstring
@@ -25,6 +31,12 @@ class Chat(Stream):
         If true, use the vi keybindings at input prompt (default is emacs key bindings).
     chat_exit_cmd: list[str]
         The command to exit the chat.
+    session_dir: str
+        Directory to save sessions. If empty, sessions are not saved.
+    resume: str
+        ID of the session to resume (`last` for the latest one).
+    max_sessions: int
+        The maximum number of saved sessions. 0 keeps all sessions.
 
     """
 
@@ -33,10 +45,21 @@ class Chat(Stream):
     chat_exit_cmd: list[str] = field(
         default_factory=lambda: ["bye", "bye!", "exit", "quit"],
     )
+    session_dir: str = ""
+    resume: str = ""
+    max_sessions: int = 100
 
     def __post_init__(self) -> None:
         super().__post_init__()
         self.make_prompt()
+        self.sessions = (
+            SessionStore(Path(self.session_dir), self.max_sessions)
+            if self.session_dir
+            else None
+        )
+        self.session_id = ""
+        # Messages not written to the session yet.
+        self.unsaved: list[tuple[Message, int]] = []
 
     def make_prompt(self) -> None:
         if self.multiline:
@@ -85,20 +108,92 @@ class Chat(Stream):
             "vi_mode": self.vi,
         }
 
-    def run_main(self, messages: Messages) -> tuple[int, float]:
+    def session_header(self) -> dict[str, Any]:
+        return {
+            "model": self.model,
+            "encoding": self.encoding.name if self.encoding else "",
+            "tokens_per_message": getattr(self, "tokens_per_message", 0),
+            "tokens_per_name": getattr(self, "tokens_per_name", 0),
+        }
+
+    def load_session(self) -> tuple[Messages, list[int]]:
+        if self.sessions is None:
+            raise ChatGPTPromptWrapperError(
+                "Sessions are not saved (session = false).",
+            )
+        self.session_id = self.sessions.resolve(self.resume)
+        header, messages, tokens = self.sessions.load(self.session_id)
+        if any(
+            header.get(k) != v
+            for k, v in self.session_header().items()
+            if k != "model"
+        ):
+            # Counted by another encoding.
+            tokens = self.num_tokens_per_message(messages)
+        return messages, tokens
+
+    def save_turn(self, *messages: tuple[Message, int]) -> None:
+        self.unsaved.extend(messages)
+        if self.sessions is None:
+            return
+        if not self.session_id:
+            self.session_id = self.sessions.new_id()
+        try:
+            self.sessions.append(
+                self.session_id,
+                self.unsaved,
+                self.session_header(),
+            )
+        except OSError as e:
+            self.log.warning(f"Failed to save the session: {e}\n")
+            return
+        self.unsaved = []
+
+    def make_window(self, messages: Messages) -> MessageWindow:
+        if self.resume:
+            messages, tokens = self.load_session()
+        else:
+            tokens = []
+        # The leading system messages are kept when old messages are dropped.
+        pinned = next(
+            (i for i, x in enumerate(messages) if x["role"] != "system"),
+            len(messages),
+        )
+        window = MessageWindow(
+            pinned=pinned,
+            summarizer=self.make_summarizer(),
+        )
+        if self.resume:
+            window.extend(messages, tokens)
+            # The history is trimmed to fit at the first turn.
+            self.check_prompt_tokens(
+                self.num_total_tokens(window.pinned_tokens),
+            )
+            return window
         messages = self.fix_messages(messages)
-        tokens = [
-            self.num_tokens_from_message(message) for message in messages
-        ]
-        prompt_tokens = self.num_total_tokens(sum(tokens))
-        self.check_prompt_tokens(prompt_tokens)
+        tokens = self.num_tokens_per_message(messages)
+        window.extend(messages, tokens)
+        self.check_prompt_tokens(self.num_total_tokens(window.total_tokens))
+        self.unsaved = list(zip(messages, tokens))
+        return window
+
+    def run_main(self, messages: Messages) -> tuple[int, float]:
+        window = self.make_window(messages)
+        messages = window.messages
 
         max_size = (
             max(10, max(len(self.get_name(message)) for message in messages))
             if messages
             else 10
         )
-        for message in messages:
+        shown = messages
+        if self.resume:
+            self.log.info(
+                f"Resumed session {self.session_id} ({len(messages)} messages).\n",
+            )
+            # Only the last turn, not to flood the terminal.
+            shown = messages[-2:]
+        for message in shown:
             self.log.info(
                 self.get_output(message, max_size, add_linebreak=True),
             )
@@ -121,28 +216,43 @@ class Chat(Stream):
                 ):
                     self.log.warning("Input is too long, try shorter.\n")
                     continue
-                messages.append(message)
-                tokens.append(message_tokens)
-                while (
-                    prompt_tokens := self.num_total_tokens(sum(tokens))
-                ) > self.context_window - self.min_output_tokens:
-                    messages = messages[1:]
-                    tokens = tokens[1:]
-                response = self.completion_stream(messages)
+                window.append(message, message_tokens)
+                prompt_tokens = self.fit_window(window)
+                start = time.monotonic()
+                response = self.completion_stream(
+                    window.messages,
+                    prompt_tokens,
+                )
                 new_message = self.show_stream(response, max_size)
+                latency = time.monotonic() - start
                 self.log.info("\n")
-                messages.append(new_message)
-                tokens.append(self.num_tokens_from_message(new_message))
-                if self.model in self.prices:
-                    cost += (
-                        self.prices[self.model][0] * prompt_tokens / 1000.0
-                        + self.prices[self.model][1]
-                        * self.num_tokens_from_message(
-                            new_message,
-                            only_content=True,
-                        )
-                        / 1000.0
-                    )
+                new_message_tokens = self.num_tokens_with_content(
+                    new_message,
+                    self.content_tokens,
+                )
+                window.append(new_message, new_message_tokens)
+                self.save_turn(
+                    (message, message_tokens),
+                    (new_message, new_message_tokens),
+                )
+                prompt_tokens, completion_tokens, cached_tokens = (
+                    self.stream_tokens(prompt_tokens)
+                )
+                cost += self.add_usage(
+                    prompt_tokens,
+                    completion_tokens,
+                    latency,
+                    self.from_cache,
+                    getattr(response, "ttft", None),
+                    cached_tokens,
+                )
         except KeyboardInterrupt:
             self.log.info("\n")
+        finally:
+            if window.summarizer is not None:
+                cost += window.summarizer.close()
+        if self.session_id:
+            self.log.info(
+                f"Session {self.session_id} is saved. Resume it by `--resume {self.session_id}`.\n",
+            )
         return max_size, cost
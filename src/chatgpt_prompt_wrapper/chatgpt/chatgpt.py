@@ -1,19 +1,62 @@
 from __future__ import annotations
 
+import asyncio
+import itertools
 import logging
 import sys
-from dataclasses import dataclass, field
-from typing import Any, cast
+import threading
+import time
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, cast
+from urllib.parse import urlparse
 
 import openai
 import tiktoken
 from openai.types.chat import ChatCompletion, ChatCompletionChunk
 
 from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+from .encoding_store import get_encoding
+from .prefetch import Prefetch
+from .rate_limiter import OPENAI_HOST, RateLimiter, limits_key
+from .response_cache import ResponseCache
+from .timed_stream import TimedStream
+from .token_cache import TokenCache
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from .window import MessageWindow
 
 Message = dict[str, Any]
 Messages = list[Message]
 
+clients: dict[tuple[str, str], openai.OpenAI] = {}
+
+
+def get_client(base_url: str, key: str) -> openai.OpenAI:
+    """Get the client, reusing its connection pool in the process.
+
+    Parameters
+    ----------
+    base_url : str
+        The base URL for the API.
+    key : str
+        OpenAI API key.
+
+    Returns
+    -------
+    openai.OpenAI
+        The client.
+
+    """
+    if (base_url, key) not in clients:
+        clients[(base_url, key)] = openai.OpenAI(
+            base_url=base_url, api_key=key
+        )
+    return clients[(base_url, key)]
+
 
 @dataclass
 class ChatGPT:
@@ -49,10 +92,44 @@ class ChatGPT:
         The context window for each model.
     model_max_output_tokens: dict[str, int]
         The maximum output tokens for each model.
-    prices: dict[str, tuple[float, float]]
-        The prices for each model.
+    prices: dict[str, tuple[float, ...]]
+        The prices for each model: (prompt, completion) or (prompt, completion, cached prompt) per 1K tokens. Without the cached prompt price, cached prompt tokens are counted at the prompt price.
     encoding_name: str
         Encoding name for tiktoken. If not specified, the encoding is decided by the model name.
+    encoding_dir: str
+        Directory of the pre-parsed encodings made by `cg encodings`. If the encoding is not found in it, tiktoken loads the encoding.
+    token_cache_file: str
+        JSON file to cache token counts of messages. If empty, token counts are cached only in memory.
+    token_cache_size: int
+        The maximum number of cached token counts.
+    tokenizer_threads: int
+        The number of threads to count tokens of many messages at once.
+    cache: bool
+        Whether to cache responses on disk and reuse them for the same requests (useful with temperature = 0).
+    refresh: bool
+        Ignore cached responses and update the cache with new responses.
+    cache_dir: str
+        Directory of the response cache.
+    cache_size: int
+        The maximum number of cached responses.
+    cache_ttl: float
+        Time to live of cached responses in seconds. 0 means no expiration.
+    rate_limit: bool | None
+        Whether to schedule requests by the rate limits reported by the API and retry rate limit, connection and server errors with backoff. If None, it is enabled only for the OpenAI API.
+    rate_limit_file: str
+        JSON file to share the rate limits between processes. If empty, the rate limits are kept only in memory.
+    max_retries: int
+        The maximum number of retries of a request.
+    prompt_cache_key: str
+        Key to route requests sharing a long prefix to the same prompt cache of the provider. If empty, it is not sent.
+    stream_usage: bool
+        Whether to request the usage at the end of streamed replies. Set False for servers which reject `stream_options`; the tokens of the replies are counted locally instead.
+    hedge_delay: float
+        Seconds to wait for the first token (or the whole reply if not streamed) before sending a duplicate request. The reply which starts first is used and the other request is cancelled. 0 disables hedging.
+    hedge_base_url: str
+        The base URL for the duplicate request. If empty, base_url is used.
+    hedge_model: str
+        The model for the duplicate request. If empty, model is used.
 
     """
 
@@ -82,12 +159,73 @@ class ChatGPT:
     )
     model_context_window: dict[str, int] = field(default_factory=dict)
     model_max_output_tokens: dict[str, int] = field(default_factory=dict)
-    prices: dict[str, tuple[float, float]] = field(default_factory=dict)
+    prices: dict[str, tuple[float, ...]] = field(default_factory=dict)
     encoding_name: str = ""
+    encoding_dir: str = ""
+    token_cache_file: str = ""
+    token_cache_size: int = 10000
+    tokenizer_threads: int = 8
+    cache: bool = False
+    refresh: bool = False
+    cache_dir: str = ""
+    cache_size: int = 1000
+    cache_ttl: float = 0
+    rate_limit: bool | None = None
+    rate_limit_file: str = ""
+    max_retries: int = 5
+    prompt_cache_key: str = ""
+    stream_usage: bool = True
+    hedge_delay: float = 0
+    hedge_base_url: str = ""
+    hedge_model: str = ""
 
     def __post_init__(self) -> None:
         self.log = logging.getLogger(__name__)
-        self.client = openai.OpenAI(base_url=self.base_url, api_key=self.key)
+        self.token_cache = TokenCache(
+            Path(self.token_cache_file) if self.token_cache_file else None,
+            self.token_cache_size,
+        )
+        self.response_cache = (
+            ResponseCache(
+                Path(self.cache_dir), self.cache_size, self.cache_ttl
+            )
+            if self.cache and self.cache_dir
+            else None
+        )
+        self.from_cache = False
+        # Set by the modes which send requests concurrently.
+        self.async_client: openai.AsyncOpenAI
+        self.usages: list[dict[str, Any]] = []
+        self.retries = 0
+        # Retries already recorded in usages.
+        self.recorded_retries = 0
+        rate_limit = (
+            self.rate_limit
+            if self.rate_limit is not None
+            # Other servers may not report the limits.
+            else urlparse(self.base_url).hostname == OPENAI_HOST
+        )
+        self.rate_limiter = (
+            RateLimiter(
+                Path(self.rate_limit_file) if self.rate_limit_file else None,
+            )
+            if rate_limit
+            else None
+        )
+        self.limits_key = limits_key(self.base_url, self.key, self.model)
+        self.client = get_client(self.base_url, self.key)
+        if self.rate_limiter is not None:
+            # Retries are done by the rate limiter.
+            self.client = self.client.with_options(max_retries=0)
+        if self.hedge_delay < 0:
+            raise ChatGPTPromptWrapperError(
+                f"hedge_delay must not be negative: {self.hedge_delay}",
+            )
+        self.hedge = self.make_hedge() if self.hedge_delay else None
+        # Whether the last reply came from the duplicate request.
+        self.hedged = False
+        # Cost of the cancelled requests of hedging.
+        self.hedge_cost = 0.0
 
         self.ansi_colors = {
             "black": "30",
@@ -134,16 +272,16 @@ class ChatGPT:
             },
         )
 
-        # prices / 1K tokens in USD, (Prompt, Completion)
+        # prices / 1K tokens in USD, (Prompt, Completion[, Cached prompt])
         # Ref: https://openai.com/pricing#language-models
         self.prices.update(
             {
                 k: v
                 for k, v in {
-                    "gpt-4o": (0.0025, 0.010),
+                    "gpt-4o": (0.0025, 0.010, 0.00125),
                     "chatgpt-4o-latest": (0.0025, 0.0010),
-                    "o1": (0.015, 0.060),
-                    "o1-mini": (0.003, 0.012),
+                    "o1": (0.015, 0.060, 0.0075),
+                    "o1-mini": (0.003, 0.012, 0.0015),
                     "gpt-4-turbo": (0.010, 0.030),
                     "gpt-4": (0.030, 0.060),
                     "gpt-3.5-turbo": (0.0005, 0.0015),
@@ -189,10 +327,10 @@ class ChatGPT:
             self.encoding = None
             return
 
-        if self.encoding_name:
-            self.encoding = tiktoken.get_encoding(self.encoding_name)
-        else:
-            self.encoding = tiktoken.encoding_for_model(self.model)
+        self.encoding = get_encoding(
+            self.encoding_name or tiktoken.encoding_name_for_model(self.model),
+            Path(self.encoding_dir) if self.encoding_dir else None,
+        )
         if self.model == "gpt-3.5-turbo-0301":
             self.tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
             self.tokens_per_name = -1  # if there's a name, the role is omitted
@@ -218,38 +356,125 @@ class ChatGPT:
                 f"Too much tokens: prompt tokens ({prompt_tokens}) + completion tokens ({self.min_output_tokens}) > context_window ({self.context_window}).",
             )
 
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            return 0
+        return self.token_cache.count(self.encoding, text)
+
+    def count_tokens_batch(self, texts: list[str]) -> list[int]:
+        if self.encoding is None:
+            return [0] * len(texts)
+        return self.token_cache.count_batch(
+            self.encoding,
+            texts,
+            self.tokenizer_threads,
+        )
+
     # Ref: https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-    def num_tokens_from_message(
+    def num_tokens_per_message(
         self,
-        message: Message,
+        messages: Messages,
         only_content: bool = False,
-    ) -> int:
+    ) -> list[int]:
+        """Count tokens of each message, encoding all texts in one batch.
+
+        Parameters
+        ----------
+        messages : Messages
+            Messages to count tokens.
+        only_content : bool
+            Whether to count only the content (e.g. for completion tokens).
+
+        Returns
+        -------
+        list[int]
+            Tokens of each message.
+
+        """
         if self.encoding is None:
-            return 0
+            return [0] * len(messages)
 
         if only_content:
-            return len(self.encoding.encode(message["content"]))
+            return self.count_tokens_batch([x["content"] for x in messages])
+
+        counts = iter(
+            self.count_tokens_batch([v for x in messages for v in x.values()]),
+        )
+        tokens = []
+        for message in messages:
+            num_tokens = self.tokens_per_message
+            for key in message:
+                num_tokens += next(counts)
+                if key == "name":
+                    num_tokens += self.tokens_per_name
+            tokens.append(num_tokens)
+        return tokens
+
+    def num_tokens_from_message(
+        self,
+        message: Message,
+        only_content: bool = False,
+    ) -> int:
+        return self.num_tokens_per_message([message], only_content)[0]
 
-        num_tokens = self.tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(self.encoding.encode(value))
-            if key == "name":
-                num_tokens += self.tokens_per_name
-        return num_tokens
+    def num_tokens_with_content(
+        self,
+        message: Message,
+        content_tokens: int,
+    ) -> int:
+        """Count tokens of a message whose content tokens are known.
+
+        Only the other fields (e.g. the role) are encoded, so that a reply
+        whose tokens are reported by the API is not encoded again.
+        """
+        return (
+            self.num_tokens_from_message({**message, "content": ""})
+            + content_tokens
+        )
 
     def num_total_tokens(self, prompt_tokens: int) -> int:
         return prompt_tokens + self.reply_tokens
 
     def num_tokens_from_messages(self, messages: Messages) -> int:
-        num_tokens = 0
-        for message in messages:
-            num_tokens += self.num_tokens_from_message(message)
-        return self.num_total_tokens(num_tokens)
+        return self.num_total_tokens(
+            sum(self.num_tokens_per_message(messages))
+        )
+
+    def fit_window(self, window: MessageWindow) -> int:
+        """Trim the window to leave min_output_tokens in the context window.
+
+        Parameters
+        ----------
+        window : MessageWindow
+            The window of messages to be sent.
+
+        Returns
+        -------
+        int
+            Prompt tokens of the trimmed window.
+
+        """
+        window.trim(
+            self.context_window
+            - self.min_output_tokens
+            - self.num_total_tokens(0),
+        )
+        return self.num_total_tokens(window.total_tokens)
 
-    def get_max_completion_tokens(self, messages: Messages) -> int:
+    def count_prompt_tokens(self, messages: Messages) -> int:
+        if self.encoding is None:
+            return 0
+        return self.num_tokens_from_messages(messages)
+
+    def get_max_completion_tokens(
+        self,
+        messages: Messages,
+        prompt_tokens: int | None = None,
+    ) -> int:
         if self.context_window == 0:
             return 0
-        prompt_tokens = self.num_tokens_from_messages(messages)
+        if prompt_tokens is None:
+            prompt_tokens = self.num_tokens_from_messages(messages)
         self.check_prompt_tokens(prompt_tokens)
         remain_tokens = self.context_window - prompt_tokens
         return min(remain_tokens, self.max_output_tokens)
@@ -279,14 +504,120 @@ class ChatGPT:
         lb = "\n" if add_linebreak else ""
         return f"{name}> {message['content']}{lb}"
 
-    def completion(
+    def get_cost(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0,
+    ) -> float:
+        if self.model not in self.prices:
+            return 0
+        prices = self.prices[self.model]
+        cached_price = prices[2] if len(prices) > 2 else prices[0]
+        return (
+            prices[0] * (prompt_tokens - cached_tokens) / 1000.0
+            + cached_price * cached_tokens / 1000.0
+            + prices[1] * completion_tokens / 1000.0
+        )
+
+    @staticmethod
+    def get_cached_tokens(usage: Any) -> int:
+        """Prompt tokens read from the prompt cache of the provider."""
+        details = getattr(usage, "prompt_tokens_details", None)
+        return getattr(details, "cached_tokens", None) or 0
+
+    @staticmethod
+    def get_content_tokens(usage: Any) -> int:
+        """Completion tokens of the usage except the reasoning tokens."""
+        details = getattr(usage, "completion_tokens_details", None)
+        reasoning_tokens = getattr(details, "reasoning_tokens", None) or 0
+        return int(usage.completion_tokens - reasoning_tokens)
+
+    def add_usage(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency: float,
+        cached: bool = False,
+        ttft: float | None = None,
+        cached_tokens: int = 0,
+    ) -> float:
+        """Record the usage of a request.
+
+        Parameters
+        ----------
+        prompt_tokens : int
+            Prompt tokens.
+        completion_tokens : int
+            Completion tokens.
+        latency : float
+            Time to get the whole response in seconds.
+        cached : bool
+            Whether the response was taken from the response cache.
+        ttft : float | None
+            Time to the first chunk of the streamed response in seconds. If None, the response is not streamed and the latency is used.
+        cached_tokens : int
+            Prompt tokens read from the prompt cache of the provider.
+
+        Returns
+        -------
+        float
+            Cost of the request.
+
+        """
+        if self.hedged and self.hedge is not None:
+            cost = self.hedge.add_usage(
+                prompt_tokens,
+                completion_tokens,
+                latency,
+                cached,
+                ttft,
+                cached_tokens,
+            )
+            self.usages[-1]["hedged"] = True
+            return cost
+        cost = (
+            0
+            if cached
+            else self.get_cost(prompt_tokens, completion_tokens, cached_tokens)
+        )
+        ttft = latency if ttft is None else ttft
+        # Completion tokens per second after the first token (or of the whole
+        # request if not streamed).
+        generation = latency - ttft if latency > ttft else latency
+        retries = self.retries - self.recorded_retries
+        self.recorded_retries = self.retries
+        self.usages.append(
+            {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "model": self.model,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cached_tokens": cached_tokens,
+                "cost": cost,
+                "latency": latency,
+                "cached": cached,
+                "base_url": self.base_url,
+                "ttft": ttft,
+                "tps": completion_tokens / generation if generation else 0,
+                "retries": retries,
+            },
+        )
+        return cost
+
+    def completion_params(
         self,
         messages: Messages,
         stream: bool = False,
-    ) -> ChatCompletion | openai.Stream[ChatCompletionChunk]:
-        max_completion_tokens = self.get_max_completion_tokens(messages)
+        prompt_tokens: int | None = None,
+        n: int = 1,
+    ) -> dict[str, Any]:
+        max_completion_tokens = self.get_max_completion_tokens(
+            messages,
+            prompt_tokens,
+        )
 
-        params = {
+        params: dict[str, Any] = {
             "model": self.model,
             "messages": messages,
             "temperature": self.temperature,
@@ -297,19 +628,358 @@ class ChatGPT:
         }
         if max_completion_tokens:
             params["max_completion_tokens"] = max_completion_tokens
-        return self.client.chat.completions.create(**params)  # type: ignore[call-overload]
+        if n > 1:
+            params["n"] = n
+        if self.prompt_cache_key:
+            params["prompt_cache_key"] = self.prompt_cache_key
+        if stream and self.stream_usage:
+            params["stream_options"] = {"include_usage": True}
+        return params
+
+    def get_cached_response(self, params: dict[str, Any]) -> tuple[str, Any]:
+        if self.response_cache is None:
+            return "", None
+        key = self.response_cache.make_key(self.base_url, params)
+        if self.refresh:
+            self.response_cache.misses += 1
+            return key, None
+        return key, self.response_cache.get(key)
+
+    def make_async_client(self) -> openai.AsyncOpenAI:
+        return openai.AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self.key,
+            max_retries=0 if self.rate_limiter is not None else 2,
+        )
 
-    def completion_message(self, messages: Messages) -> ChatCompletion:
-        return cast(ChatCompletion, self.completion(messages, stream=False))
+    def retry_delay(self, attempt: int, error: Exception) -> float | None:
+        """Seconds to wait before retrying the failed request.
+
+        Rate limit errors (except quota errors), connection errors, timeouts,
+        409 and 5xx errors are retried as the OpenAI SDK does.
+
+        Parameters
+        ----------
+        attempt : int
+            The number of retries so far.
+        error : Exception
+            The error of the request.
+
+        Returns
+        -------
+        float | None
+            Seconds to wait, or None if the request must not be retried.
+
+        """
+        if self.rate_limiter is None or attempt >= self.max_retries:
+            return None
+        if isinstance(error, openai.RateLimitError):
+            if error.code == "insufficient_quota":
+                return None
+        elif isinstance(error, openai.APIStatusError):
+            if error.status_code not in [408, 409] and error.status_code < 500:
+                return None
+        elif not isinstance(error, openai.APIConnectionError):
+            return None
+        self.retries += 1
+        headers = (
+            error.response.headers
+            if isinstance(error, openai.APIStatusError)
+            else {}
+        )
+        # Only rate limit errors block the other requests to the model.
+        return self.rate_limiter.backoff(
+            self.limits_key,
+            attempt,
+            headers,
+            block=isinstance(error, openai.RateLimitError),
+        )
+
+    def create(self, params: dict[str, Any], tokens: int = 0) -> Any:
+        """Send a request after the rate limiter admits it.
+
+        Parameters
+        ----------
+        params : dict[str, Any]
+            Parameters of the request.
+        tokens : int
+            Estimated tokens of the request (prompt and maximum completion).
+
+        Returns
+        -------
+        Any
+            The response (or the stream).
+
+        """
+        if self.rate_limiter is None:
+            return self.client.chat.completions.create(**params)
+        for attempt in itertools.count():
+            while (
+                wait := self.rate_limiter.reserve(self.limits_key, tokens)
+            ) > 0:
+                time.sleep(wait)
+            try:
+                raw = self.client.chat.completions.with_raw_response.create(
+                    **params,
+                )
+            except openai.OpenAIError as e:
+                if (delay := self.retry_delay(attempt, e)) is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.rate_limiter.update(self.limits_key, raw.headers)
+            return raw.parse()
+        return None  # pragma: no cover
+
+    async def async_create(
+        self,
+        params: dict[str, Any],
+        tokens: int = 0,
+    ) -> Any:
+        """Send a request by `async_client` after the rate limiter admits it.
+
+        Parameters
+        ----------
+        params : dict[str, Any]
+            Parameters of the request.
+        tokens : int
+            Estimated tokens of the request (prompt and maximum completion).
+
+        Returns
+        -------
+        Any
+            The response.
+
+        """
+        if self.rate_limiter is None:
+            return await self.async_client.chat.completions.create(**params)
+        for attempt in itertools.count():
+            while (
+                wait := self.rate_limiter.reserve(self.limits_key, tokens)
+            ) > 0:
+                await asyncio.sleep(wait)
+            try:
+                completions = self.async_client.chat.completions
+                raw = await completions.with_raw_response.create(**params)
+            except openai.OpenAIError as e:
+                if (delay := self.retry_delay(attempt, e)) is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.rate_limiter.update(self.limits_key, raw.headers)
+            return raw.parse()
+        return None  # pragma: no cover
+
+    def make_hedge(self) -> ChatGPT:
+        params = {x.name: getattr(self, x.name) for x in fields(ChatGPT)}
+        params.update(
+            {
+                "base_url": self.hedge_base_url or self.base_url,
+                "model": self.hedge_model or self.model,
+                "context_window": 0,
+                "token_cache_file": "",
+                "cache": False,
+                "hedge_delay": 0,
+            },
+        )
+        hedge = ChatGPT(**params)
+        # Recorded in the usages of the command.
+        hedge.usages = self.usages
+        return hedge
+
+    def cancel_attempt(
+        self,
+        gpt: ChatGPT,
+        attempt: Prefetch[Any],
+        prompt_tokens: int,
+        stream: bool,
+    ) -> None:
+        """Cancel the request which lost the race and record its usage.
+
+        The prompt and the received part of the reply are billed, as the
+        request was already sent.
+        """
+        attempt.cancel()
+        if attempt.error is not None:
+            return
+        received = list(attempt.received)
+        if stream:
+            completion_tokens = self.count_tokens(
+                "".join(
+                    x.choices[0].delta.content or ""
+                    for x in received
+                    if x.choices
+                ),
+            )
+        else:
+            completion_tokens = sum(
+                x.usage.completion_tokens for x in received if x.usage
+            )
+        self.hedge_cost += gpt.add_usage(
+            prompt_tokens,
+            completion_tokens,
+            attempt.latency,
+            ttft=attempt.ttft,
+        )
+        # Not a complete response for the latency metrics.
+        self.usages[-1]["cancelled"] = True
+
+    def hedged_create(
+        self,
+        params: dict[str, Any],
+        prompt_tokens: int,
+        tokens: int,
+    ) -> Any:
+        """Send a request, and a duplicate one if it does not start in time.
+
+        Parameters
+        ----------
+        params : dict[str, Any]
+            Parameters of the request.
+        prompt_tokens : int
+            Prompt tokens of the request.
+        tokens : int
+            Estimated tokens of the request (prompt and maximum completion).
+
+        Returns
+        -------
+        Any
+            The response (or the stream) which started first.
+
+        """
+        if self.hedge is None:
+            raise ChatGPTPromptWrapperError("Hedging is not enabled.")
+        stream = params["stream"]
+        ready = threading.Event()
+
+        def send(gpt: ChatGPT, params: dict[str, Any]) -> Prefetch[Any]:
+            def request() -> Any:
+                response = gpt.create(params, tokens)
+                return response if stream else [response]
+
+            return Prefetch(request, ready)
+
+        attempts = [(self, send(self, params))]
+        if not ready.wait(self.hedge_delay):
+            self.log.debug(
+                f"No reply in {self.hedge_delay:.2f} s, sending a duplicate request.",
+            )
+            attempts.append(
+                (
+                    self.hedge,
+                    send(self.hedge, {**params, "model": self.hedge.model}),
+                ),
+            )
+        while True:
+            ready.clear()
+            started = [x for x in attempts if x[1].first is not None]
+            if started or all(x[1].done for x in attempts):
+                break
+            ready.wait()
+        # If all requests failed, the error of the first one is raised.
+        gpt, winner = started[0] if started else attempts[0]
+        for loser_gpt, loser in attempts:
+            if loser is not winner:
+                self.cancel_attempt(loser_gpt, loser, prompt_tokens, stream)
+        self.hedged = gpt is self.hedge
+        if stream:
+            return winner
+        return next(iter(winner))
+
+    def completion(
+        self,
+        messages: Messages,
+        stream: bool = False,
+        prompt_tokens: int | None = None,
+    ) -> ChatCompletion | Iterable[ChatCompletionChunk]:
+        # Callers which already know the prompt tokens (e.g. by fit_window)
+        # give them not to count all messages again.
+        if prompt_tokens is None:
+            prompt_tokens = self.count_prompt_tokens(messages)
+        params = self.completion_params(messages, stream, prompt_tokens)
+        key, cached = self.get_cached_response(params)
+        self.from_cache = cached is not None
+        self.hedged = False
+        start = time.monotonic()
+        if cached is not None:
+            if stream:
+                return TimedStream(
+                    [ChatCompletionChunk.model_validate(x) for x in cached],
+                    start,
+                )
+            return ChatCompletion.model_validate(cached)
+
+        tokens = prompt_tokens + params.get("max_completion_tokens", 0)
+        if self.hedge is not None:
+            response = self.hedged_create(params, prompt_tokens, tokens)
+        else:
+            response = self.create(params, tokens)
+        # A reply of the duplicate request may be of another model.
+        cache = self.response_cache if not self.hedged else None
+        if stream:
+            if cache is not None:
+                response = cache.record_stream(key, response)
+            return TimedStream(response, start)
+        if cache is not None:
+            cache.set(key, response.model_dump(mode="json"))
+        return response  # type: ignore[no-any-return]
+
+    def completion_message(
+        self,
+        messages: Messages,
+        prompt_tokens: int | None = None,
+    ) -> ChatCompletion:
+        return cast(
+            ChatCompletion,
+            self.completion(messages, False, prompt_tokens),
+        )
 
     def completion_stream(
         self,
         messages: Messages,
-    ) -> openai.Stream[ChatCompletionChunk]:
+        prompt_tokens: int | None = None,
+    ) -> Iterable[ChatCompletionChunk]:
         return cast(
-            openai.Stream[ChatCompletionChunk],
-            self.completion(messages, stream=True),
+            "Iterable[ChatCompletionChunk]",
+            self.completion(messages, True, prompt_tokens),
+        )
+
+    async def async_completion_message(
+        self,
+        messages: Messages,
+        prompt_tokens: int | None = None,
+        n: int = 1,
+    ) -> tuple[ChatCompletion, bool]:
+        """Get a completion by `async_client`.
+
+        Parameters
+        ----------
+        messages : Messages
+            Messages to send.
+        prompt_tokens : int | None
+            Prompt tokens of the messages if they are already counted.
+        n : int
+            The number of choices to generate.
+
+        Returns
+        -------
+        tuple[ChatCompletion, bool]
+            The response and whether it was taken from the response cache.
+
+        """
+        if prompt_tokens is None:
+            prompt_tokens = self.count_prompt_tokens(messages)
+        params = self.completion_params(messages, False, prompt_tokens, n)
+        key, cached = self.get_cached_response(params)
+        if cached is not None:
+            return ChatCompletion.model_validate(cached), True
+        response = await self.async_create(
+            params,
+            prompt_tokens + params.get("max_completion_tokens", 0) * n,
         )
+        if self.response_cache is not None:
+            self.response_cache.set(key, response.model_dump(mode="json"))
+        return response, False
 
     def run(self, messages: Messages) -> float:
         return 0
@@ -1,11 +1,23 @@
+import asyncio
+import copy
+import itertools
+import json
 import logging
+import sys
+import time
 from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
 
+import openai
 from inherit_docstring import inherit_docstring
+from openai.types.chat import ChatCompletionChunk
 
 from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
 from .chatgpt import Messages
+from .prefetch import Prefetch
 from .stream import Stream
+from .window import MessageWindow
 
 
 @inherit_docstring
@@ -19,6 +31,20 @@ class Discuss(Stream):
         The colors to use for the different roles.
     names: dict[str, str]
         The names to use for the different roles.
+    prefetch: bool
+        Whether to start the next reply in background while waiting for Enter.
+    rounds: int
+        If positive, run discussions without input for this number of rounds
+        (each participant speaks once in a round).
+    themes: str
+        File of themes, one theme per line, to run discussions concurrently
+        in the headless mode. `-` reads from stdin. If empty, run one
+        discussion of the given theme.
+    transcript_dir: str
+        Directory to write the transcript of each discussion in the headless
+        mode.
+    concurrency: int
+        The maximum number of concurrent discussions in the headless mode.
 
     """
 
@@ -34,9 +60,26 @@ class Discuss(Stream):
             "gpt2": "gpt2",
         },
     )
+    prefetch: bool = False
+    rounds: int = 0
+    themes: str = ""
+    transcript_dir: str = "discussions"
+    concurrency: int = 8
 
     def __post_init__(self) -> None:
         super().__post_init__()
+        if self.rounds < 0:
+            raise ChatGPTPromptWrapperError(
+                f"rounds must not be negative: {self.rounds}",
+            )
+        if self.concurrency < 1:
+            raise ChatGPTPromptWrapperError(
+                f"concurrency must be positive: {self.concurrency}",
+            )
+        if self.themes and not self.rounds:
+            raise ChatGPTPromptWrapperError(
+                "themes can be used only with rounds (headless discussions).",
+            )
         for k, v in self.names.items():
             if v not in self.colors and k in self.colors:
                 self.colors[v] = self.colors[k]
@@ -64,7 +107,7 @@ class Discuss(Stream):
     def prepare_messages(
         self,
         messages: Messages,
-    ) -> tuple[Messages, Messages, list[int], list[int]]:
+    ) -> tuple[MessageWindow, MessageWindow]:
         theme = {}
         gpt1 = {
             "role": "system",
@@ -91,108 +134,261 @@ class Discuss(Stream):
                     theme = message
                     theme["role"] = "system"
         if not theme or not gpt1 or not gpt2:
-            self.reset_no_line_break_log()
             raise ChatGPTPromptWrapperError(
                 "The discuss mode must have a theme (or given by a message from the command line), gpt1, and gpt2 roles.",
             )
-        gpt1_messages = [theme, gpt1]
-        gpt2_messages = [theme, gpt2]
+        theme_tokens, gpt1_tokens, gpt2_tokens = self.num_tokens_per_message(
+            [theme, gpt1, gpt2],
+        )
+        gpt1_window = MessageWindow(pinned=2)
+        gpt1_window.extend([theme, gpt1], [theme_tokens, gpt1_tokens])
+        gpt2_window = MessageWindow(pinned=2)
+        gpt2_window.extend([theme, gpt2], [theme_tokens, gpt2_tokens])
 
-        tokens1 = [
-            self.num_tokens_from_message(message) for message in gpt1_messages
-        ]
-        tokens2 = [
-            self.num_tokens_from_message(message) for message in gpt2_messages
-        ]
+        self.check_prompt_tokens(
+            self.num_total_tokens(gpt1_window.total_tokens),
+        )
+        self.check_prompt_tokens(
+            self.num_total_tokens(gpt2_window.total_tokens),
+        )
+
+        return gpt1_window, gpt2_window
+
+    def start_prefetch(
+        self,
+        speaker: MessageWindow,
+    ) -> tuple[int, Prefetch[ChatCompletionChunk]]:
+        prompt_tokens = self.fit_window(speaker)
+        messages = speaker.messages
+        return prompt_tokens, Prefetch(
+            lambda: self.completion_stream(messages, prompt_tokens),
+        )
 
-        prompt_tokens1 = self.num_total_tokens(sum(tokens1))
-        self.check_prompt_tokens(prompt_tokens1)
-        prompt_tokens2 = self.num_total_tokens(sum(tokens2))
-        self.check_prompt_tokens(prompt_tokens2)
+    def turn(
+        self,
+        speaker: MessageWindow,
+        listener: MessageWindow,
+        name: str,
+        max_size: int,
+        prefetched: tuple[int, Prefetch[ChatCompletionChunk]] | None = None,
+    ) -> float:
+        if prefetched is None:
+            prompt_tokens = self.fit_window(speaker)
+            start = time.monotonic()
+            response = self.completion_stream(
+                speaker.messages,
+                prompt_tokens,
+            )
+            new_message = self.show_stream(response, max_size, name=name)
+            latency = time.monotonic() - start
+            ttft = getattr(response, "ttft", None)
+        else:
+            prompt_tokens, prefetch = prefetched
+            new_message = self.show_stream(prefetch, max_size, name=name)
+            latency = prefetch.latency
+            ttft = prefetch.ttft
+        user_message = {
+            "role": "user",
+            "content": new_message["content"],
+        }
+        speaker.append(
+            new_message,
+            self.num_tokens_with_content(new_message, self.content_tokens),
+        )
+        listener.append(
+            user_message,
+            self.num_tokens_with_content(user_message, self.content_tokens),
+        )
+        prompt_tokens, completion_tokens, cached_tokens = self.stream_tokens(
+            prompt_tokens,
+        )
+        return self.add_usage(
+            prompt_tokens,
+            completion_tokens,
+            latency,
+            self.from_cache,
+            ttft,
+            cached_tokens,
+        )
 
-        return gpt1_messages, gpt2_messages, tokens1, tokens2
+    def cancel_prefetch(
+        self,
+        prefetched: tuple[int, Prefetch[ChatCompletionChunk]],
+    ) -> float:
+        """Cancel the prefetched reply and record its usage.
 
-    def run_main(self, messages: Messages) -> tuple[int, float]:
-        gpt1_messages, gpt2_messages, tokens1, tokens2 = self.prepare_messages(
-            messages,
+        The request was already sent, so the prompt and the received part
+        of the reply are billed even if the reply is not shown.
+        """
+        prompt_tokens, prefetch = prefetched
+        prefetch.cancel()
+        content = "".join(
+            chunk.choices[0].delta.content or ""
+            for chunk in list(prefetch.received)
+            if chunk.choices
+        )
+        cost = self.add_usage(
+            prompt_tokens,
+            self.count_tokens(content),
+            prefetch.latency,
+            self.from_cache,
+            prefetch.ttft,
         )
+        # Not a complete response for the latency metrics.
+        self.usages[-1]["cancelled"] = True
+        return cost
+
+    def run_main(self, messages: Messages) -> tuple[int, float]:
+        gpt1_window, gpt2_window = self.prepare_messages(messages)
+        gpt1_window.summarizer = self.make_summarizer()
+        gpt2_window.summarizer = self.make_summarizer()
         max_size = max(10, *[len(x) for x in self.names])
         self.log.info(f"Theme: {messages[0]['content']}\n")
 
+        speakers = [
+            (gpt1_window, gpt2_window, self.names.get("gpt1", "gpt1")),
+            (gpt2_window, gpt1_window, self.names.get("gpt2", "gpt2")),
+        ]
         cost = 0.0
+        prefetched = None
         try:
-            while True:
+            for speaker, listener, name in itertools.cycle(speakers):
+                # The next reply is requested while the user reads the
+                # previous one, and shown only when the user proceeds.
+                if self.prefetch:
+                    prefetched = self.start_prefetch(speaker)
                 _ = input()
-
-                while (
-                    prompt_tokens := self.num_total_tokens(sum(tokens1))
-                ) > self.context_window - self.min_output_tokens:
-                    gpt1_messages = gpt1_messages[:2] + gpt1_messages[3:]
-                    tokens1 = tokens1[:2] + tokens1[3:]
-                if self.model in self.prices:
-                    cost += self.prices[self.model][0] * prompt_tokens / 1000.0
-                response = self.completion_stream(gpt1_messages)
-
-                new_message = self.show_stream(
-                    response,
-                    max_size,
-                    name=self.names.get("gpt1", "gpt1"),
+                cost += self.turn(
+                    speaker, listener, name, max_size, prefetched
                 )
-                gpt1_messages.append(new_message)
-                tokens = self.num_tokens_from_message(new_message)
-                tokens1.append(tokens)
-                user_message = {
-                    "role": "user",
-                    "content": new_message["content"],
-                }
-                gpt2_messages.append(user_message)
-                tokens = self.num_tokens_from_message(user_message)
-                tokens2.append(tokens)
-
-                if self.model in self.prices:
-                    cost += (
-                        self.prices[self.model][1]
-                        * self.num_tokens_from_message(
-                            new_message,
-                            only_content=True,
-                        )
-                        / 1000.0
-                    )
-
-                _ = input()
-                while (
-                    prompt_tokens := self.num_total_tokens(sum(tokens2))
-                ) > self.context_window - self.min_output_tokens:
-                    gpt2_messages = gpt2_messages[:2] + gpt2_messages[3:]
-                    tokens2 = tokens2[:2] + tokens2[3:]
-                if self.model in self.prices:
-                    cost += self.prices[self.model][0] * prompt_tokens / 1000.0
-                response = self.completion_stream(gpt2_messages)
-                new_message = self.show_stream(
-                    response,
-                    max_size,
-                    name=self.names.get("gpt2", "gpt2"),
-                )
-                gpt2_messages.append(new_message)
-                tokens = self.num_tokens_from_message(new_message)
-                tokens2.append(tokens)
-                user_message = {
-                    "role": "user",
-                    "content": new_message["content"],
-                }
-                gpt1_messages.append(user_message)
-                tokens = self.num_tokens_from_message(user_message)
-                tokens1.append(tokens)
-
-                if self.model in self.prices:
-                    cost += (
-                        self.prices[self.model][1]
-                        * self.num_tokens_from_message(
-                            new_message,
-                            only_content=True,
-                        )
-                        / 1000.0
-                    )
+                prefetched = None
         except KeyboardInterrupt:
+            if prefetched is not None:
+                cost += self.cancel_prefetch(prefetched)
             self.log.info("\n")
+        finally:
+            for window in [gpt1_window, gpt2_window]:
+                if window.summarizer is not None:
+                    cost += window.summarizer.close()
         return max_size, cost
+
+    def read_themes(self) -> list[str]:
+        if not self.themes:
+            return [""]
+        try:
+            if self.themes == "-":
+                lines = sys.stdin.readlines()
+            else:
+                with open(self.themes) as f:
+                    lines = f.readlines()
+        except OSError as e:
+            raise ChatGPTPromptWrapperError(str(e)) from e
+        return [x.strip() for x in lines if x.strip()]
+
+    async def discuss(
+        self,
+        index: int,
+        messages: Messages,
+        slots: asyncio.Semaphore,
+    ) -> float:
+        async with slots:
+            cost = 0.0
+            transcript: dict[str, Any] = {"theme": "", "messages": []}
+            try:
+                gpt1_window, gpt2_window = self.prepare_messages(messages)
+                transcript["theme"] = gpt1_window.messages[0]["content"]
+                speakers = [
+                    (gpt1_window, gpt2_window, self.names.get("gpt1", "gpt1")),
+                    (gpt2_window, gpt1_window, self.names.get("gpt2", "gpt2")),
+                ]
+                for _ in range(self.rounds):
+                    for speaker, listener, name in speakers:
+                        prompt_tokens = self.fit_window(speaker)
+                        start = time.monotonic()
+                        (
+                            response,
+                            cached,
+                        ) = await self.async_completion_message(
+                            speaker.messages,
+                            prompt_tokens,
+                        )
+                        latency = time.monotonic() - start
+                        content = response.choices[0].message.content or ""
+                        new_message = {"role": "assistant", "content": content}
+                        user_message = {"role": "user", "content": content}
+                        cached_tokens = 0
+                        if response.usage:
+                            prompt_tokens = response.usage.prompt_tokens
+                            completion_tokens = (
+                                response.usage.completion_tokens
+                            )
+                            cached_tokens = self.get_cached_tokens(
+                                response.usage,
+                            )
+                            content_tokens = self.get_content_tokens(
+                                response.usage,
+                            )
+                        else:
+                            completion_tokens = self.count_tokens(content)
+                            content_tokens = completion_tokens
+                        speaker.append(
+                            new_message,
+                            self.num_tokens_with_content(
+                                new_message,
+                                content_tokens,
+                            ),
+                        )
+                        listener.append(
+                            user_message,
+                            self.num_tokens_with_content(
+                                user_message,
+                                content_tokens,
+                            ),
+                        )
+                        cost += self.add_usage(
+                            prompt_tokens,
+                            completion_tokens,
+                            latency,
+                            cached,
+                            cached_tokens=cached_tokens,
+                        )
+                        transcript["messages"].append(
+                            {"name": name, "content": content},
+                        )
+            except (ChatGPTPromptWrapperError, openai.OpenAIError) as e:
+                transcript["error"] = str(e)
+                self.log.error(f"Discussion {index}: {e}")
+            transcript["cost"] = cost
+            path = Path(self.transcript_dir) / f"discussion-{index:04d}.json"
+            with open(path, "w") as f:
+                json.dump(transcript, f, ensure_ascii=False, indent=2)
+                f.write("\n")
+            return cost
+
+    async def run_headless(self, messages: Messages) -> float:
+        themes = self.read_themes()
+        try:
+            Path(self.transcript_dir).mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            raise ChatGPTPromptWrapperError(str(e)) from e
+        self.async_client = self.make_async_client()
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        for index, theme in enumerate(themes):
+            theme_messages = copy.deepcopy(messages)
+            if theme:
+                theme_messages.append({"role": "user", "content": theme})
+            tasks.append(self.discuss(index, theme_messages, slots))
+        try:
+            costs = await asyncio.gather(*tasks)
+        finally:
+            await self.async_client.close()
+        self.log.info(
+            f"Wrote {len(themes)} discussions to {self.transcript_dir}.",
+        )
+        return sum(costs)
+
+    def run(self, messages: Messages) -> float:
+        if self.rounds:
+            return asyncio.run(self.run_headless(messages))
+        return super().run(messages)
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+
+import tiktoken
+
+# File layout:
+#   MAGIC
+#   header size (uint32, little endian)
+#   JSON header: name, pat_str, special_tokens, n_ranks
+#   ranks (uint32 x n_ranks)
+#   offsets (uint32 x (n_ranks + 1)) of each token in the blob
+#   blob of token bytes, sorted by rank
+MAGIC = b"CGENC1\n"
+SUFFIX = ".cgenc"
+
+encodings: dict[str, tiktoken.Encoding] = {}
+
+
+def encoding_file(encoding_dir: Path, name: str) -> Path:
+    return encoding_dir / f"{name}{SUFFIX}"
+
+
+def save_encoding(encoding: tiktoken.Encoding, encoding_dir: Path) -> Path:
+    """Write the pre-parsed encoding to the store.
+
+    Parameters
+    ----------
+    encoding : tiktoken.Encoding
+        The encoding to store.
+    encoding_dir : Path
+        The directory of the store.
+
+    Returns
+    -------
+    Path
+        The stored file.
+
+    """
+    items = sorted(
+        encoding._mergeable_ranks.items(),
+        key=lambda x: x[1],
+    )
+    header = json.dumps(
+        {
+            "name": encoding.name,
+            "pat_str": encoding._pat_str,
+            "special_tokens": encoding._special_tokens,
+            "n_ranks": len(items),
+        },
+    ).encode()
+    ranks = array("I", [rank for _, rank in items])
+    offsets = array("I", [0])
+    for token, _ in items:
+        offsets.append(offsets[-1] + len(token))
+    if sys.byteorder == "big":  # pragma: no cover
+        ranks.byteswap()
+        offsets.byteswap()
+
+    encoding_dir.mkdir(parents=True, exist_ok=True)
+    path = encoding_file(encoding_dir, encoding.name)
+    fd, tmp = tempfile.mkstemp(dir=encoding_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(ranks.tobytes())
+        f.write(offsets.tobytes())
+        for token, _ in items:
+            f.write(token)
+    os.replace(tmp, path)
+    return path
+
+
+def load_encoding(encoding_dir: Path, name: str) -> tiktoken.Encoding | None:
+    """Load the encoding from the store by mapping the file.
+
+    Parameters
+    ----------
+    encoding_dir : Path
+        The directory of the store.
+    name : str
+        The encoding name.
+
+    Returns
+    -------
+    tiktoken.Encoding | None
+        The encoding, or None if it is not in the store or broken.
+
+    """
+    path = encoding_file(encoding_dir, name)
+    if not path.is_file():
+        return None
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with mm:
+            return parse_encoding(mm)
+    except (
+        OSError,
+        ValueError,
+        TypeError,
+        struct.error,
+        KeyError,
+        IndexError,
+    ):
+        # Empty, truncated or corrupt file. json.JSONDecodeError is also a
+        # ValueError.
+        return None
+
+
+def parse_encoding(mm: mmap.mmap) -> tiktoken.Encoding | None:
+    size = len(mm)
+    pos = len(MAGIC)
+    if mm[:pos] != MAGIC:
+        return None
+    (header_size,) = struct.unpack_from("<I", mm, pos)
+    pos += 4
+    if pos + header_size > size:
+        return None
+    header = json.loads(mm[pos : pos + header_size])
+    pos += header_size
+    n_ranks = header["n_ranks"]
+    if pos + 8 * n_ranks + 4 > size:
+        return None
+    ranks = array("I")
+    ranks.frombytes(mm[pos : pos + 4 * n_ranks])
+    pos += 4 * n_ranks
+    offsets = array("I")
+    offsets.frombytes(mm[pos : pos + 4 * (n_ranks + 1)])
+    pos += 4 * (n_ranks + 1)
+    if sys.byteorder == "big":  # pragma: no cover
+        ranks.byteswap()
+        offsets.byteswap()
+    if pos + offsets[-1] != size:
+        return None
+    mergeable_ranks = {
+        mm[pos + offsets[i] : pos + offsets[i + 1]]: ranks[i]
+        for i in range(n_ranks)
+    }
+    return tiktoken.Encoding(
+        header["name"],
+        pat_str=header["pat_str"],
+        mergeable_ranks=mergeable_ranks,
+        special_tokens=header["special_tokens"],
+    )
+
+
+def get_encoding(
+    name: str, encoding_dir: Path | None = None
+) -> tiktoken.Encoding:
+    """Get the encoding from the store if available, otherwise from tiktoken.
+
+    Parameters
+    ----------
+    name : str
+        The encoding name.
+    encoding_dir : Path | None
+        The directory of the store.
+
+    Returns
+    -------
+    tiktoken.Encoding
+        The encoding.
+
+    """
+    if name in encodings:
+        return encodings[name]
+    encoding = None
+    if encoding_dir is not None:
+        encoding = load_encoding(encoding_dir, name)
+    if encoding is None:
+        encoding = tiktoken.get_encoding(name)
+    encodings[name] = encoding
+    return encoding
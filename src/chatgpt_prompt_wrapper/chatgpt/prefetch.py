@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Generic, TypeVar
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Iterator
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class Prefetch(Generic[T]):
+    """Run a request in a background thread and buffer its stream.
+
+    The items are kept in a queue until they are iterated, so that a reply
+    can be generated while the previous one is read.
+
+    Parameters
+    ----------
+    request : Callable[[], Iterable[T]]
+        Function which sends the request and returns the stream.
+    ready : threading.Event | None
+        Event to set when the first item is received or the request ends.
+
+    """
+
+    def __init__(
+        self,
+        request: Callable[[], Iterable[T]],
+        ready: threading.Event | None = None,
+    ) -> None:
+        self.request = request
+        self.ready = ready
+        self.buffer: queue.Queue[object] = queue.Queue()
+        self.cancelled = threading.Event()
+        self.error: Exception | None = None
+        self.done = False
+        # All received items, including the ones already iterated.
+        self.received: list[T] = []
+        self.started = time.monotonic()
+        self.finished = self.started
+        self.first: float | None = None
+        self.thread = threading.Thread(target=self.consume, daemon=True)
+        self.thread.start()
+
+    def consume(self) -> None:
+        try:
+            response = self.request()
+            for item in response:
+                if self.cancelled.is_set():
+                    break
+                self.received.append(item)
+                self.buffer.put(item)
+                if self.first is None:
+                    self.first = time.monotonic()
+                    if self.ready is not None:
+                        self.ready.set()
+            if self.cancelled.is_set() and hasattr(response, "close"):
+                response.close()
+        except Exception as e:  # noqa: BLE001
+            self.error = e
+        finally:
+            self.finished = time.monotonic()
+            self.buffer.put(_DONE)
+            self.done = True
+            if self.ready is not None:
+                self.ready.set()
+
+    @property
+    def latency(self) -> float:
+        if self.thread.is_alive():
+            return time.monotonic() - self.started
+        return self.finished - self.started
+
+    @property
+    def ttft(self) -> float | None:
+        """Time to the first item, or None if nothing has been received."""
+        if self.first is None:
+            return None
+        return self.first - self.started
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def close(self) -> None:
+        self.cancel()
+
+    def __iter__(self) -> Iterator[T]:
+        while (item := self.buffer.get()) is not _DONE:
+            yield item  # type: ignore[misc]
+        if self.error is not None:
+            raise self.error
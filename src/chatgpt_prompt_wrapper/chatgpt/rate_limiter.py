@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Mapping
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+KINDS = ["requests", "tokens"]
+
+DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+# Host which reports the limits by the headers.
+OPENAI_HOST = "api.openai.com"
+
+
+def limits_key(base_url: str, key: str, model: str) -> str:
+    """Key of the limits of the model for the endpoint and the API key.
+
+    The limits are per account, so the endpoint and the API key are hashed
+    not to share them between accounts (and not to store the API key).
+    """
+    account = hashlib.sha256(f"{base_url}\n{key}".encode()).hexdigest()
+    return f"{account[:16]}/{model}"
+
+
+def parse_duration(value: str) -> float:
+    """Parse durations of `x-ratelimit-reset-*` headers like `6m0s`."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    return sum(
+        float(number) * UNITS[unit] for number, unit in DURATION.findall(value)
+    )
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float | None:
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "retry-after" not in headers:
+        return None
+    value = headers["retry-after"]
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RateLimiter:
+    """Scheduler of requests by the rate limits reported by the API.
+
+    The limits of requests and tokens per minute are taken from the
+    `x-ratelimit-*` headers of responses for each key (see `limits_key`).
+    A request is admitted only when the remaining requests and tokens are
+    enough, and it reserves them until the next response updates the
+    limits. After a rate limit error, all requests with the key wait for
+    the jittered backoff (at least `retry-after`). The state is stored in
+    `state_file` under a lock file to be shared by threads and processes.
+
+    Parameters
+    ----------
+    state_file : Path | None
+        JSON file of the state. If None, the state is kept in memory.
+    backoff_base : float
+        Initial backoff in seconds, doubled at each retry.
+    backoff_max : float
+        The maximum backoff in seconds.
+
+    """
+
+    state_file: Path | None = None
+    backoff_base: float = 1
+    backoff_max: float = 60
+
+    def __post_init__(self) -> None:
+        self.thread_lock = threading.Lock()
+        self.memory: dict[str, Any] = {}
+
+    @contextmanager
+    def state(self) -> Iterator[dict[str, Any]]:
+        with self.thread_lock:
+            if self.state_file is None:
+                yield self.memory
+                return
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            lock_file = self.state_file.with_suffix(".lock")
+            with open(lock_file, "a") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    try:
+                        text = self.state_file.read_text()
+                        state = json.loads(text)
+                    except (OSError, ValueError):
+                        text, state = "", {}
+                    yield state
+                    new = json.dumps(state)
+                    if new == text:
+                        return
+                    fd, tmp = tempfile.mkstemp(
+                        dir=self.state_file.parent,
+                        suffix=".tmp",
+                    )
+                    with os.fdopen(fd, "w") as f:
+                        f.write(new)
+                    os.replace(tmp, self.state_file)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def reserve(self, key: str, tokens: int) -> float:
+        """Reserve a request if possible.
+
+        Parameters
+        ----------
+        key : str
+            Key of the limits of the request (see `limits_key`).
+        tokens : int
+            Estimated tokens of the request (prompt and maximum completion).
+
+        Returns
+        -------
+        float
+            0 if the request is reserved, otherwise seconds to wait before
+            trying again.
+
+        """
+        now = time.time()
+        with self.state() as state:
+            limits = state.setdefault(key, {})
+            wait = limits.get("blocked_until", 0) - now
+            need = {"requests": 1, "tokens": tokens}
+            for kind in KINDS:
+                if kind not in limits:
+                    continue
+                limit = limits[kind]
+                if now >= limit["reset_at"]:
+                    limit["remaining"] = limit["limit"]
+                # A request larger than the limit is sent when nothing else
+                # uses the limit, and the API decides.
+                if limit["remaining"] < min(need[kind], limit["limit"]):
+                    wait = max(wait, limit["reset_at"] - now)
+            if wait > 0:
+                return wait
+            for kind in KINDS:
+                if kind in limits:
+                    limits[kind]["remaining"] -= need[kind]
+        return 0
+
+    def update(self, key: str, headers: Mapping[str, str]) -> None:
+        """Update the limits by the headers of a response.
+
+        Parameters
+        ----------
+        key : str
+            Key of the limits of the request (see `limits_key`).
+        headers : Mapping[str, str]
+            Headers of the response.
+
+        """
+        now = time.time()
+        new = {}
+        for kind in KINDS:
+            try:
+                new[kind] = {
+                    "limit": int(headers[f"x-ratelimit-limit-{kind}"]),
+                    "remaining": int(headers[f"x-ratelimit-remaining-{kind}"]),
+                    "reset_at": now
+                    + parse_duration(headers[f"x-ratelimit-reset-{kind}"]),
+                }
+            except (KeyError, ValueError):
+                continue
+        if not new:
+            return
+        with self.state() as state:
+            state.setdefault(key, {}).update(new)
+
+    def backoff(
+        self,
+        key: str,
+        attempt: int,
+        headers: Mapping[str, str],
+        block: bool = True,
+    ) -> float:
+        """Compute the backoff after an error.
+
+        Parameters
+        ----------
+        key : str
+            Key of the limits of the request (see `limits_key`).
+        attempt : int
+            The number of retries so far.
+        headers : Mapping[str, str]
+            Headers of the error response.
+        block : bool
+            Whether to block all requests with the key (for rate limit
+            errors) until the backoff ends.
+
+        Returns
+        -------
+        float
+            Seconds to wait before retrying.
+
+        """
+        delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+        # Jitter not to retry at the same time as other clients.
+        delay = random.uniform(delay / 2, delay)  # noqa: S311
+        retry_after = parse_retry_after(headers)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        self.update(key, headers)
+        if not block:
+            return delay
+        with self.state() as state:
+            limits = state.setdefault(key, {})
+            limits["blocked_until"] = max(
+                limits.get("blocked_until", 0),
+                time.time() + delay,
+            )
+        return delay
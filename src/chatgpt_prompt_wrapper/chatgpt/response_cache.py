@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+    from openai.types.chat import ChatCompletionChunk
+
+
+@dataclass
+class ResponseCache:
+    """On-disk cache of API responses keyed by the request parameters.
+
+    Each response is stored as a JSON file named by the hash of the request.
+    The least recently used entries are removed when the number of entries
+    exceeds `max_size`, and entries older than `ttl` seconds are ignored.
+
+    Parameters
+    ----------
+    directory : Path
+        Directory to store responses.
+    max_size : int
+        The maximum number of responses.
+    ttl : float
+        Time to live of responses in seconds. 0 means no expiration.
+
+    """
+
+    directory: Path
+    max_size: int = 1000
+    ttl: float = 0
+
+    def __post_init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(base_url: str, params: dict[str, Any]) -> str:
+        data = json.dumps(
+            {"base_url": base_url, "params": params},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Any:
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if self.ttl and time.time() - data["created"] > self.ttl:
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+        # Update mtime to evict the least recently used entries first.
+        os.utime(path)
+        self.hits += 1
+        return data["response"]
+
+    def set(self, key: str, response: Any) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"created": time.time(), "response": response}, f)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        entries = list(self.directory.glob("*.json"))
+        if len(entries) <= self.max_size:
+            return
+        entries.sort(key=lambda x: x.stat().st_mtime)
+        for path in entries[: len(entries) - self.max_size]:
+            path.unlink(missing_ok=True)
+
+    def record_stream(
+        self,
+        key: str,
+        response: Iterable[ChatCompletionChunk],
+    ) -> Iterator[ChatCompletionChunk]:
+        """Yield chunks and store them when the stream is completed.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+        response : Iterable[ChatCompletionChunk]
+            The stream from the API.
+
+        Yields
+        ------
+        ChatCompletionChunk
+            Chunks of the stream.
+
+        """
+        chunks = []
+        for chunk in response:
+            chunks.append(chunk.model_dump(mode="json"))
+            yield chunk
+        self.set(key, chunks)
+
+    def report(self) -> str:
+        return f"Response cache: {self.hits} hits, {self.misses} misses"
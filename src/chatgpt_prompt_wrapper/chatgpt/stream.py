@@ -1,22 +1,106 @@
 from __future__ import annotations
 
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from typing import TYPE_CHECKING
 
 from inherit_docstring import inherit_docstring
 
+from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
 from .chatgpt import ChatGPT, Messages
+from .stream_writer import StreamWriter
+from .summarizer import Summarizer
 
 if TYPE_CHECKING:
-    from openai import Stream as OpenAIStream
+    from collections.abc import Iterable
+
+    from openai.types import CompletionUsage
     from openai.types.chat import ChatCompletionChunk
 
+    from .window import MessageWindow
+
 
 @inherit_docstring
 @dataclass
 class Stream(ChatGPT):
-    """Stream chat class with ChatGPT."""
+    """Stream chat class with ChatGPT.
+
+    Parameters
+    ----------
+    frame_rate: float
+        The maximum number of flushes of the streamed reply per second. 0 flushes every chunk.
+    prompt_budget: int
+        The target of prompt tokens of the history. Old messages are dropped (or summarized) when the history exceeds it. 0 uses context_window - min_output_tokens.
+    summary_model: str
+        The model to summarize dropped messages in background. If empty, dropped messages are not summarized.
+    summary_tokens: int
+        The maximum output tokens of the summary.
+    compact_ratio: float
+        The ratio of prompt_budget to leave when old messages are dropped. 1 drops only the messages needed to fit. A smaller ratio (e.g. 0.5) drops (and summarizes) them in batches instead of every turn, so that the prefix of the history stays the same for the prompt cache of the provider.
+
+    """
+
+    frame_rate: float = 30
+    prompt_budget: int = 0
+    summary_model: str = ""
+    summary_tokens: int = 500
+    compact_ratio: float = 1
+
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        if self.prompt_budget < 0:
+            raise ChatGPTPromptWrapperError(
+                f"prompt_budget must not be negative: {self.prompt_budget}",
+            )
+        if not 0 < self.compact_ratio <= 1:
+            raise ChatGPTPromptWrapperError(
+                f"compact_ratio must be in (0, 1]: {self.compact_ratio}",
+            )
+        # Usage and content tokens of the last streamed reply.
+        self.last_usage: CompletionUsage | None = None
+        self.content_tokens = 0
+
+    def make_summarizer(self) -> Summarizer | None:
+        if not self.summary_model:
+            return None
+        params = {x.name: getattr(self, x.name) for x in fields(ChatGPT)}
+        params.update(
+            {
+                "model": self.summary_model,
+                "context_window": 0,
+                "max_output_tokens": self.summary_tokens,
+                "token_cache_file": "",
+                "hedge_delay": 0,
+            },
+        )
+        gpt = ChatGPT(**params)
+        # Recorded in the usages of the command.
+        gpt.usages = self.usages
+        return Summarizer(gpt)
+
+    def fit_window(self, window: MessageWindow) -> int:
+        """Trim the window to prompt_budget and the context window.
+
+        When the window exceeds the limit, it is trimmed to prompt_budget *
+        compact_ratio, except the latest message. With compact_ratio < 1,
+        messages are dropped in batches, so that the prefix of the prompt
+        changes only at the trims. With a summarizer, the dropped messages
+        are folded into the summary.
+        """
+        limit = (
+            self.context_window
+            - self.min_output_tokens
+            - self.num_total_tokens(0)
+        )
+        if self.prompt_budget:
+            limit = min(limit, self.prompt_budget)
+        if window.summarizer is not None:
+            window.summarizer.update(window, self.num_tokens_from_message)
+        if window.total_tokens > limit:
+            dropped = window.trim(int(limit * self.compact_ratio), keep=1)
+            if window.summarizer is not None:
+                window.summarizer.fold(dropped)
+        return super().fit_window(window)
 
     def set_no_line_break_log(self) -> None:
         self.default_terminators = [
@@ -38,49 +122,111 @@ class Stream(ChatGPT):
             handler.terminator = default_terminator
         del self.default_terminators
 
+    def warn_finish_reason(
+        self,
+        finish_reason: str | None,
+        writer: StreamWriter,
+    ) -> None:
+        if finish_reason == "length":
+            writer.flush()
+            self.log.warning(
+                "The reply was truncated due to the tokens limit.\n",
+            )
+        elif finish_reason == "content_filter":
+            writer.flush()
+            self.log.warning(
+                "The reply was omitted due to the content filters.\n",
+            )
+
     def show_stream(
         self,
-        response: OpenAIStream[ChatCompletionChunk],
+        response: Iterable[ChatCompletionChunk],
         max_size: int,
         name: str = "",
     ) -> dict[str, str]:
+        """Show the streamed reply and return it as a message.
+
+        The usage sent at the end of the stream is kept in `last_usage`,
+        and the tokens of the content in `content_tokens`. Without
+        stream_usage, the tokens are counted for each chunk as it arrives.
+        If the usage was requested but not sent, the whole content is
+        counted after the stream.
+        """
         message = {"role": "", "content": ""}
         if name:
             message["name"] = name
+        contents = []
+        self.last_usage = None
+        self.content_tokens = 0
+        writer = StreamWriter(self.frame_rate)
         for chunk in response:
+            if usage := getattr(chunk, "usage", None):
+                self.last_usage = usage
+            if not chunk.choices:
+                continue
             delta = chunk.choices[0].delta
             if delta.role:
                 message["role"] = delta.role
-                self.log.info(self.get_output(message, max_size))
+                writer.write(self.get_output(message, max_size))
             if delta.content:
-                self.log.info(delta.content)
-                message["content"] += delta.content
-            finish_reason = chunk.choices[0].finish_reason
-            if finish_reason == "length":
-                self.log.warning(
-                    "The reply was truncated due to the tokens limit.\n",
-                )
-            elif finish_reason == "content_filter":
-                self.log.warning(
-                    "The reply was omitted due to the content filters.\n",
-                )
+                writer.write(delta.content)
+                contents.append(delta.content)
+                if not self.stream_usage and self.encoding is not None:
+                    self.content_tokens += len(
+                        self.encoding.encode_ordinary(delta.content),
+                    )
+            self.warn_finish_reason(chunk.choices[0].finish_reason, writer)
+        writer.write("\n")
+        writer.flush()
+        message["content"] = "".join(contents)
+        self.finish_content_tokens(message["content"])
 
         # Remove the name from the message, as it fails if it does not match '^[a-zA-Z0-9_-]{1,64}$'.
         if "name" in message:
             del message["name"]
-        self.log.info("\n")
         return message
 
+    def finish_content_tokens(self, content: str) -> None:
+        if self.last_usage is not None:
+            self.content_tokens = self.get_content_tokens(self.last_usage)
+        elif self.stream_usage:
+            # The server did not send the usage.
+            self.content_tokens = self.count_tokens(content)
+
+    def stream_tokens(self, prompt_tokens: int) -> tuple[int, int, int]:
+        """Prompt, completion and cached tokens of the last streamed reply.
+
+        Parameters
+        ----------
+        prompt_tokens : int
+            Prompt tokens counted locally, used if the server did not send
+            the usage.
+
+        Returns
+        -------
+        tuple[int, int, int]
+            Prompt, completion and cached prompt tokens.
+
+        """
+        if self.last_usage is None:
+            return prompt_tokens, self.content_tokens, 0
+        return (
+            self.last_usage.prompt_tokens,
+            self.last_usage.completion_tokens,
+            self.get_cached_tokens(self.last_usage),
+        )
+
     def run_main(self, messages: Messages) -> tuple[int, float]:
         return (0, 0)
 
     def run(self, messages: Messages) -> float:
         self.finish_chat = False
         self.set_no_line_break_log()
-
-        max_size, cost = self.run_main(messages)
-
-        self.reset_no_line_break_log()
+        try:
+            max_size, cost = self.run_main(messages)
+        finally:
+            self.reset_no_line_break_log()
+        cost += self.hedge_cost
         message = {"role": "assistant", "content": "Bye!"}
         self.log.info(self.get_output(message, max_size))
         return cost
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import IO
+
+
+@dataclass
+class StreamWriter:
+    """Buffered writer for streamed replies.
+
+    Chunks are written to the buffer and flushed at most `frame_rate` times
+    per second, instead of a write and a flush (a log record) per chunk.
+    Buffered text is flushed by a timer when no chunk comes within the
+    interval.
+
+    Parameters
+    ----------
+    frame_rate : float
+        The maximum number of flushes per second. 0 flushes every chunk.
+    stream : IO[str]
+        The output stream.
+
+    """
+
+    frame_rate: float = 30
+    stream: IO[str] = field(default_factory=lambda: sys.stdout)
+
+    def __post_init__(self) -> None:
+        self.buffer: list[str] = []
+        self.interval = 1 / self.frame_rate if self.frame_rate > 0 else 0
+        # Show the first chunk immediately.
+        self.last_flush = float("-inf")
+        self.lock = threading.Lock()
+        self.timer: threading.Timer | None = None
+
+    def write(self, text: str) -> None:
+        with self.lock:
+            self.buffer.append(text)
+            wait = self.last_flush + self.interval - time.monotonic()
+            if wait <= 0:
+                self.flush_locked()
+            elif self.timer is None:
+                # Show the buffered text even if the stream stalls before
+                # the next chunk.
+                self.timer = threading.Timer(wait, self.flush_pending)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush_pending(self) -> None:
+        with self.lock:
+            self.timer = None
+            self.flush_locked()
+
+    def flush_locked(self) -> None:
+        if self.buffer:
+            self.stream.write("".join(self.buffer))
+            self.buffer.clear()
+        self.stream.flush()
+        self.last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.flush_locked()
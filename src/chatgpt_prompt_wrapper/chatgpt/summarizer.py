@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import openai
+
+from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from .chatgpt import ChatGPT, Message, Messages
+    from .window import MessageWindow
+
+INSTRUCTION = (
+    "Summarize the conversation for the participant who continues it. "
+    "Update the previous summary with the new messages. Keep facts, "
+    "decisions, names, numbers and open questions, and drop small talk. "
+    "Answer only the summary."
+)
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+
+
+class Summarizer:
+    """Fold messages dropped from a window into a rolling summary.
+
+    The dropped messages are summarized together with the previous summary
+    by `gpt` (usually a cheaper model) in a background thread, and the new
+    summary is put into the window at the next `update`, so that the
+    summary is made while the user reads the reply or types the next
+    message. If a request fails, its messages are kept and folded with the
+    next ones.
+
+    Parameters
+    ----------
+    gpt : ChatGPT
+        Client to make summaries.
+
+    """
+
+    def __init__(self, gpt: ChatGPT) -> None:
+        self.gpt = gpt
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.text = ""
+        # Number of summaries made and the one in the window.
+        self.version = 0
+        self.installed = 0
+        # Messages which failed to be summarized.
+        self.backlog: Messages = []
+        self.cost = 0.0
+
+    def fold(self, dropped: list[tuple[Message, int]]) -> None:
+        if dropped:
+            self.executor.submit(self.summarize, [m for m, _ in dropped])
+
+    def make_request(self, messages: Messages) -> Messages:
+        transcript = "\n\n".join(
+            f"{m.get('name', m['role'])}: {m['content']}" for m in messages
+        )
+        content = f"New messages:\n{transcript}"
+        if self.text:
+            content = f"Previous summary:\n{self.text}\n\n{content}"
+        return [
+            {"role": "system", "content": INSTRUCTION},
+            {"role": "user", "content": content},
+        ]
+
+    def summarize(self, messages: Messages) -> None:
+        messages = self.backlog + messages
+        request = self.make_request(messages)
+        start = time.monotonic()
+        try:
+            response = self.gpt.completion_message(request)
+        except (ChatGPTPromptWrapperError, openai.OpenAIError) as e:
+            self.backlog = messages
+            self.gpt.log.warning(f"Failed to summarize messages: {e}\n")
+            return
+        latency = time.monotonic() - start
+        self.backlog = []
+        cached_tokens = 0
+        if response.usage:
+            prompt_tokens = response.usage.prompt_tokens
+            completion_tokens = response.usage.completion_tokens
+            cached_tokens = self.gpt.get_cached_tokens(response.usage)
+        else:
+            prompt_tokens = self.gpt.count_prompt_tokens(request)
+            completion_tokens = 0
+        cost = self.gpt.add_usage(
+            prompt_tokens,
+            completion_tokens,
+            latency,
+            self.gpt.from_cache,
+            cached_tokens=cached_tokens,
+        )
+        with self.lock:
+            self.text = response.choices[0].message.content or ""
+            self.version += 1
+            self.cost += cost
+
+    def update(
+        self,
+        window: MessageWindow,
+        count: Callable[[Message], int],
+    ) -> None:
+        """Put the latest summary into the window if it is new.
+
+        Parameters
+        ----------
+        window : MessageWindow
+            The window to update.
+        count : Callable[[Message], int]
+            Function to count tokens of the summary message.
+
+        """
+        with self.lock:
+            if self.version == self.installed:
+                return
+            text, self.installed = self.text, self.version
+        message = {"role": "system", "content": SUMMARY_HEADER + text}
+        window.set_summary(message, count(message))
+
+    def close(self) -> float:
+        """Wait for the summary in progress and return the total cost."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        return self.cost
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, Generic, TypeVar
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+T = TypeVar("T")
+
+
+class TimedStream(Generic[T]):
+    """Stream which records the time to the first item.
+
+    Parameters
+    ----------
+    stream : Iterable[T]
+        The stream.
+    start : float
+        Time (time.monotonic()) when the request was sent.
+
+    """
+
+    def __init__(self, stream: Iterable[T], start: float) -> None:
+        self.stream = stream
+        self.start = start
+        self.ttft: float | None = None
+
+    def __iter__(self) -> Iterator[T]:
+        for item in self.stream:
+            if self.ttft is None:
+                self.ttft = time.monotonic() - self.start
+            yield item
+
+    def close(self) -> None:
+        if hasattr(self.stream, "close"):
+            self.stream.close()
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, cast
+
+if TYPE_CHECKING:
+    from tiktoken import Encoding
+
+# Texts shorter than this in total are encoded in the caller thread, as
+# starting threads takes longer than encoding them.
+BATCH_MIN_CHARS = 100000
+
+
+@dataclass
+class TokenCache:
+    """Content-addressed cache of token counts.
+
+    Token counts are keyed by the encoding name and the hash of the text, and
+    kept in an in-memory LRU. If `path` is given, the cache is loaded from and
+    saved to the file so that unchanged prompts are not tokenized again in the
+    next run.
+
+    Parameters
+    ----------
+    path : Path | None
+        JSON file to store the cache. If None, the cache is kept only in
+        memory.
+    max_size : int
+        The maximum number of entries.
+
+    """
+
+    path: Path | None = None
+    max_size: int = 10000
+
+    def __post_init__(self) -> None:
+        self.data: OrderedDict[str, int] = OrderedDict()
+        self.loaded = False
+        self.updated = False
+
+    @staticmethod
+    def make_key(encoding_name: str, text: str) -> str:
+        digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        return f"{encoding_name}:{digest}"
+
+    def load(self) -> None:
+        self.loaded = True
+        if self.path is None or not self.path.is_file():
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Entries counted in this process are newer than the file ones.
+        data.update(self.data)
+        self.data = OrderedDict(data)
+        self.shrink()
+
+    def shrink(self) -> None:
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def get(self, encoding_name: str, text: str) -> int | None:
+        if not self.loaded:
+            self.load()
+        key = self.make_key(encoding_name, text)
+        if key in self.data:
+            self.data.move_to_end(key)
+            return self.data[key]
+        return None
+
+    def set(self, encoding_name: str, text: str, num_tokens: int) -> None:
+        if not self.loaded:
+            self.load()
+        self.data[self.make_key(encoding_name, text)] = num_tokens
+        self.updated = True
+        self.shrink()
+
+    def count(self, encoding: Encoding, text: str) -> int:
+        num_tokens = self.get(encoding.name, text)
+        if num_tokens is None:
+            num_tokens = len(encoding.encode(text))
+            self.set(encoding.name, text, num_tokens)
+        return num_tokens
+
+    def count_batch(
+        self,
+        encoding: Encoding,
+        texts: list[str],
+        num_threads: int = 8,
+    ) -> list[int]:
+        """Count tokens of texts, encoding the uncached ones in threads.
+
+        Parameters
+        ----------
+        encoding : Encoding
+            The encoding.
+        texts : list[str]
+            Texts to count tokens.
+        num_threads : int
+            The number of threads to encode texts.
+
+        Returns
+        -------
+        list[int]
+            Tokens of each text.
+
+        """
+        counts = [self.get(encoding.name, text) for text in texts]
+        misses = list(
+            dict.fromkeys(t for t, n in zip(texts, counts) if n is None),
+        )
+        if not misses:
+            return cast("list[int]", counts)
+        num_threads = min(num_threads, os.cpu_count() or 1)
+        if num_threads > 1 and sum(map(len, misses)) >= BATCH_MIN_CHARS:
+            encoded = encoding.encode_batch(misses, num_threads=num_threads)
+        else:
+            encoded = [encoding.encode(text) for text in misses]
+        new = {text: len(x) for text, x in zip(misses, encoded)}
+        for text, num_tokens in new.items():
+            self.set(encoding.name, text, num_tokens)
+        return [new[t] if n is None else n for t, n in zip(texts, counts)]
+
+    def save(self) -> None:
+        if self.path is None or not self.updated:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and replace so that parallel runs never
+        # read a partially written file.
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            Path(tmp).unlink(missing_ok=True)
+            return
+        self.updated = False
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .chatgpt import Message, Messages
+    from .summarizer import Summarizer
+
+
+@dataclass
+class MessageWindow:
+    """Sliding window of messages with their token counts.
+
+    The first `pinned` messages (system prompt, theme, etc...) are never
+    dropped. They are followed by the summary of the dropped messages if
+    it is set by `summarizer`. The other messages are kept in a deque
+    together with the cumulative sum of their tokens, so that the total
+    tokens is known in constant time and the cut point to fit into a token
+    limit is found by a single binary search instead of dropping messages
+    one by one.
+
+    Parameters
+    ----------
+    pinned : int
+        Number of leading messages which are never dropped.
+    summarizer : Summarizer | None
+        Summarizer to fold the dropped messages into the summary.
+
+    """
+
+    pinned: int = 0
+    summarizer: Summarizer | None = None
+
+    def __post_init__(self) -> None:
+        self.pinned_messages: Messages = []
+        self.pinned_tokens = 0
+        self.summary: Message | None = None
+        self.summary_tokens = 0
+        self.body: deque[tuple[Message, int]] = deque()
+        # Cumulative tokens of all appended body messages (including dropped
+        # ones). Dropped entries are removed lazily by moving `self.head`.
+        self.cumsum: list[int] = []
+        self.head = 0
+
+    def __len__(self) -> int:
+        return (
+            len(self.pinned_messages)
+            + (self.summary is not None)
+            + len(self.body)
+        )
+
+    @property
+    def messages(self) -> Messages:
+        summary = [self.summary] if self.summary is not None else []
+        return self.pinned_messages + summary + [m for m, _ in self.body]
+
+    @property
+    def tokens(self) -> list[int]:
+        return [t for _, t in self.body]
+
+    @property
+    def total_tokens(self) -> int:
+        return self.pinned_tokens + self.summary_tokens + self.body_tokens
+
+    @property
+    def body_tokens(self) -> int:
+        if not self.body:
+            return 0
+        return self.cumsum[-1] - self.dropped_tokens
+
+    @property
+    def dropped_tokens(self) -> int:
+        return self.cumsum[self.head - 1] if self.head else 0
+
+    def append(self, message: Message, tokens: int) -> None:
+        if len(self.pinned_messages) < self.pinned:
+            self.pinned_messages.append(message)
+            self.pinned_tokens += tokens
+            return
+        self.body.append((message, tokens))
+        self.cumsum.append((self.cumsum[-1] if self.cumsum else 0) + tokens)
+
+    def extend(self, messages: Messages, tokens: list[int]) -> None:
+        for message, num in zip(messages, tokens):
+            self.append(message, num)
+
+    def set_summary(self, message: Message, tokens: int) -> None:
+        self.summary = message
+        self.summary_tokens = tokens
+
+    def trim(
+        self,
+        max_tokens: int,
+        keep: int = 0,
+    ) -> list[tuple[Message, int]]:
+        """Drop the oldest non-pinned messages to fit into max_tokens.
+
+        Parameters
+        ----------
+        max_tokens : int
+            The maximum total tokens of the window.
+        keep : int
+            Number of the newest messages which are not dropped even if the
+            window does not fit.
+
+        Returns
+        -------
+        list[tuple[Message, int]]
+            Dropped messages and their tokens.
+
+        """
+        excess = self.total_tokens - max_tokens
+        if excess <= 0:
+            return []
+        # Find the first body message whose cumulative tokens (counted from
+        # the current head) reaches the excess. Dropping up to and including
+        # it is the minimum cut to fit into max_tokens.
+        cut = bisect_left(
+            self.cumsum,
+            self.dropped_tokens + excess,
+            lo=self.head,
+        )
+        num = max(0, min(cut - self.head + 1, len(self.body) - keep))
+        dropped = [self.body.popleft() for _ in range(num)]
+        self.head += num
+        self.compact()
+        return dropped
+
+    def compact(self) -> None:
+        if not self.body:
+            self.cumsum = []
+            self.head = 0
+        elif self.head > len(self.body):
+            # Keep the amortized cost per message constant.
+            self.cumsum = self.cumsum[self.head - 1 :]
+            self.head = 1
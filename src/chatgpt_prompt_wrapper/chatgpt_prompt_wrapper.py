@@ -1,28 +1,37 @@
 from __future__ import annotations
 
+import copy
 import importlib
 import inspect
-import json
 import sys
 from dataclasses import dataclass
-from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, cast
 
 from conf_finder import ConfFinder
 
-from .__version__ import __version__
+from . import __version__
 from .arg_parser import cli_help, parse_args, true_false_params, true_params
-from .chatgpt import Ask, Chat, Discuss
 from .chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
-from .cmds import commands, cost, init
+from .cmds import commands, cost, encodings, init, sessions, stats
+from .config_snapshot import ConfigSnapshot
+from .cost_ledger import CostLedger
 from .log_formatter import get_logger
+from .metrics import MetricsStore
+from .profiler import Profiler
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from .chatgpt import Ask, Batch, Chat, ChatGPT, Discuss
 
 if sys.version_info >= (3, 11):
     tomllib = importlib.import_module("tomllib")
 else:
     tomllib = importlib.import_module("tomli")
 
+configs: dict[Path, tuple[int, dict[str, Any]]] = {}
+
 
 @dataclass
 class ChatGPTPromptWrapper:
@@ -38,6 +47,20 @@ class ChatGPTPromptWrapper:
         Configuration TOML file name.
     cost_file_name : str
         Cost JSON file name.
+    token_cache_file_name : str
+        Token count cache JSON file name, placed in the same directory as the cost file.
+    encoding_dir_name : str
+        Directory name of pre-parsed encodings, placed in the same directory as the cost file.
+    cache_dir_name : str
+        Directory name of the response cache, placed in the same directory as the cost file.
+    rate_limit_file_name : str
+        JSON file name of the rate limits shared by processes, placed in the same directory as the cost file.
+    config_snapshot_dir_name : str
+        Directory name of the compiled configuration snapshots, placed in the same directory as the cost file.
+    metrics_file_name : str
+        JSONL file name of the latency and throughput metrics, placed in the same directory as the cost file.
+    session_dir_name : str
+        Directory name of the chat sessions, placed in the same directory as the cost file.
 
     """
 
@@ -45,6 +68,13 @@ class ChatGPTPromptWrapper:
     cmd_name: str = "cg"
     config_file_name: str = "config.toml"
     cost_file_name: str = "cost.json"
+    token_cache_file_name: str = "token_cache.json"  # noqa: S105
+    encoding_dir_name: str = "encodings"
+    cache_dir_name: str = "response_cache"
+    rate_limit_file_name: str = "rate_limits.json"
+    config_snapshot_dir_name: str = "config_snapshot"
+    metrics_file_name: str = "metrics.jsonl"
+    session_dir_name: str = "sessions"
 
     def __post_init__(self) -> None:
         self.log = get_logger(__name__.split(".")[0])
@@ -53,6 +83,10 @@ class ChatGPTPromptWrapper:
             self.argv = sys.argv[1:]
         self.args = parse_args(self.argv)
         self.cmd = self.args.subcommand[0]
+        self.usages: list[dict[str, Any]] = []
+        self.predefined_messages: list[dict[str, str]] = []
+        self.files_set = False
+        self.tables: dict[tuple[str, ...], dict[str, Any]] = {}
 
         if "." in self.config_file_name:
             self.config_file_ext = self.config_file_name.split(".")[-1]
@@ -77,6 +111,18 @@ class ChatGPTPromptWrapper:
             self.log.info(f"{__package__} {__version__}")
             return True
 
+        if self.cmd == "serve":
+            from .client import socket_path
+            from .server import serve
+
+            path = socket_path()
+            if path is None:
+                raise ChatGPTPromptWrapperError(
+                    "`serve` needs Unix domain sockets.",
+                )
+            serve(path, self.log)
+            return True
+
         return False
 
     def cmd_wo_key(self) -> bool:
@@ -86,10 +132,52 @@ class ChatGPTPromptWrapper:
             return True
 
         if self.cmd == "cost":
-            cost(self.cost_file, self.log)
+            cost(
+                self.cost_file,
+                self.log,
+                " ".join(self.args.message).strip() or "month",
+            )
+            return True
+
+        if self.cmd == "stats":
+            stats(
+                self.metrics_file,
+                self.log,
+                " ".join(self.args.message).strip() or "1d",
+            )
+            return True
+
+        if self.cmd == "sessions":
+            sessions(
+                self.session_dir,
+                self.log,
+                " ".join(self.args.message).split(),
+                self.load_config().get("global", {}).get("max_sessions", 100),
+            )
+            return True
+
+        if self.cmd == "encodings":
+            encodings(
+                self.load_config(),
+                self.encoding_dir,
+                " ".join(self.args.message).split(),
+                self.log,
+            )
             return True
         return False
 
+    def load_config(self) -> dict[str, Any]:
+        if not self.config_file.is_file():
+            return {}
+        # Parsed configurations are kept while the file is not modified, for
+        # the process serving many requests (`cg serve`).
+        path = self.config_file.resolve()
+        mtime = path.stat().st_mtime_ns
+        if path not in configs or configs[path][0] != mtime:
+            with open(path, "rb") as f:
+                configs[path] = (mtime, cast(dict[str, Any], tomllib.load(f)))
+        return configs[path][1]
+
     def set_files(self) -> None:
         cf = ConfFinder(self.cmd_name)
         self.config_file = (
@@ -104,11 +192,36 @@ class ChatGPTPromptWrapper:
             ext=self.cost_file_ext,
             file_name=self.cost_file_name,
         )
+        self.token_cache_file = self.cost_file.with_name(
+            self.token_cache_file_name,
+        )
+        self.encoding_dir = self.cost_file.with_name(self.encoding_dir_name)
+        self.cache_dir = self.cost_file.with_name(self.cache_dir_name)
+        self.rate_limit_file = self.cost_file.with_name(
+            self.rate_limit_file_name,
+        )
+        self.metrics_file = self.cost_file.with_name(self.metrics_file_name)
+        self.session_dir = self.cost_file.with_name(self.session_dir_name)
+        self.config_snapshot = ConfigSnapshot(
+            self.config_file,
+            self.cost_file.with_name(self.config_snapshot_dir_name),
+        )
+        self.files_set = True
+
+    def load_tables(self, names: list[str]) -> dict[str, Any]:
+        # Tables read to find the profile are reused by the command.
+        key = tuple(names)
+        if key not in self.tables:
+            self.tables[key] = self.config_snapshot.config(names)
+        return self.tables[key]
 
     def set_config_messages(self, config: dict[str, Any]) -> None:
         if "messages" not in config:
             config["messages"] = []
-        if self.args.message:
+        if config["mode"] == "batch":
+            # Message is the input file in batch mode.
+            config["batch_input"] = " ".join(self.args.message) or "-"
+        elif self.args.message:
             config["messages"].append(
                 {"role": "user", "content": " ".join(self.args.message)},
             )
@@ -151,22 +264,29 @@ class ChatGPTPromptWrapper:
         )
 
     def get_cmd_config(self, config: dict[str, Any]) -> dict[str, Any]:
-        cmd_config = config.get("global", {})
-        cmd_config.update(config.get(self.cmd, {}))
+        # Copy not to modify the loaded configuration.
+        cmd_config = copy.deepcopy(config.get("global", {}))
+        if self.cmd == "batch" and self.args.batch_cmd:
+            cmd_config.update(
+                copy.deepcopy(config.get(self.args.batch_cmd, {}))
+            )
+        else:
+            cmd_config.update(copy.deepcopy(config.get(self.cmd, {})))
 
-        if self.cmd in ["ask", "chat", "discuss"]:
+        if self.cmd in ["ask", "chat", "discuss", "batch"]:
             cmd_config["mode"] = self.cmd
         else:
             cmd_config["mode"] = cmd_config.get("mode", "ask")
 
+        self.predefined_messages = list(cmd_config.get("messages", []))
         self.update_cmd_config(cmd_config)
 
         if not cmd_config["messages"]:
-            if cmd_config["mode"] == "ask":
+            if cmd_config["mode"] == "ask" and not cmd_config.get("file"):
                 raise ChatGPTPromptWrapperError(
                     "This subcommand (ask mode) does not predefined prompt and need input message.",
                 )
-            if self.cmd == "discuss":
+            if self.cmd == "discuss" and not cmd_config.get("themes"):
                 raise ChatGPTPromptWrapperError(
                     "This subcommand (discussion mode) needs input message as a theme.",
                 )
@@ -174,45 +294,141 @@ class ChatGPTPromptWrapper:
         return cmd_config
 
     def run_chatgpt(self, config: dict[str, Any]) -> float:
-        cls: type[Ask | Chat | Discuss]
+        # Import modes here as openai, tiktoken and prompt_toolkit are heavy
+        # and not needed for other subcommands.
+        cls: type[Ask | Chat | Discuss | Batch]
         if config["mode"] == "ask":
+            from .chatgpt.ask import Ask
+
             cls = Ask
         elif config["mode"] == "chat":
+            from .chatgpt.chat import Chat
+
             cls = Chat
         elif config["mode"] == "discuss":
+            from .chatgpt.discuss import Discuss
+
             cls = Discuss
+        elif config["mode"] == "batch":
+            from .chatgpt.batch import Batch
+
+            cls = Batch
         else:
             raise ChatGPTPromptWrapperError(
-                f"Invalid mode: {config['mode']}. Please choose from ask, chat, discuss.",
+                f"Invalid mode: {config['mode']}. Please choose from ask, chat, discuss, batch.",
             )
+        if config.get("token_cache", True):
+            config.setdefault("token_cache_file", str(self.token_cache_file))
+        config.setdefault("encoding_dir", str(self.encoding_dir))
+        config.setdefault("cache_dir", str(self.cache_dir))
+        config.setdefault("rate_limit_file", str(self.rate_limit_file))
+        if config.get("session", True):
+            config.setdefault("session_dir", str(self.session_dir))
         accepted_args = inspect.signature(cls.__init__).parameters
+        if config.get("hedge_percentile"):
+            config["hedge_delay"] = self.get_hedge_delay(config, accepted_args)
         params = {k: v for k, v in config.items() if k in accepted_args}
-        cost_data_this = cls(**params).run(config["messages"])
+        gpt = cls(**params)
+        self.usages = gpt.usages
+        self.store_prompt_tokens(gpt)
+        try:
+            cost_data_this = gpt.run(config["messages"])
+        finally:
+            gpt.token_cache.save()
+        if gpt.response_cache is not None and config["show_cost"]:
+            self.log.info(gpt.response_cache.report())
         return cost_data_this
 
+    def get_hedge_delay(
+        self,
+        config: dict[str, Any],
+        args: Mapping[str, inspect.Parameter],
+    ) -> float:
+        """Percentile of the past TTFT of the command as the hedge delay.
+
+        If there are fewer than hedge_min_samples records in the last 7
+        days, hedge_delay is used instead.
+        """
+        percentile = config["hedge_percentile"]
+        if not 0 < percentile < 100:
+            raise ChatGPTPromptWrapperError(
+                f"hedge_percentile must be in (0, 100): {percentile}",
+            )
+        labels = (
+            config.get("model", args["model"].default),
+            config.get("base_url", args["base_url"].default),
+            self.cmd,
+        )
+        delay = MetricsStore(self.metrics_file).quantile(
+            "ttft",
+            labels,
+            percentile / 100,
+            min_samples=config.get("hedge_min_samples", 20),
+        )
+        if delay is None:
+            return float(config.get("hedge_delay", 0))
+        return delay
+
+    def store_prompt_tokens(self, gpt: ChatGPT) -> None:
+        # Counted once for each version of the configuration, to be shown by
+        # `cg commands` without tokenizer.
+        if gpt.encoding is None or not self.predefined_messages:
+            return
+        name = gpt.encoding.name
+        if self.config_snapshot.get_tokens(self.cmd, name) is None:
+            self.config_snapshot.set_tokens(
+                self.cmd,
+                name,
+                gpt.num_tokens_from_messages(self.predefined_messages),
+            )
+
     def update_cost(
         self,
         cost_file: Path,
         new_cost: float,
         show_cost: bool = False,
+        records: list[dict[str, Any]] | None = None,
     ) -> None:
         if show_cost:
             self.log.info(f"\nEstimated cost: ${new_cost:.6f}")
-        cost_data = {}
-        if cost_file.exists():
-            with open(cost_file) as f:
-                cost_data = dict(sorted(json.load(f).items()))
-        month = datetime.now().strftime("%Y%m")
-        cost_data[month] = cost_data.get(month, 0) + new_cost
-        cost_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(cost_file, "w") as f:
-            json.dump(cost_data, f)
+        if records is None:
+            records = [{"cost": new_cost}]
+        if not records:
+            return
+        CostLedger(cost_file).append(
+            [{**x, "command": self.cmd} for x in records],
+        )
+
+    def get_profile(self) -> tuple[str, bool]:
+        if self.args.profile or self.cmd in ["help", "version", "serve"]:
+            return self.args.profile or "", self.args.profile_memory
+        self.set_files()
+        config = self.load_tables([self.cmd])
+        table = {**config.get("global", {}), **config.get(self.cmd, {})}
+        return (
+            table.get("profile", ""),
+            self.args.profile_memory or table.get("profile_memory", False),
+        )
 
     def main(self) -> None:
+        profile, memory = self.get_profile()
+        if not profile:
+            self.run_cmd()
+            return
+        profiler = Profiler(Path(profile).expanduser(), memory)
+        try:
+            with profiler:
+                self.run_cmd()
+        finally:
+            # Not to mix with the output of the command.
+            sys.stderr.write(profiler.summary)
+
+    def run_cmd(self) -> None:
         if self.cmd_wo_config():
             return
 
-        self.set_files()
+        if not self.files_set:
+            self.set_files()
 
         if self.cmd_wo_key():
             return
@@ -223,7 +439,7 @@ class ChatGPTPromptWrapper:
             )
 
         if (
-            self.cmd not in ["ask", "chat", "discuss"]
+            self.cmd not in ["ask", "chat", "discuss", "batch"]
             and not self.config_file.is_file()
         ):
             raise ChatGPTPromptWrapperError(
@@ -232,18 +448,14 @@ class ChatGPTPromptWrapper:
                 f"You prepare the configuration file by `cg init` command.",
             )
 
-        if self.config_file.is_file():
-            with open(self.config_file, "rb") as f:
-                config = tomllib.load(f)
-        else:
-            config = {}
+        names = self.config_snapshot.names()
 
         if self.cmd == "commands":
-            commands(config, self.log)
+            commands(self.config_snapshot.summary(), self.log)
             return
 
-        cmds = ["ask", "chat", "discuss"] + [
-            x for x in config if x != "global"
+        cmds = ["ask", "chat", "discuss", "batch"] + [
+            x for x in names if x != "global"
         ]
         if self.cmd == "global":
             raise ChatGPTPromptWrapperError("`global` is not a subcommand.")
@@ -251,14 +463,27 @@ class ChatGPTPromptWrapper:
             raise ChatGPTPromptWrapperError(
                 f"Subcommand: `{self.cmd}` is not defined.",
             )
+        if self.cmd == "batch" and self.args.batch_cmd not in [
+            None,
+            *names,
+        ]:
+            raise ChatGPTPromptWrapperError(
+                f"Subcommand: `{self.args.batch_cmd}` is not defined.",
+            )
 
+        # Load only the tables needed for the command.
+        config = self.load_tables(
+            [x for x in [self.cmd, self.args.batch_cmd] if x],
+        )
         cmd_config = self.get_cmd_config(config)
         cost_data_this = self.run_chatgpt(cmd_config)
         self.update_cost(
             self.cost_file,
             cost_data_this,
             cmd_config["show_cost"],
+            self.usages,
         )
+        MetricsStore(self.metrics_file).append(self.usages, self.cmd)
 
 
 def main() -> int:
@@ -0,0 +1,103 @@
+"""Thin client of `cg serve`.
+
+This module must import only the standard library modules, not to lose the
+start-up time gained by the server.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+from pathlib import Path
+
+CONNECT_TIMEOUT = 0.5
+
+
+def socket_path() -> Path | None:
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    if "CG_SOCKET" in os.environ:
+        return Path(os.environ["CG_SOCKET"])
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    # The socket is in a directory only the user can access.
+    return Path(runtime_dir) / f"cg-{os.getuid()}" / "cg.sock"
+
+
+def is_private(path: Path) -> bool:
+    """Check the socket is made by the user and only the user can use it.
+
+    Other users may create the socket at the path (e.g. in /tmp) first to
+    receive the API key.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISSOCK(st.st_mode)
+        and st.st_uid == os.getuid()
+        and not st.st_mode & 0o077
+    )
+
+
+def make_request(argv: list[str]) -> dict[str, object]:
+    # The server has its own environment and working directory.
+    argv = list(argv)
+    for i, arg in enumerate(argv[:-1]):
+        if arg == "--":
+            break
+        if arg in ["-c", "--conf"]:
+            argv[i + 1] = str(Path(argv[i + 1]).absolute())
+    if "OPENAI_API_KEY" in os.environ:
+        argv = ["--key", os.environ["OPENAI_API_KEY"], *argv]
+    if "OPENAI_API_BASE_URL" in os.environ:
+        argv = ["--base-url", os.environ["OPENAI_API_BASE_URL"], *argv]
+    return {"argv": argv, "isatty": sys.stdout.isatty()}
+
+
+def forward(argv: list[str]) -> int | None:
+    """Run the command by the server.
+
+    Parameters
+    ----------
+    argv : list[str]
+        Arguments of the command.
+
+    Returns
+    -------
+    int | None
+        Exit code, or None if the server is not running or the command must
+        run in this process (interactive modes, etc...).
+
+    """
+    if os.environ.get("CG_NO_SERVER") or "serve" in argv:
+        return None
+    path = socket_path()
+    if path is None or not is_private(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(str(path))
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(None)
+    with sock, sock.makefile("rwb") as f:
+        f.write(json.dumps(make_request(argv)).encode() + b"\n")
+        f.flush()
+        for line in f:
+            data = json.loads(line)
+            if "out" in data:
+                sys.stdout.write(data["out"])
+                sys.stdout.flush()
+            elif "fallback" in data:
+                return None
+            elif "exit" in data:
+                return int(data["exit"])
+    # Connection closed by the server.
+    return 1
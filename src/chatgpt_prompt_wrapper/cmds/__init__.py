@@ -1,5 +1,8 @@
 from .commands import commands
 from .cost import cost
+from .encodings import encodings
 from .init import init
+from .sessions import sessions
+from .stats import stats
 
-__all__ = ["init", "commands", "cost"]
+__all__ = ["init", "commands", "cost", "encodings", "sessions", "stats"]
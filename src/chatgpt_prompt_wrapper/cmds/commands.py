@@ -10,15 +10,36 @@ def commands(config: dict[str, Any], log: logging.Logger) -> None:
     log.info(
         f"    {'discuss':<10s}: Start a discussion between GPTs. Give a them as a message.",
     )
+    log.info(
+        f"    {'batch':<10s}: Run requests in a JSONL file (or stdin) concurrently.",
+    )
     log.info(
         f"    {'init':<10s}: Initialize config file with an example command.",
     )
-    log.info(f"    {'cost':<10s}: Show estimated cost used until now.")
+    log.info(
+        f"    {'cost':<10s}: Show estimated cost used until now (by month, day, model or command)."
+    )
+    log.info(
+        f"    {'stats':<10s}: Show latency and throughput of requests (1h, 1d, 7d, 30d or prometheus).",
+    )
+    log.info(
+        f"    {'sessions':<10s}: List saved chat sessions, or remove old ones by `prune [N]`.",
+    )
+    log.info(
+        f"    {'encodings':<10s}: Store pre-parsed tiktoken encodings for offline use.",
+    )
     log.info(f"    {'commands':<10s}: List up subcommands (show this).")
+    log.info(
+        f"    {'serve':<10s}: Run a server to make following `cg` commands faster.",
+    )
     log.info(f"    {'version':<10s}: Show version.")
     log.info(f"    {'help':<10s}: Show help.")
     log.info("  User commands:")
     for cmd in config:
         if cmd in ["global", "ask", "chat"]:
             continue
-        log.info(f"    {cmd:<10s}: {config[cmd].get('description', '')}")
+        line = f"    {cmd:<10s}: {config[cmd].get('description', '')}"
+        # Prompt tokens are known after the command runs once.
+        if tokens := config[cmd].get("tokens"):
+            line += f" ({max(tokens.values())} prompt tokens)"
+        log.info(line)
@@ -1,14 +1,33 @@
-import json
 import logging
 from pathlib import Path
 
+from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+from ..cost_ledger import KINDS, CostLedger
 
-def cost(cost: Path, log: logging.Logger) -> None:
-    if not cost.exists():
+
+def cost(cost: Path, log: logging.Logger, by: str = "month") -> None:
+    if by not in KINDS:
+        raise ChatGPTPromptWrapperError(
+            f"Invalid aggregation: {by}. Please choose from {', '.join(KINDS)}.",
+        )
+    aggregates = CostLedger(cost).aggregates(by)
+    if not aggregates:
         log.info("No cost data.")
         return
-    with open(cost) as f:
-        cost_data = json.load(f)
-    log.info("Month, EstimatedCost(USD)")
-    for k, v in cost_data.items():
-        log.info(f"{k}, {v:.6f}")
+    log.info(
+        f"{by.capitalize()}, EstimatedCost(USD), Requests, PromptTokens, "
+        "CompletionTokens, AverageLatency(s), CachedTokens, CacheHitRate(%)",
+    )
+    for k, v in aggregates.items():
+        latency = v["latency"] / v["requests"] if v["requests"] else 0
+        cached_tokens = v.get("cached_tokens", 0)
+        hit_rate = (
+            cached_tokens / v["prompt_tokens"] * 100
+            if v["prompt_tokens"]
+            else 0
+        )
+        log.info(
+            f"{k}, {v['cost']:.6f}, {v['requests']:.0f}, "
+            f"{v['prompt_tokens']:.0f}, {v['completion_tokens']:.0f}, "
+            f"{latency:.2f}, {cached_tokens:.0f}, {hit_rate:.1f}",
+        )
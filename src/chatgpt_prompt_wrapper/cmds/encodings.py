@@ -0,0 +1,60 @@
+import logging
+from pathlib import Path
+from typing import Any
+
+from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+
+
+def configured_encodings(
+    config: dict[str, Any],
+    log: logging.Logger,
+) -> list[str]:
+    import tiktoken
+
+    from ..chatgpt.chatgpt import ChatGPT
+
+    global_config = config.get("global", {})
+    tables = [global_config] + [
+        v for k, v in config.items() if k != "global" and isinstance(v, dict)
+    ]
+    names = []
+    for table in tables:
+        name = table.get("encoding_name", global_config.get("encoding_name"))
+        if not name:
+            model = table.get(
+                "model", global_config.get("model", ChatGPT.model)
+            )
+            try:
+                name = tiktoken.encoding_name_for_model(model)
+            except KeyError:
+                log.warning(
+                    f"No encoding is known for model {model}. Set encoding_name.",
+                )
+                continue
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def encodings(
+    config: dict[str, Any],
+    encoding_dir: Path,
+    names: list[str],
+    log: logging.Logger,
+) -> None:
+    # tiktoken is imported here not to slow down other subcommands.
+    import tiktoken
+
+    from ..chatgpt.encoding_store import save_encoding
+
+    if not names:
+        names = configured_encodings(config, log)
+    for name in names:
+        try:
+            encoding = tiktoken.get_encoding(name)
+        except (ValueError, OSError) as e:
+            raise ChatGPTPromptWrapperError(
+                f"Failed to get encoding {name}: {e}",
+            ) from e
+        path = save_encoding(encoding, encoding_dir)
+        log.info(f"Stored encoding {name} at {path}.")
@@ -0,0 +1,41 @@
+import logging
+from pathlib import Path
+
+from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+from ..session_store import SessionStore
+
+
+def sessions(
+    session_dir: Path,
+    log: logging.Logger,
+    args: list[str],
+    max_sessions: int = 100,
+) -> None:
+    store = SessionStore(session_dir, max_sessions)
+    if args and args[0] == "prune" and len(args) <= 2:
+        try:
+            keep = int(args[1]) if len(args) > 1 else max_sessions
+        except ValueError as e:
+            raise ChatGPTPromptWrapperError(
+                f"Invalid number of sessions to keep: {args[1]}",
+            ) from e
+        # Without N, max_sessions = 0 keeps all sessions.
+        removed = store.prune(keep) if keep or len(args) > 1 else []
+        log.info(f"Removed {len(removed)} sessions.")
+        return
+    if args:
+        raise ChatGPTPromptWrapperError(
+            f"Invalid arguments: {' '.join(args)}. Use `sessions` or `sessions prune [N]`.",
+        )
+    summary = store.summary()
+    if not summary:
+        log.info("No sessions.")
+        return
+    log.info("ID, Updated, Model, Messages, Tokens, First message")
+    for x in summary:
+        first = " ".join(x["first"].split())
+        if len(first) > 40:
+            first = first[:37] + "..."
+        log.info(
+            f"{x['id']}, {x['updated']}, {x['model']}, {x['messages']}, {x['tokens']}, {first}",
+        )
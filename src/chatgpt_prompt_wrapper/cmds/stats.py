@@ -0,0 +1,44 @@
+import logging
+import sys
+from pathlib import Path
+
+from ..chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+from ..metrics import METRICS, QUANTILES, WINDOWS, MetricsStore, percentile
+
+
+def stats(metrics: Path, log: logging.Logger, window: str = "1d") -> None:
+    store = MetricsStore(metrics)
+    if window == "prometheus":
+        # Raw text to be scraped, without the log format.
+        sys.stdout.write(store.prometheus())
+        return
+    if window not in WINDOWS:
+        raise ChatGPTPromptWrapperError(
+            f"Invalid window: {window}. Please choose from {', '.join(WINDOWS)} or prometheus.",
+        )
+    values = store.values(WINDOWS[window])
+    if not values:
+        log.info(f"No metrics in {window}.")
+        return
+    names = {
+        "ttft": "TTFT(s)",
+        "latency": "Latency(s)",
+        "tps": "Tokens/s",
+        "retries": "Retries",
+    }
+    log.info(
+        "Model, BaseURL, Command, Requests, "
+        + ", ".join(
+            f"{names[k]}p{q * 100:.0f}" for k in METRICS for q in QUANTILES
+        ),
+    )
+    for key, v in values.items():
+        log.info(
+            ", ".join(key)
+            + f", {len(v['latency'])}, "
+            + ", ".join(
+                f"{percentile(v[k], q):.2f}"
+                for k in METRICS
+                for q in QUANTILES
+            ),
+        )
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+if sys.version_info >= (3, 11):
+    tomllib = importlib.import_module("tomllib")
+else:
+    tomllib = importlib.import_module("tomli")
+
+Index = dict[str, Any]
+
+
+def write_json(path: Path, data: Any) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+@dataclass
+class ConfigSnapshot:
+    """Compiled snapshot of the configuration file.
+
+    Each table of the configuration file is stored as a JSON file, with an
+    index of the table names, their descriptions and the token counts of
+    their prompts. A command reads only the index, `global` and its own
+    table instead of parsing all prompts in the TOML file. The snapshot is
+    rebuilt when the size or mtime of the configuration file changes and its
+    content hash differs.
+
+    Parameters
+    ----------
+    config_file : Path
+        The configuration TOML file.
+    snapshot_dir : Path
+        Directory to store the snapshots.
+
+    """
+
+    config_file: Path
+    snapshot_dir: Path
+
+    def __post_init__(self) -> None:
+        path = str(self.config_file.resolve())
+        key = hashlib.sha256(path.encode()).hexdigest()[:16]
+        self.directory = self.snapshot_dir / key
+        self.index_file = self.directory / "index.json"
+        self._index: Index | None = None
+
+    @property
+    def index(self) -> Index:
+        if self._index is None:
+            self._index = self.load_index()
+        return self._index
+
+    def read_index(self) -> Index | None:
+        try:
+            with open(self.index_file) as f:
+                index: Index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index
+
+    def load_index(self) -> Index:
+        if not self.config_file.is_file():
+            return {"tables": {}}
+        stat = self.config_file.stat()
+        index = self.read_index()
+        if (
+            index is not None
+            and index["mtime_ns"] == stat.st_mtime_ns
+            and index["size"] == stat.st_size
+        ):
+            return index
+        data = self.config_file.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        if index is None or index["sha256"] != digest:
+            return self.build(data, digest, stat)
+        # Touched without changes.
+        index["mtime_ns"] = stat.st_mtime_ns
+        write_json(self.index_file, index)
+        return index
+
+    def build(self, data: bytes, digest: str, stat: os.stat_result) -> Index:
+        config = tomllib.loads(data.decode())
+        version = self.directory / digest[:16]
+        version.mkdir(parents=True, exist_ok=True)
+        tables: dict[str, dict[str, Any]] = {}
+        for i, (name, table) in enumerate(config.items()):
+            write_json(version / f"{i}.json", table)
+            tables[name] = {
+                "file": f"{digest[:16]}/{i}.json",
+                "description": table.get("description", "")
+                if isinstance(table, dict)
+                else "",
+                "tokens": {},
+            }
+        index = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": digest,
+            "tables": tables,
+        }
+        write_json(self.index_file, index)
+        # Remove old versions. Readers of them fall back to the TOML file.
+        for path in self.directory.iterdir():
+            if path.is_dir() and path != version:
+                shutil.rmtree(path, ignore_errors=True)
+        return index
+
+    def names(self) -> list[str]:
+        return list(self.index["tables"])
+
+    def table(self, name: str) -> Any:
+        with open(self.directory / self.index["tables"][name]["file"]) as f:
+            return json.load(f)
+
+    def config(self, names: list[str]) -> dict[str, Any]:
+        """Configuration which has only `global` and the given tables.
+
+        Parameters
+        ----------
+        names : list[str]
+            Names of the tables to load.
+
+        Returns
+        -------
+        dict[str, Any]
+            The configuration.
+
+        """
+        names = [x for x in ["global", *names] if x in self.index["tables"]]
+        try:
+            return {name: self.table(name) for name in names}
+        except (OSError, ValueError):
+            # Removed by a process which rebuilt the snapshot.
+            with open(self.config_file, "rb") as f:
+                config = tomllib.load(f)
+            return {name: config[name] for name in names if name in config}
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """Descriptions and prompt tokens of the tables, without prompts.
+
+        Returns
+        -------
+        dict[str, dict[str, Any]]
+            Description and prompt tokens for each encoding of each table.
+
+        """
+        return {
+            name: {"description": x["description"], "tokens": x["tokens"]}
+            for name, x in self.index["tables"].items()
+        }
+
+    def get_tokens(self, name: str, encoding_name: str) -> int | None:
+        tables = self.index["tables"]
+        if name not in tables:
+            return None
+        tokens: int | None = tables[name]["tokens"].get(encoding_name)
+        return tokens
+
+    def set_tokens(self, name: str, encoding_name: str, tokens: int) -> None:
+        """Store the token count of the prompt of the table.
+
+        Parameters
+        ----------
+        name : str
+            Name of the table.
+        encoding_name : str
+            Encoding used to count tokens.
+        tokens : int
+            Prompt tokens.
+
+        """
+        index = self.read_index()
+        if index is None or index["sha256"] != self.index.get("sha256"):
+            # The configuration was changed by another process.
+            return
+        if name not in index["tables"]:
+            return
+        index["tables"][name]["tokens"][encoding_name] = tokens
+        write_json(self.index_file, index)
+        self._index = index
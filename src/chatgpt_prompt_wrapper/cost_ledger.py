@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+KINDS = ["month", "day", "model", "command"]
+FIELDS = [
+    "cost",
+    "requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "latency",
+]
+
+Record = dict[str, Any]
+Rollup = dict[str, dict[str, dict[str, float]]]
+
+
+def record_keys(record: Record) -> dict[str, str]:
+    timestamp = record["timestamp"]
+    return {
+        "month": timestamp[:4] + timestamp[5:7],
+        "day": timestamp[:4] + timestamp[5:7] + timestamp[8:10],
+        "model": record.get("model", "") or "unknown",
+        "command": record.get("command", "") or "unknown",
+    }
+
+
+def fold(rollup: Rollup, record: Record) -> None:
+    for kind, key in record_keys(record).items():
+        aggregate = rollup[kind].setdefault(key, dict.fromkeys(FIELDS, 0))
+        # Aggregates written by older versions may lack newer fields.
+        for name in FIELDS:
+            aggregate.setdefault(name, 0)
+        aggregate["requests"] += 1
+        for name in FIELDS:
+            if name != "requests":
+                aggregate[name] += record.get(name, 0)
+
+
+@dataclass
+class CostLedger:
+    """Append-only ledger of the cost with precomputed aggregates.
+
+    Each request is appended as a JSON line to the ledger (`cost.jsonl` for
+    `cost.json`). When the ledger grows over `compact_size` bytes, its
+    records are folded into the aggregates by month, day, model and command
+    in the rollup file (`cost.json`) and moved to the yearly archives
+    (`cost-YYYY.jsonl`). Queries read the rollup and only the small rest of
+    the ledger. All file updates are protected by a lock file.
+
+    Parameters
+    ----------
+    rollup_file : Path
+        JSON file of the aggregates.
+    compact_size : int
+        Size of the ledger in bytes to trigger the compaction.
+
+    """
+
+    rollup_file: Path
+    compact_size: int = 256 * 1024
+
+    def __post_init__(self) -> None:
+        self.ledger_file = self.rollup_file.with_suffix(".jsonl")
+        self.lock_file = self.rollup_file.with_suffix(".lock")
+
+    @contextmanager
+    def lock(self, shared: bool = False) -> Iterator[None]:
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def append(self, records: list[Record]) -> None:
+        now = datetime.now().isoformat(timespec="seconds")
+        lines = "".join(
+            json.dumps({"timestamp": now, **record}) + "\n"
+            for record in records
+        )
+        with self.lock():
+            with open(self.ledger_file, "a") as f:
+                f.write(lines)
+            if self.ledger_file.stat().st_size > self.compact_size:
+                self.compact_locked()
+
+    def read_rollup(self) -> Rollup:
+        rollup: Rollup = {kind: {} for kind in KINDS}
+        if not self.rollup_file.is_file():
+            return rollup
+        with open(self.rollup_file) as f:
+            data = json.load(f)
+        if all(isinstance(v, (int, float)) for v in data.values()):
+            # Old format which has only monthly costs.
+            for month, cost in data.items():
+                rollup["month"][month] = dict.fromkeys(FIELDS, 0)
+                rollup["month"][month]["cost"] = cost
+            return rollup
+        for kind in KINDS:
+            rollup[kind].update(data.get(kind, {}))
+        return rollup
+
+    def read_ledger(self) -> Iterator[Record]:
+        if not self.ledger_file.is_file():
+            return
+        with open(self.ledger_file) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Partially written line by an interrupted process.
+                    continue
+
+    def compact_locked(self) -> None:
+        rollup = self.read_rollup()
+        archives: dict[str, list[str]] = {}
+        for record in self.read_ledger():
+            fold(rollup, record)
+            archives.setdefault(record["timestamp"][:4], []).append(
+                json.dumps(record) + "\n",
+            )
+        for year, lines in archives.items():
+            archive = self.rollup_file.with_name(
+                f"{self.rollup_file.stem}-{year}.jsonl",
+            )
+            with open(archive, "a") as f:
+                f.writelines(lines)
+        fd, tmp = tempfile.mkstemp(dir=self.rollup_file.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(rollup, f)
+        os.replace(tmp, self.rollup_file)
+        self.ledger_file.unlink(missing_ok=True)
+
+    def compact(self) -> None:
+        with self.lock():
+            self.compact_locked()
+
+    def aggregates(self, kind: str = "month") -> dict[str, dict[str, float]]:
+        """Aggregates of all records.
+
+        Parameters
+        ----------
+        kind : str
+            One of month, day, model and command.
+
+        Returns
+        -------
+        dict[str, dict[str, float]]
+            Aggregated cost, requests, tokens and latency for each key.
+
+        """
+        with self.lock(shared=True):
+            rollup = self.read_rollup()
+            for record in self.read_ledger():
+                fold(rollup, record)
+        return dict(sorted(rollup[kind].items()))
@@ -25,9 +25,14 @@ class LogFormatter(logging.Formatter):
                     f"\033[{colors[level]};1m{self.formats[level]}\033[m"
                 )
 
+        self.formatters = {
+            level: logging.Formatter(fmt)
+            for level, fmt in self.formats.items()
+        }
+        self.default_formatter = logging.Formatter(self.default_format)
+
     def format(self, record: logging.LogRecord) -> str:
-        fmt = self.formats.get(record.levelno, self.default_format)
-        formatter = logging.Formatter(fmt)
+        formatter = self.formatters.get(record.levelno, self.default_formatter)
         return formatter.format(record)
 
 
@@ -35,8 +40,11 @@ def get_logger(name: str, level: int = logging.INFO) -> logging.Logger:
     """Get a logger with a custom formatter."""
     log = logging.getLogger(name)
     log.setLevel(level)
-    ch = logging.StreamHandler(stream=sys.stdout)
-    ch.setLevel(logging.DEBUG)
-    ch.setFormatter(LogFormatter())
-    log.addHandler(ch)
+    # Do not add handlers again when it is called several times in a process
+    # (e.g. `cg serve`).
+    if not log.handlers:
+        ch = logging.StreamHandler(stream=sys.stdout)
+        ch.setLevel(logging.DEBUG)
+        ch.setFormatter(LogFormatter())
+        log.addHandler(ch)
     return log
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+# Metric names in records and their Prometheus names and descriptions.
+METRICS = {
+    "ttft": (
+        "cg_time_to_first_token_seconds",
+        "Time to the first token (the whole response if not streamed).",
+    ),
+    "latency": ("cg_request_latency_seconds", "Time to the whole response."),
+    "tps": ("cg_tokens_per_second", "Completion tokens per second."),
+    "retries": ("cg_request_retries", "Retries of the request."),
+}
+WINDOWS = {"1h": 3600, "1d": 86400, "7d": 7 * 86400, "30d": 30 * 86400}
+QUANTILES = [0.5, 0.95, 0.99]
+LABELS = ["model", "base_url", "command"]
+
+Record = dict[str, Any]
+Stats = dict[tuple[str, ...], dict[str, list[float]]]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Percentile by the linear interpolation of the sorted values.
+
+    Parameters
+    ----------
+    values : list[float]
+        Sorted values.
+    q : float
+        Quantile (0 ~ 1).
+
+    Returns
+    -------
+    float
+        The percentile.
+
+    """
+    if not values:
+        return math.nan
+    position = (len(values) - 1) * q
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@dataclass
+class MetricsStore:
+    """Store of the latency and the throughput of requests.
+
+    Each request which was neither taken from the response cache nor
+    cancelled is appended as a JSON line with its time to the first token,
+    latency, tokens per second and retries, labeled by the model, base_url
+    and command. Records older than `retention` seconds are dropped when
+    the file grows over `compact_size` bytes.
+
+    Parameters
+    ----------
+    metrics_file : Path
+        JSONL file of the records.
+    retention : float
+        Seconds to keep the records.
+    compact_size : int
+        Size of the file in bytes to drop the old records.
+
+    """
+
+    metrics_file: Path
+    retention: float = max(WINDOWS.values())
+    compact_size: int = 1024 * 1024
+
+    def __post_init__(self) -> None:
+        self.lock_file = self.metrics_file.with_suffix(".lock")
+
+    @contextmanager
+    def lock(self, shared: bool = False) -> Iterator[None]:
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def append(self, records: list[Record], command: str) -> None:
+        now = time.time()
+        lines = "".join(
+            json.dumps(
+                {
+                    "time": round(now, 3),
+                    "model": x.get("model", ""),
+                    "base_url": x.get("base_url", ""),
+                    "command": command,
+                    **{k: round(x[k], 4) for k in METRICS if k in x},
+                },
+            )
+            + "\n"
+            for x in records
+            if "latency" in x
+            and not x.get("cached")
+            and not x.get("cancelled")
+        )
+        if not lines:
+            return
+        with self.lock():
+            with open(self.metrics_file, "a") as f:
+                f.write(lines)
+            if self.metrics_file.stat().st_size > self.compact_size:
+                self.compact_locked(now)
+
+    def read(self, since: float = 0) -> Iterator[Record]:
+        if not self.metrics_file.is_file():
+            return
+        with open(self.metrics_file) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Partially written line by an interrupted process.
+                    continue
+                if record["time"] >= since:
+                    yield record
+
+    def compact_locked(self, now: float) -> None:
+        lines = [json.dumps(x) + "\n" for x in self.read(now - self.retention)]
+        fd, tmp = tempfile.mkstemp(
+            dir=self.metrics_file.parent,
+            suffix=".tmp",
+        )
+        with os.fdopen(fd, "w") as f:
+            f.writelines(lines)
+        os.replace(tmp, self.metrics_file)
+
+    def values(self, window: float, now: float | None = None) -> Stats:
+        """Sorted values of each metric for each label set in the window.
+
+        Parameters
+        ----------
+        window : float
+            Seconds of the window until now.
+        now : float | None
+            Current time. If None, use time.time().
+
+        Returns
+        -------
+        Stats
+            Values of each metric for each (model, base_url, command).
+
+        """
+        now = time.time() if now is None else now
+        stats: Stats = {}
+        with self.lock(shared=True):
+            for record in self.read(now - window):
+                key = tuple(record.get(x, "") for x in LABELS)
+                values = stats.setdefault(key, {k: [] for k in METRICS})
+                for k in METRICS:
+                    if k in record:
+                        values[k].append(record[k])
+        for values in stats.values():
+            for v in values.values():
+                v.sort()
+        return dict(sorted(stats.items()))
+
+    def quantile(
+        self,
+        metric: str,
+        labels: tuple[str, ...],
+        q: float,
+        window: float = WINDOWS["7d"],
+        min_samples: int = 1,
+    ) -> float | None:
+        """Quantile of a metric for the label set in the window.
+
+        Parameters
+        ----------
+        metric : str
+            Name of the metric in records (e.g. ttft).
+        labels : tuple[str, ...]
+            Values of (model, base_url, command).
+        q : float
+            Quantile (0 ~ 1).
+        window : float
+            Seconds of the window until now.
+        min_samples : int
+            The minimum number of values to estimate the quantile.
+
+        Returns
+        -------
+        float | None
+            The quantile, or None if there are fewer values than min_samples.
+
+        """
+        values = self.values(window).get(labels, {}).get(metric, [])
+        if not values or len(values) < min_samples:
+            return None
+        return percentile(values, q)
+
+    def prometheus(self, now: float | None = None) -> str:
+        """Metrics in the Prometheus text format.
+
+        Each metric is a summary with quantiles for each window.
+
+        Parameters
+        ----------
+        now : float | None
+            Current time. If None, use time.time().
+
+        Returns
+        -------
+        str
+            The metrics.
+
+        """
+        windows = {name: self.values(w, now) for name, w in WINDOWS.items()}
+        lines = []
+        for metric, (name, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for window, stats in windows.items():
+                for key, values in stats.items():
+                    labels = ",".join(
+                        f'{label}="{escape_label(value)}"'
+                        for label, value in zip(LABELS, key)
+                    )
+                    labels += f',window="{window}"'
+                    v = values[metric]
+                    if not v:
+                        continue
+                    for q in QUANTILES:
+                        lines.append(
+                            f'{name}{{{labels},quantile="{q}"}} '
+                            f"{percentile(v, q):.6g}",
+                        )
+                    lines.append(f"{name}_sum{{{labels}}} {sum(v):.6g}")
+                    lines.append(f"{name}_count{{{labels}}} {len(v)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+
+# Entry points of the phases: (part of the file name, function name). The
+# cumulative time of the entry points is counted for the phase, so that the
+# time of the functions called from them (e.g. classes built at the import)
+# is included.
+PHASES = {
+    "import": [("<frozen importlib._bootstrap>", "_find_and_load")],
+    "config": [
+        ("arg_parser.py", "parse_args"),
+        ("chatgpt_prompt_wrapper.py", "load_config"),
+        ("chatgpt_prompt_wrapper.py", "get_cmd_config"),
+        ("config_snapshot.py", "load_index"),
+        ("config_snapshot.py", "table"),
+    ],
+    "tokenization": [
+        ("encoding_store.py", "get_encoding"),
+        ("token_cache.py", "count"),
+        ("token_cache.py", "count_batch"),
+    ],
+    "network": [
+        ("_base_client.py", "request"),
+        ("_streaming.py", "__stream__"),
+    ],
+    "render": [
+        ("logging/__init__.py", "callHandlers"),
+        ("stream_writer.py", "flush"),
+        ("stream_writer.py", "write"),
+    ],
+}
+
+
+def get_phase(filename: str, funcname: str) -> str | None:
+    for phase, entries in PHASES.items():
+        for file, func in entries:
+            if funcname == func and file in filename:
+                return phase
+    return None
+
+
+@dataclass
+class Profiler:
+    """Profile the CPU time (and memory) of a command.
+
+    The cProfile statistics are written to `output` (read them by `pstats`
+    or `snakeviz`), and the summary of the time of each phase (import,
+    config, tokenization, network and render) and the top functions (and
+    allocations) is written to `output` + `.txt`. Only the main thread is
+    profiled (e.g. prefetched replies of `discuss` are not).
+
+    Parameters
+    ----------
+    output : Path
+        File to write the pstats.
+    memory : bool
+        Whether to trace memory allocations by tracemalloc.
+    top : int
+        The number of functions (and allocations) in the summary.
+
+    """
+
+    output: Path
+    memory: bool = False
+    top: int = 20
+
+    def __post_init__(self) -> None:
+        self.profile = cProfile.Profile()
+        self.summary_file = self.output.with_name(self.output.name + ".txt")
+        self.summary = ""
+
+    def __enter__(self) -> Profiler:
+        if self.memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.profile.disable()
+        self.elapsed = time.perf_counter() - self.start
+        snapshot = None
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, self.peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        self.profile.dump_stats(self.output)
+        self.summary = self.make_summary(snapshot)
+        self.summary_file.write_text(self.summary)
+
+    def phases(self, stats: pstats.Stats) -> dict[str, float]:
+        phases = dict.fromkeys(PHASES, 0.0)
+        for (filename, _, funcname), stat in stats.stats.items():  # type: ignore[attr-defined]
+            if (phase := get_phase(filename, funcname)) is not None:
+                phases[phase] += stat[3]
+        return phases
+
+    def make_summary(self, snapshot: tracemalloc.Snapshot | None) -> str:
+        out = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        total = stats.total_tt  # type: ignore[attr-defined]
+        out.write(
+            f"Elapsed: {self.elapsed:.3f} s, CPU profile: {self.output}\n"
+        )
+        out.write(
+            "Time by phase (phases can overlap, e.g. import in config):\n"
+        )
+        for phase, tt in self.phases(stats).items():
+            share = tt / total * 100 if total else 0
+            out.write(f"  {phase:<12s} {tt:8.3f} s {share:5.1f}%\n")
+        out.write(f"Top {self.top} functions by cumulative time:\n")
+        stats.sort_stats("cumulative").print_stats(self.top)
+        if snapshot is not None:
+            out.write(f"Peak memory: {self.peak / 1024**2:.1f} MiB\n")
+            out.write(f"Top {self.top} allocations:\n")
+            for stat in snapshot.statistics("lineno")[: self.top]:
+                out.write(f"  {stat}\n")
+        return out.getvalue()
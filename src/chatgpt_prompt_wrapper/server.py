@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import threading
+from typing import IO, TYPE_CHECKING, Any
+
+from .chatgpt_prompt_wrapper import ChatGPTPromptWrapper
+from .chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+from .client import CONNECT_TIMEOUT
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+class Fallback(Exception):  # noqa: N818
+    """The command must run in the client process."""
+
+
+class ThreadLocalStdout(io.TextIOBase):
+    """stdout which writes to the stream set for each thread."""
+
+    def __init__(self, default: IO[str]) -> None:
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def current(self) -> IO[str]:
+        return getattr(self.local, "stream", None) or self.default
+
+    def write(self, s: str) -> int:
+        return self.current.write(s)
+
+    def flush(self) -> None:
+        self.current.flush()
+
+    def isatty(self) -> bool:
+        return self.current.isatty()
+
+
+class SocketStdout(io.TextIOBase):
+    """stdout which sends outputs to the client."""
+
+    def __init__(self, wfile: io.BufferedIOBase, isatty: bool) -> None:
+        self.wfile = wfile
+        self.tty = isatty
+
+    def send(self, data: dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(data).encode() + b"\n")
+        self.wfile.flush()
+
+    def write(self, s: str) -> int:
+        if s:
+            self.send({"out": s})
+        return len(s)
+
+    def isatty(self) -> bool:
+        return self.tty
+
+
+class ServerWrapper(ChatGPTPromptWrapper):
+    """ChatGPTPromptWrapper which runs only non-interactive commands."""
+
+    def get_profile(self) -> tuple[str, bool]:
+        profile, memory = super().get_profile()
+        # The profiler is process wide and its summary goes to the stderr of
+        # the client.
+        if profile:
+            raise Fallback
+        return profile, memory
+
+    def cmd_wo_config(self) -> bool:
+        if self.cmd in ["help", "version", "serve"]:
+            raise Fallback
+        return super().cmd_wo_config()
+
+    def cmd_wo_key(self) -> bool:
+        if self.cmd in ["init", "encodings"]:
+            raise Fallback
+        return super().cmd_wo_key()
+
+    def run_chatgpt(self, config: dict[str, Any]) -> float:
+        # Other modes and input files need the terminal, stdin or the working
+        # directory of the client.
+        if config["mode"] != "ask" or config.get("file"):
+            raise Fallback
+        return super().run_chatgpt(config)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def run(self, argv: list[str]) -> int:
+        try:
+            cg = ServerWrapper(argv=argv)
+        except SystemExit:
+            # Let the client show argparse errors.
+            raise Fallback from None
+        try:
+            cg.main()
+        except ChatGPTPromptWrapperError as e:
+            cg.log.error(e)
+            return 1
+        return 0
+
+    def handle(self) -> None:
+        request = json.loads(self.rfile.readline())
+        out = SocketStdout(self.wfile, request.get("isatty", False))
+        stdout = self.server.stdout  # type: ignore[attr-defined]
+        stdout.local.stream = out
+        try:
+            out.send({"exit": self.run(request["argv"])})
+        except Fallback:
+            out.send({"fallback": True})
+        except BrokenPipeError:
+            pass
+        finally:
+            stdout.local.stream = None
+
+
+def is_running(path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+def serve(path: Path, log: logging.Logger) -> None:
+    """Serve requests from `cg` at the Unix domain socket.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the socket.
+    log : logging.Logger
+        Logger.
+
+    """
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    parent = path.parent.stat()
+    # Others could replace the socket in their directory (a directory with
+    # the sticky bit, like /tmp, is fine).
+    if parent.st_uid != os.getuid() and not parent.st_mode & stat.S_ISVTX:
+        raise ChatGPTPromptWrapperError(
+            f"{path.parent} is owned by another user.",
+        )
+    if path.exists() or path.is_symlink():
+        if is_running(path):
+            raise ChatGPTPromptWrapperError(
+                f"A server is already running at {path}.",
+            )
+        # Left by a server which did not stop cleanly.
+        path.unlink()
+    # Outputs of commands go to the client which requested them.
+    stdout = ThreadLocalStdout(sys.stdout)
+    sys.stdout = stdout
+    for handler in log.handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(stdout)  # type: ignore[arg-type]
+    # Only the user can connect to the socket.
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(str(path), Handler)
+    finally:
+        os.umask(umask)
+    server.daemon_threads = True
+    server.stdout = stdout  # type: ignore[attr-defined]
+
+    def shutdown(signum: int, frame: Any) -> None:
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    log.info(f"Serving at {path}. Stop by Ctrl-C.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+        sys.stdout = stdout.default
+        for handler in log.handlers:
+            if isinstance(handler, logging.StreamHandler):
+                handler.setStream(stdout.default)  # type: ignore[arg-type]
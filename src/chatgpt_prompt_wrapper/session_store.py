@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import json
+import re
+import secrets
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from .chatgpt_prompt_wrapper_exception import ChatGPTPromptWrapperError
+
+Message = dict[str, Any]
+
+SESSION_ID = re.compile(r"[0-9A-Za-z_.-]+")
+
+
+@dataclass
+class SessionStore:
+    """Store of chat sessions.
+
+    Each session is a JSONL file in `session_dir`. The first line is a
+    header with the encoding used to count tokens, and each other line is a
+    message with its tokens. Messages are appended once per turn, so that
+    the file is never rewritten and a session can be resumed without
+    tokenizing its history again. Only the newest `max_sessions` sessions
+    are kept.
+
+    Parameters
+    ----------
+    session_dir : Path
+        Directory of the session files.
+    max_sessions : int
+        The maximum number of sessions. 0 keeps all sessions.
+
+    """
+
+    session_dir: Path
+    max_sessions: int = 100
+
+    @staticmethod
+    def new_id() -> str:
+        return (
+            datetime.now().strftime("%Y%m%d-%H%M%S")
+            + "-"
+            + secrets.token_hex(2)
+        )
+
+    def path(self, session_id: str) -> Path:
+        return self.session_dir / f"{session_id}.jsonl"
+
+    def ids(self) -> list[str]:
+        """Session IDs from the newest to the oldest updated."""
+        if not self.session_dir.is_dir():
+            return []
+        files = [
+            (x.stat().st_mtime_ns, x.stem)
+            for x in self.session_dir.glob("*.jsonl")
+        ]
+        return [x for _, x in sorted(files, reverse=True)]
+
+    def resolve(self, session_id: str) -> str:
+        if session_id == "last":
+            ids = self.ids()
+            if not ids:
+                raise ChatGPTPromptWrapperError("There is no session.")
+            return ids[0]
+        path = self.path(session_id)
+        if not SESSION_ID.fullmatch(session_id) or not path.is_file():
+            raise ChatGPTPromptWrapperError(
+                f"Session {session_id} does not exist. See `cg sessions`.",
+            )
+        return session_id
+
+    def read(self, session_id: str) -> tuple[dict[str, Any], list[Any]]:
+        header: dict[str, Any] = {}
+        records = []
+        with open(self.path(session_id)) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Partially written line by an interrupted process.
+                    continue
+                if "session" in record:
+                    header = record
+                else:
+                    records.append(record)
+        return header, records
+
+    def load(
+        self,
+        session_id: str,
+    ) -> tuple[dict[str, Any], list[Message], list[int]]:
+        """Load messages of the session.
+
+        Parameters
+        ----------
+        session_id : str
+            The session ID.
+
+        Returns
+        -------
+        tuple[dict[str, Any], list[Message], list[int]]
+            The header, the messages and their tokens.
+
+        """
+        header, records = self.read(session_id)
+        return (
+            header,
+            [x["message"] for x in records],
+            [x["tokens"] for x in records],
+        )
+
+    def append(
+        self,
+        session_id: str,
+        messages: list[tuple[Message, int]],
+        header: dict[str, Any],
+    ) -> None:
+        """Append messages to the session, creating it with the header.
+
+        Parameters
+        ----------
+        session_id : str
+            The session ID.
+        messages : list[tuple[Message, int]]
+            Messages and their tokens.
+        header : dict[str, Any]
+            Header of a new session.
+
+        """
+        path = self.path(session_id)
+        lines = [
+            json.dumps({"message": m, "tokens": t}, ensure_ascii=False)
+            for m, t in messages
+        ]
+        new = not path.is_file()
+        if new:
+            self.session_dir.mkdir(parents=True, exist_ok=True)
+            lines.insert(
+                0,
+                json.dumps({"session": session_id, **header}),
+            )
+        with open(path, "a") as f:
+            f.write("".join(x + "\n" for x in lines))
+        if new and self.max_sessions:
+            self.prune(self.max_sessions)
+
+    def summary(self) -> list[dict[str, Any]]:
+        """Summary of the sessions from the newest one.
+
+        Returns
+        -------
+        list[dict[str, Any]]
+            ID, updated time, number of messages, tokens and the first user
+            message of each session.
+
+        """
+        sessions = []
+        for session_id in self.ids():
+            header, records = self.read(session_id)
+            first = next(
+                (
+                    x["message"]["content"]
+                    for x in records
+                    if x["message"].get("role") == "user"
+                ),
+                "",
+            )
+            updated = datetime.fromtimestamp(
+                self.path(session_id).stat().st_mtime,
+            )
+            sessions.append(
+                {
+                    "id": session_id,
+                    "updated": updated.isoformat(timespec="seconds"),
+                    "model": header.get("model", ""),
+                    "messages": len(records),
+                    "tokens": sum(x["tokens"] for x in records),
+                    "first": first,
+                },
+            )
+        return sessions
+
+    def prune(self, keep: int) -> list[str]:
+        """Remove sessions except the newest `keep` ones.
+
+        Parameters
+        ----------
+        keep : int
+            The number of sessions to keep.
+
+        Returns
+        -------
+        list[str]
+            IDs of the removed sessions.
+
+        """
+        removed = self.ids()[keep:]
+        for session_id in removed:
+            self.path(session_id).unlink(missing_ok=True)
+        return removed
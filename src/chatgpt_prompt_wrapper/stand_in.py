@@ -0,0 +1,588 @@
+"""Local OpenAI compatible API server for offline tests and benchmarks.
+
+Run it and give its URL as `base_url` (`-b` option):
+
+    $ cg-stand-in --port 8000 --ttft 0.3 --chunk-delay 0.02
+    $ cg ask -b http://127.0.0.1:8000/v1 hello
+
+Replies are replayed from the fixture files recorded by `--record` (the last
+user message is echoed if no fixture matches the request).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+ERRORS = ["429", "500", "truncate"]
+HOP_HEADERS = [
+    "connection",
+    "content-encoding",
+    "content-length",
+    "keep-alive",
+    "transfer-encoding",
+]
+
+
+def fixture_key(body: dict[str, Any]) -> str:
+    """Key of the fixture for the request.
+
+    Parameters
+    ----------
+    body : dict[str, Any]
+        Request body.
+
+    Returns
+    -------
+    str
+        Hash of the model and the messages.
+
+    """
+    data = json.dumps(
+        {"model": body.get("model"), "messages": body.get("messages")},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def approximate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English texts.
+    return max(1, len(text) // 4) if text else 0
+
+
+@dataclass
+class StandIn:
+    """OpenAI compatible server which replays recorded replies.
+
+    Parameters
+    ----------
+    host : str
+        Host to listen.
+    port : int
+        Port to listen. 0 chooses a free port.
+    fixture_dir : str
+        Directory of the fixture files. If empty, all replies are echoes.
+    strict : bool
+        Return 404 for the requests without fixtures instead of echoes.
+    ttft : float | None
+        Time to the first token in seconds. If None, the recorded one (or 0) is used.
+    chunk_delay : float | None
+        Delay between chunks in seconds. If None, the recorded one (or 0) is used.
+    chunk_size : int
+        Characters in a chunk of replies which have no recorded chunks.
+    usage : dict[str, int]
+        Usage fields to overwrite, e.g. {"prompt_tokens": 10}.
+    errors : dict[str, float]
+        Rates of the injected errors: 429, 500 and truncate (a reply cut in the middle).
+    retry_after : float
+        Retry-After in seconds of the injected 429 errors.
+    seed : int | None
+        Seed of the error injection.
+    record : str
+        Upstream base URL. If set, requests are forwarded to it and the replies are written as fixtures.
+
+    """
+
+    host: str = "127.0.0.1"
+    port: int = 0
+    fixture_dir: str = ""
+    strict: bool = False
+    ttft: float | None = None
+    chunk_delay: float | None = None
+    chunk_size: int = 4
+    usage: dict[str, int] = field(default_factory=dict)
+    errors: dict[str, float] = field(default_factory=dict)
+    retry_after: float = 0.1
+    seed: int | None = None
+    record: str = ""
+
+    def __post_init__(self) -> None:
+        for name in self.errors:
+            if name not in ERRORS:
+                raise ValueError(
+                    f"Unknown error: {name}. Choose from {', '.join(ERRORS)}.",
+                )
+        self.random = random.Random(self.seed)  # noqa: S311
+        self.random_lock = threading.Lock()
+        self.requests = 0
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.server.stand_in = self  # type: ignore[attr-defined]
+        self.thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.server.server_port}/v1"
+
+    def start(self) -> StandIn:
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            daemon=True,
+        )
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server.server_close()
+
+    def __enter__(self) -> StandIn:
+        return self.start()
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+
+    def injected_error(self) -> str | None:
+        with self.random_lock:
+            self.requests += 1
+            for name in ERRORS:
+                if self.random.random() < self.errors.get(name, 0):
+                    return name
+        return None
+
+    def fixture_file(self, body: dict[str, Any]) -> Path:
+        return Path(self.fixture_dir) / f"{fixture_key(body)}.json"
+
+    def load_fixture(self, body: dict[str, Any]) -> dict[str, Any] | None:
+        if self.fixture_dir:
+            file = self.fixture_file(body)
+            if file.is_file():
+                with open(file) as f:
+                    return json.load(f)  # type: ignore[no-any-return]
+        if self.strict:
+            return None
+        content = ""
+        for message in reversed(body.get("messages", [])):
+            if message.get("role") == "user":
+                content = str(message.get("content", ""))
+                break
+        return {"chunks": [content], "finish_reason": "stop"}
+
+    def save_fixture(
+        self,
+        body: dict[str, Any],
+        fixture: dict[str, Any],
+    ) -> None:
+        file = self.fixture_file(body)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        with open(file, "w") as f:
+            json.dump(
+                {
+                    "request": {
+                        "model": body.get("model"),
+                        "messages": body.get("messages"),
+                    },
+                    **fixture,
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+    def get_chunks(self, fixture: dict[str, Any]) -> list[str]:
+        chunks: list[str] = fixture.get("chunks", [])
+        if len(chunks) == 1 and self.chunk_size > 0:
+            content = chunks[0]
+            chunks = [
+                content[i : i + self.chunk_size]
+                for i in range(0, len(content), self.chunk_size)
+            ]
+        return chunks
+
+    def get_usage(
+        self,
+        body: dict[str, Any],
+        fixture: dict[str, Any],
+        chunks: list[str],
+    ) -> dict[str, int]:
+        usage = fixture.get("usage") or {
+            "prompt_tokens": sum(
+                approximate_tokens(str(x.get("content", ""))) + 3
+                for x in body.get("messages", [])
+            )
+            + 3,
+            "completion_tokens": approximate_tokens("".join(chunks)),
+        }
+        usage = {**usage, **self.usage}
+        usage["total_tokens"] = usage.get("prompt_tokens", 0) + usage.get(
+            "completion_tokens",
+            0,
+        )
+        return usage
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def stand_in(self) -> StandIn:
+        return self.server.stand_in  # type: ignore[attr-defined,no-any-return]
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def send_json(
+        self,
+        status: int,
+        data: dict[str, Any],
+        headers: dict[str, str] | None = None,
+        truncate: bool = False,
+    ) -> None:
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if truncate:
+            self.wfile.write(payload[: len(payload) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(payload)
+
+    def send_error_json(self, status: int, message: str, kind: str) -> None:
+        headers = {}
+        if status == 429:
+            headers["retry-after-ms"] = str(
+                int(self.stand_in.retry_after * 1000),
+            )
+        self.send_json(
+            status,
+            {"error": {"message": message, "type": kind, "code": None}},
+            headers,
+        )
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def write_event(self, data: dict[str, Any] | str) -> None:
+        text = data if isinstance(data, str) else json.dumps(data)
+        self.write_chunk(f"data: {text}\n\n".encode())
+
+    def start_stream(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def end_stream(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def read_body(self) -> dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")  # type: ignore[no-any-return]
+
+    def do_POST(self) -> None:  # noqa: N802
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error_json(404, f"Unknown path: {self.path}", "invalid")
+            return
+        body = self.read_body()
+        if self.stand_in.record:
+            self.forward(body)
+            return
+        error = self.stand_in.injected_error()
+        if error == "429":
+            self.send_error_json(429, "Rate limit reached.", "requests")
+            return
+        if error == "500":
+            self.send_error_json(500, "Server error.", "server_error")
+            return
+        fixture = self.stand_in.load_fixture(body)
+        if fixture is None:
+            self.send_error_json(404, "No fixture for the request.", "invalid")
+            return
+        self.replay(body, fixture, truncate=error == "truncate")
+
+    def replay(
+        self,
+        body: dict[str, Any],
+        fixture: dict[str, Any],
+        truncate: bool,
+    ) -> None:
+        stand_in = self.stand_in
+        ttft = (
+            stand_in.ttft
+            if stand_in.ttft is not None
+            else fixture.get("ttft", 0)
+        )
+        delay = (
+            stand_in.chunk_delay
+            if stand_in.chunk_delay is not None
+            else fixture.get("chunk_delay", 0)
+        )
+        chunks = stand_in.get_chunks(fixture)
+        usage = stand_in.get_usage(body, fixture, chunks)
+        finish_reason = fixture.get("finish_reason", "stop")
+        base = {
+            "id": f"chatcmpl-stand-in-{stand_in.requests}",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+        }
+        time.sleep(ttft)
+        if not body.get("stream"):
+            time.sleep(delay * max(0, len(chunks) - 1))
+            self.send_json(
+                200,
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": "".join(chunks),
+                            },
+                            "finish_reason": finish_reason,
+                            "logprobs": None,
+                        },
+                    ],
+                    "usage": usage,
+                },
+                truncate=truncate,
+            )
+            return
+
+        def event(
+            delta: dict[str, str],
+            finish: str | None = None,
+        ) -> dict[str, Any]:
+            return {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish},
+                ],
+            }
+
+        self.start_stream()
+        self.write_event(event({"role": "assistant", "content": ""}))
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(delay)
+            if truncate and i >= len(chunks) // 2:
+                # Drop the connection in the middle of the stream.
+                self.close_connection = True
+                return
+            self.write_event(event({"content": chunk}))
+        self.write_event(event({}, finish_reason))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.write_event(
+                {
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [],
+                    "usage": usage,
+                },
+            )
+        self.write_event("[DONE]")
+        self.end_stream()
+
+    def forward(self, body: dict[str, Any]) -> None:
+        stand_in = self.stand_in
+        url = stand_in.record.rstrip("/") + "/chat/completions"
+        headers = {"Content-Type": "application/json"}
+        if auth := self.headers.get("Authorization"):
+            headers["Authorization"] = auth
+        request = urllib.request.Request(  # noqa: S310
+            url,
+            data=json.dumps(body).encode(),
+            headers=headers,
+            method="POST",
+        )
+        start = time.monotonic()
+        try:
+            response = urllib.request.urlopen(request)  # noqa: S310
+        except urllib.error.HTTPError as e:
+            # Pass errors (e.g. rate limits with their headers) through.
+            payload = e.read()
+            self.send_response(e.code)
+            for k, v in e.headers.items():
+                if k.lower() not in HOP_HEADERS:
+                    self.send_header(k, v)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        with response:
+            if body.get("stream"):
+                self.forward_stream(response, start, body)
+                return
+            data = json.load(response)
+            latency = time.monotonic() - start
+            choice = data["choices"][0]
+            # Saved before the response, so that the client can replay it
+            # as soon as it is received.
+            stand_in.save_fixture(
+                body,
+                {
+                    "chunks": [choice["message"].get("content") or ""],
+                    "finish_reason": choice.get("finish_reason"),
+                    "usage": data.get("usage"),
+                    "ttft": latency,
+                },
+            )
+            self.send_json(response.status, data)
+
+    def forward_stream(
+        self,
+        response: Any,
+        start: float,
+        body: dict[str, Any],
+    ) -> None:
+        self.start_stream()
+        chunks: list[str] = []
+        times: list[float] = []
+        fixture: dict[str, Any] = {"finish_reason": None}
+        end: list[bytes] = []
+        for line in response:
+            text = line.decode().strip()
+            if text.startswith("data:") and text[5:].strip() == "[DONE]":
+                # Held back until the fixture is saved.
+                end.append(line)
+                continue
+            if end:
+                end.append(line)
+                continue
+            self.write_chunk(line)
+            if not text.startswith("data:"):
+                continue
+            text = text[len("data:") :].strip()
+            data = json.loads(text)
+            if data.get("usage"):
+                fixture["usage"] = data["usage"]
+            for choice in data.get("choices", []):
+                if content := choice.get("delta", {}).get("content"):
+                    chunks.append(content)
+                    times.append(time.monotonic() - start)
+                if choice.get("finish_reason"):
+                    fixture["finish_reason"] = choice["finish_reason"]
+        fixture["chunks"] = chunks
+        fixture["ttft"] = times[0] if times else time.monotonic() - start
+        fixture["chunk_delay"] = (
+            (times[-1] - times[0]) / (len(times) - 1) if len(times) > 1 else 0
+        )
+        self.stand_in.save_fixture(body, fixture)
+        for line in end:
+            self.write_chunk(line)
+        self.end_stream()
+
+
+def parse_pairs(values: list[str], kind: type) -> dict[str, Any]:
+    pairs = {}
+    for value in values:
+        name, _, number = value.partition("=")
+        pairs[name] = kind(number)
+    return pairs
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = ArgumentParser(
+        description="OpenAI compatible API server which replays recorded replies.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen.")
+    parser.add_argument(
+        "--port",
+        default=8000,
+        type=int,
+        help="Port to listen.",
+    )
+    parser.add_argument(
+        "--fixtures",
+        default="",
+        help="Directory of the fixture files.",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Return 404 for requests without fixtures instead of echoes.",
+    )
+    parser.add_argument(
+        "--ttft",
+        type=float,
+        help="Time to the first token in seconds (default: recorded one).",
+    )
+    parser.add_argument(
+        "--chunk-delay",
+        type=float,
+        help="Delay between chunks in seconds (default: recorded one).",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        default=4,
+        type=int,
+        help="Characters in a chunk of replies without recorded chunks.",
+    )
+    parser.add_argument(
+        "--usage",
+        action="append",
+        default=[],
+        help="Usage field to overwrite, e.g. prompt_tokens=10.",
+    )
+    parser.add_argument(
+        "--error",
+        action="append",
+        default=[],
+        help="Rate of an injected error, e.g. 429=0.1 (429, 500 or truncate).",
+    )
+    parser.add_argument(
+        "--retry-after",
+        default=0.1,
+        type=float,
+        help="Retry-After in seconds of the injected 429 errors.",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="Seed of the error injection."
+    )
+    parser.add_argument(
+        "--record",
+        default="",
+        help="Upstream base URL to forward requests and record fixtures.",
+    )
+    args = parser.parse_args(argv)
+    if args.record and not args.fixtures:
+        parser.error("--record needs --fixtures.")
+    try:
+        stand_in = StandIn(
+            host=args.host,
+            port=args.port,
+            fixture_dir=args.fixtures,
+            strict=args.strict,
+            ttft=args.ttft,
+            chunk_delay=args.chunk_delay,
+            chunk_size=args.chunk_size,
+            usage=parse_pairs(args.usage, int),
+            errors=parse_pairs(args.error, float),
+            retry_after=args.retry_after,
+            seed=args.seed,
+            record=args.record,
+        )
+    except (ValueError, OSError) as e:
+        print(e, file=sys.stderr)  # noqa: T201
+        return 1
+    print(f"Serving at {stand_in.url}. Stop by Ctrl-C.")  # noqa: T201
+    try:
+        stand_in.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stand_in.server.server_close()
+    return 0
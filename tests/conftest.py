@@ -1,5 +1,10 @@
+import asyncio
+from types import SimpleNamespace
+
 import pytest
+import tiktoken
 
+from chatgpt_prompt_wrapper.chatgpt.encoding_store import save_encoding
 from chatgpt_prompt_wrapper.config import example_config
 
 
@@ -11,3 +16,145 @@ def conf_file(tmp_path, monkeypatch):
     with open(file, "w") as f:
         f.write(example_config())
     return file
+
+
+@pytest.fixture
+def make_encoding():
+    def make(name):
+        ranks = {bytes([i]): i for i in range(256)}
+        ranks[b"ab"] = 256
+        ranks[b"abc"] = 257
+        return tiktoken.Encoding(
+            name,
+            pat_str=r"\S+|\s+",
+            mergeable_ranks=ranks,
+            special_tokens={"<|endoftext|>": 258},
+        )
+
+    return make
+
+
+@pytest.fixture
+def encoding_params(tmp_path, make_encoding, request):
+    """Parameters of ChatGPT to use a small encoding without network."""
+    # Encodings are cached in the process by the name.
+    name = f"test_{request.node.name}"
+    directory = tmp_path / "encodings"
+    save_encoding(make_encoding(name), directory)
+    return {"encoding_name": name, "encoding_dir": str(directory)}
+
+
+@pytest.fixture
+def make_chunk():
+    def make(content=None, role=None, finish_reason=None):
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    delta=SimpleNamespace(role=role, content=content),
+                    finish_reason=finish_reason,
+                ),
+            ],
+        )
+
+    return make
+
+
+class DummyCompletions:
+    """Chat completions API which replies `reply(messages)`.
+
+    Each of `n` choices calls `reply`, unless `n` is not supported.
+    """
+
+    def __init__(
+        self, reply, delay=None, headers=None, n=True, finish_reason="stop"
+    ):
+        self.reply = reply
+        self.delay = delay
+        self.headers = headers or {}
+        self.n = n
+        self.finish_reason = finish_reason
+        self.requests = []
+        self.running = 0
+        self.max_running = 0
+        self.with_raw_response = SimpleNamespace(create=self.create_raw)
+
+    async def create(self, **params):
+        self.requests.append(params["messages"])
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            if self.delay is not None:
+                await asyncio.sleep(self.delay(params["messages"]))
+            n = params.get("n", 1) if self.n else 1
+            contents = [self.reply(params["messages"]) for _ in range(n)]
+        finally:
+            self.running -= 1
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    message=SimpleNamespace(content=content),
+                    finish_reason=self.finish_reason,
+                )
+                for content in contents
+            ],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5 * n),
+        )
+
+    async def create_raw(self, **params):
+        response = await self.create(**params)
+        return SimpleNamespace(headers=self.headers, parse=lambda: response)
+
+
+class DummyAsyncClient:
+    def __init__(
+        self, reply, delay=None, headers=None, n=True, finish_reason="stop"
+    ):
+        self.chat = SimpleNamespace(
+            completions=DummyCompletions(
+                reply, delay, headers, n, finish_reason
+            ),
+        )
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def async_client():
+    """Factory of fake `openai.AsyncOpenAI` clients."""
+    return DummyAsyncClient
+
+
+@pytest.fixture
+def make_discuss(encoding_params):
+    from chatgpt_prompt_wrapper.chatgpt.discuss import Discuss
+
+    def make(**kwargs):
+        params = {
+            "key": "dummy",
+            "model": "dummy",
+            "context_window": 1000,
+            "prices": {"dummy": (1.0, 2.0)},
+            **encoding_params,
+            **kwargs,
+        }
+        return Discuss(**params)
+
+    return make
+
+
+@pytest.fixture
+def stand_in():
+    """Factory of local OpenAI compatible servers, stopped after the test."""
+    from chatgpt_prompt_wrapper.stand_in import StandIn
+
+    servers = []
+
+    def make(**kwargs):
+        servers.append(StandIn(**kwargs).start())
+        return servers[-1]
+
+    yield make
+    for server in servers:
+        server.stop()
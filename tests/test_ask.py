@@ -0,0 +1,222 @@
+import asyncio
+import os
+
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt.ask import REDUCE_PROMPT, Ask, side_by_side
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper_exception import (
+    ChatGPTPromptWrapperError,
+)
+
+PROMPT = [{"role": "system", "content": "Summarize the log."}]
+
+
+def make_ask(encoding_params, **kwargs):
+    return Ask(
+        key="dummy",
+        model="dummy",
+        context_window=1000,
+        min_output_tokens=100,
+        prices={"dummy": (1.0, 2.0)},
+        **encoding_params,
+        **kwargs,
+    )
+
+
+def test_split_input(encoding_params):
+    ask = make_ask(encoding_params, chunk_overlap=5)
+    text = "".join(f"line {i}\n" for i in range(300))
+    chunks = ask.split_input(text, 50)
+    tokens = [ask.encoding.encode(x) for x in chunks]
+    assert all(len(x) <= 50 for x in tokens)
+    assert all(a[-5:] == b[:5] for a, b in zip(tokens, tokens[1:]))
+    assert (
+        chunks[0] + "".join(ask.encoding.decode(x[5:]) for x in tokens[1:])
+        == text
+    )
+
+
+def test_chunk_size(encoding_params):
+    ask = make_ask(encoding_params)
+    prompt_tokens = ask.num_tokens_from_messages(
+        [*PROMPT, {"role": "user", "content": ""}],
+    )
+    # A quarter of the context window is left for the output.
+    limit = 1000 - 250 - prompt_tokens
+    assert ask.get_chunk_size(PROMPT) == limit
+    ask = make_ask(encoding_params, max_output_tokens=300)
+    assert ask.get_chunk_size(PROMPT) == 1000 - 300 - prompt_tokens
+    ask = make_ask(encoding_params, max_output_tokens=800)
+    assert ask.get_chunk_size(PROMPT) == 1000 - 500 - prompt_tokens
+    assert (
+        make_ask(encoding_params, chunk_tokens=300).get_chunk_size(PROMPT)
+        == 300
+    )
+    # chunk_tokens is limited only by min_output_tokens.
+    assert (
+        make_ask(encoding_params, chunk_tokens=1000).get_chunk_size(PROMPT)
+        == 1000 - 100 - prompt_tokens
+    )
+    with pytest.raises(ChatGPTPromptWrapperError, match="chunk_overlap"):
+        make_ask(encoding_params, chunk_overlap=limit).get_chunk_size(PROMPT)
+
+
+def test_map_reduce(
+    monkeypatch, tmp_path, encoding_params, async_client, caplog
+):
+    def reply(messages):
+        if messages[-1]["content"].startswith(REDUCE_PROMPT):
+            return "combined " + str(messages[-1]["content"].count("Result "))
+        return "part"
+
+    client = async_client(reply)
+    file = tmp_path / "input.log"
+    file.write_text("".join(f"line {i}\n" for i in range(500)))
+    ask = make_ask(
+        encoding_params,
+        file=str(file),
+        chunk_tokens=200,
+        max_output_tokens=100,
+    )
+    monkeypatch.setattr(ask, "make_async_client", lambda: client)
+    caplog.set_level("INFO")
+    cost = ask.run(list(PROMPT))
+    requests = client.chat.completions.requests
+    chunks = len(requests) - 1
+    assert chunks > 1
+    assert all(x[0] == PROMPT[0] for x in requests)
+    assert caplog.records[-1].getMessage() == f"combined {chunks}"
+    assert len(ask.usages) == chunks + 1
+    assert cost == pytest.approx((chunks + 1) * (0.01 + 0.01))
+    assert client.closed
+
+
+def test_map_reduce_groups(
+    monkeypatch, tmp_path, encoding_params, async_client
+):
+    def reply(messages):
+        if messages[-1]["content"].startswith(REDUCE_PROMPT):
+            return "combined"
+        return "part " * 30
+
+    client = async_client(reply)
+    file = tmp_path / "input.log"
+    file.write_text("".join(f"line {i}\n" for i in range(500)))
+    ask = make_ask(
+        encoding_params,
+        file=str(file),
+        chunk_tokens=300,
+        chunk_overlap=0,
+    )
+    monkeypatch.setattr(ask, "make_async_client", lambda: client)
+    ask.run(list(PROMPT))
+    requests = client.chat.completions.requests
+    reduces = [
+        x for x in requests if x[-1]["content"].startswith(REDUCE_PROMPT)
+    ]
+    # The partial results are combined in groups, and then the groups.
+    assert len(reduces) > 1
+    assert reduces[-1][-1]["content"].count("Result ") == len(reduces) - 1
+
+
+def test_single_chunk(monkeypatch, tmp_path, encoding_params, async_client):
+    client = async_client(lambda messages: "answer")
+    file = tmp_path / "input.log"
+    file.write_text("short input")
+    ask = make_ask(encoding_params, file=str(file))
+    monkeypatch.setattr(ask, "make_async_client", lambda: client)
+    ask.run(list(PROMPT))
+    assert len(client.chat.completions.requests) == 1
+
+
+def test_truncated_part(
+    monkeypatch, tmp_path, encoding_params, async_client, caplog
+):
+    client = async_client(lambda messages: "part", finish_reason="length")
+    file = tmp_path / "input.log"
+    file.write_text("".join(f"line {i}\n" for i in range(500)))
+    ask = make_ask(encoding_params, file=str(file), chunk_tokens=200)
+    monkeypatch.setattr(ask, "make_async_client", lambda: client)
+    ask.run(list(PROMPT))
+    assert "A partial result was truncated" in caplog.text
+
+
+def test_empty_input(tmp_path, encoding_params):
+    file = tmp_path / "input.log"
+    file.write_text("\n")
+    ask = make_ask(encoding_params, file=str(file))
+    with pytest.raises(ChatGPTPromptWrapperError, match="empty"):
+        ask.run(list(PROMPT))
+
+
+def make_replies(*replies):
+    it = iter(replies)
+    return lambda messages: next(it)
+
+
+def test_candidates(monkeypatch, encoding_params, async_client, caplog):
+    client = async_client(make_replies("first answer", "second"))
+    ask = make_ask(encoding_params, candidates=2)
+    monkeypatch.setattr(ask, "make_async_client", lambda: client)
+    monkeypatch.setattr(
+        "shutil.get_terminal_size",
+        lambda: os.terminal_size((60, 24)),
+    )
+    caplog.set_level("INFO")
+    cost = ask.run(list(PROMPT))
+    # Generated in one request by `n`.
+    assert len(client.chat.completions.requests) == 1
+    lines = caplog.records[-1].getMessage().splitlines()
+    assert lines[0].split() == ["Candidate", "1", "|", "Candidate", "2"]
+    assert lines[2].split() == ["first", "answer", "|", "second"]
+    assert cost == pytest.approx(0.01 + 0.02)
+    assert client.closed
+
+
+def test_candidates_without_n(monkeypatch, encoding_params, async_client):
+    client = async_client(make_replies("a", "bb", "ccc"), n=False)
+    ask = make_ask(encoding_params, candidates=3, scorer="shortest")
+    monkeypatch.setattr(ask, "make_async_client", lambda: client)
+    answers, cost = asyncio.run(ask.best_of(list(PROMPT)))
+    # One choice was returned, and the rest were requested concurrently.
+    assert len(client.chat.completions.requests) == 3
+    assert answers == ["a"]
+    assert len(ask.usages) == 3
+    assert cost == pytest.approx(3 * (0.01 + 0.01))
+
+
+def test_candidates_scorers(monkeypatch, encoding_params, async_client):
+    ask = make_ask(
+        encoding_params,
+        candidates=3,
+        scorer="regex",
+        score_pattern=r"\d+",
+    )
+    client = async_client(make_replies("no", "1 and 2", "3"))
+    monkeypatch.setattr(ask, "make_async_client", lambda: client)
+    assert asyncio.run(ask.best_of(list(PROMPT)))[0] == ["1 and 2"]
+
+    ask = make_ask(encoding_params, candidates=2, scorer="judge")
+    client = async_client(make_replies("x", "y", "Candidate 2"))
+    monkeypatch.setattr(ask, "make_async_client", lambda: client)
+    answers, cost = asyncio.run(ask.best_of(list(PROMPT)))
+    assert answers == ["y"]
+    judge = client.chat.completions.requests[-1][-1]["content"]
+    assert judge.startswith(ask.judge_prompt)
+    assert "Candidate 1:\nx" in judge
+    # The candidates and the judge.
+    assert cost == pytest.approx(0.01 + 0.02 + 0.01 + 0.01)
+
+    with pytest.raises(ChatGPTPromptWrapperError, match="scorer"):
+        make_ask(encoding_params, scorer="longest")
+    with pytest.raises(ChatGPTPromptWrapperError, match="score_pattern"):
+        make_ask(encoding_params, scorer="regex", score_pattern="(")
+
+
+def test_side_by_side():
+    text = side_by_side(["a " * 30, "b"], 50)
+    lines = text.splitlines()
+    assert all(len(x) <= 50 for x in lines)
+    assert lines[1] == "-" * 23 + " | " + "-" * 23
+    assert len(lines) == 5
+    assert side_by_side(["a", "b", "c"], 40).startswith("Candidate 1:\na\n\n")
@@ -0,0 +1,78 @@
+import asyncio
+import io
+import json
+
+from chatgpt_prompt_wrapper.chatgpt.batch import Batch
+
+
+def reply(messages):
+    return messages[-1]["content"].upper()
+
+
+def delay(messages):
+    # Later inputs finish earlier.
+    return 0.01 / (1 + len(messages[-1]["content"]))
+
+
+def run_batch(client, lines, **kwargs):
+    batch = Batch(
+        key="dummy",
+        model="dummy",
+        prices={"dummy": (1.0, 2.0)},
+        **kwargs,
+    )
+    batch.async_client = client
+    out = io.StringIO()
+    cost = asyncio.run(
+        batch.run_batch(
+            [{"role": "system", "content": "prompt"}],
+            io.StringIO("\n".join(lines) + "\n"),
+            out,
+        ),
+    )
+    results = [json.loads(x) for x in out.getvalue().splitlines()]
+    return batch, results, cost
+
+
+def test_batch_input_order(async_client):
+    lines = [json.dumps("a" * i) for i in range(1, 10)]
+    lines.insert(3, "")
+    lines.append("broken")
+    lines.append(json.dumps([{"role": "user", "content": "x"}]))
+    batch, results, cost = run_batch(
+        async_client(reply, delay),
+        lines,
+        concurrency=3,
+    )
+    assert [x["index"] for x in results] == list(range(11))
+    assert results[0]["content"] == "A"
+    assert "error" in results[9]
+    assert results[10]["content"] == "X"
+    assert batch.async_client.chat.completions.max_running <= 3
+    assert abs(cost - 10 * (10 * 1.0 + 5 * 2.0) / 1000.0) < 1e-9
+
+
+def test_batch_completion_order(async_client):
+    lines = [json.dumps({"input": "a" * i}) for i in range(1, 6)]
+    _, results, _ = run_batch(
+        async_client(reply, delay),
+        lines,
+        concurrency=5,
+        order="completion",
+    )
+    assert sorted(x["index"] for x in results) == list(range(5))
+    assert results[0]["index"] == 4
+
+
+def test_batch_unexpected_error(async_client):
+    def reply(messages):
+        if messages[-1]["content"] == "b":
+            msg = "unexpected"
+            raise RuntimeError(msg)
+        return messages[-1]["content"]
+
+    lines = [json.dumps(x) for x in "abcde"]
+    _, results, _ = run_batch(async_client(reply), lines, concurrency=2)
+    assert [x["index"] for x in results] == list(range(5))
+    assert results[1]["error"] == "RuntimeError: unexpected"
+    assert results[4]["content"] == "e"
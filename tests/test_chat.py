@@ -0,0 +1,180 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt.chat import Chat
+from chatgpt_prompt_wrapper.chatgpt.summarizer import SUMMARY_HEADER
+from chatgpt_prompt_wrapper.session_store import SessionStore
+
+
+@pytest.mark.benchmark(group="chat")
+def test_chat_long_history(
+    benchmark, monkeypatch, encoding_params, make_chunk
+):
+    chat = Chat(
+        key="dummy",
+        model="dummy",
+        context_window=100000,
+        max_output_tokens=1000,
+        min_output_tokens=100,
+        prices={"dummy": (1.0, 2.0)},
+        **encoding_params,
+    )
+    history = [
+        {
+            "role": "user" if i % 2 else "assistant",
+            "content": f"message {i} " + "abc " * (i % 20),
+        }
+        for i in range(2000)
+    ]
+    turns = 100
+
+    def run():
+        inputs = iter([f"question {i}" for i in range(turns)] + ["bye"])
+        monkeypatch.setattr(
+            "chatgpt_prompt_wrapper.chatgpt.chat.prompt",
+            lambda *args, **kwargs: next(inputs),
+        )
+        chat.finish_chat = False
+        return chat.run_main(history)
+
+    def completion_stream(messages, prompt_tokens=None):
+        assert prompt_tokens <= chat.context_window - chat.min_output_tokens
+        return iter(
+            [
+                make_chunk(role="assistant", content=""),
+                *[make_chunk(content="abc ") for _ in range(200)],
+                make_chunk(finish_reason="stop"),
+            ],
+        )
+
+    monkeypatch.setattr(chat, "completion_stream", completion_stream)
+    with open(os.devnull, "w") as devnull:
+        monkeypatch.setattr("sys.stdout", devnull)
+        _, cost = benchmark(run)
+    assert cost > 0
+
+
+def test_chat_summary(monkeypatch, encoding_params, make_chunk):
+    chat = Chat(
+        key="dummy",
+        model="dummy",
+        context_window=10000,
+        prompt_budget=200,
+        summary_model="summary",
+        **encoding_params,
+    )
+    inputs = iter([f"question {i}" for i in range(10)])
+    monkeypatch.setattr(
+        "chatgpt_prompt_wrapper.chatgpt.chat.prompt",
+        lambda *args, **kwargs: next(inputs, "bye"),
+    )
+    summarized = []
+
+    def summarize(messages, prompt_tokens=None):
+        summarized.append(messages)
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(message=SimpleNamespace(content="short"))
+            ],
+            usage=SimpleNamespace(prompt_tokens=50, completion_tokens=5),
+        )
+
+    make_summarizer = chat.make_summarizer
+    summarizers = []
+
+    def make():
+        summarizers.append(make_summarizer())
+        monkeypatch.setattr(
+            summarizers[-1].gpt, "completion_message", summarize
+        )
+        return summarizers[-1]
+
+    sent = []
+
+    def completion_stream(messages, prompt_tokens=None):
+        assert prompt_tokens <= 200 + chat.num_total_tokens(0)
+        sent.append(messages)
+        # Let the summary of the dropped messages finish before the next turn.
+        summarizers[0].executor.submit(lambda: None).result()
+        return iter(
+            [
+                make_chunk(role="assistant", content=""),
+                make_chunk(content="answer " * 10),
+                make_chunk(finish_reason="stop"),
+            ],
+        )
+
+    monkeypatch.setattr(chat, "make_summarizer", make)
+    monkeypatch.setattr(chat, "completion_stream", completion_stream)
+    system = {"role": "system", "content": "You are a helpful assistant."}
+    chat.finish_chat = False
+    chat.run_main([system])
+    assert len(sent) == 10
+    assert all(x[0] == system for x in sent)
+    assert summarized
+    assert sent[-1][1]["content"] == SUMMARY_HEADER + "short"
+    # The latest question is never dropped.
+    assert sent[-1][-1]["content"].startswith("question 9")
+    usages = [x for x in chat.usages if x["model"] == "summary"]
+    assert len(usages) == len(summarized)
+
+
+def test_chat_session(monkeypatch, tmp_path, encoding_params, make_chunk):
+    def make_chat(inputs, **kwargs):
+        chat = Chat(
+            key="dummy",
+            model="dummy",
+            context_window=10000,
+            session_dir=str(tmp_path),
+            **encoding_params,
+            **kwargs,
+        )
+        texts = iter(inputs)
+        monkeypatch.setattr(
+            "chatgpt_prompt_wrapper.chatgpt.chat.prompt",
+            lambda *args, **kwargs: next(texts, "bye"),
+        )
+        sent = []
+
+        def completion_stream(messages, prompt_tokens=None):
+            sent.append(list(messages))
+            return iter(
+                [
+                    make_chunk(role="assistant", content=""),
+                    make_chunk(
+                        content=f"answer {len(sent)} to {messages[-1]['content']}"
+                    ),
+                    make_chunk(finish_reason="stop"),
+                ],
+            )
+
+        monkeypatch.setattr(chat, "completion_stream", completion_stream)
+        chat.finish_chat = False
+        return chat, sent
+
+    system = {"role": "system", "content": "You are a helpful assistant."}
+    chat, _ = make_chat(["hello", "how"])
+    chat.run_main([system])
+    store = SessionStore(tmp_path)
+    assert store.ids() == [chat.session_id]
+    _, messages, tokens = store.load(chat.session_id)
+    assert len(messages) == 5
+    assert tokens == chat.num_tokens_per_message(messages)
+
+    chat, sent = make_chat(["again"], resume="last")
+    counted = []
+    count_tokens_batch = chat.count_tokens_batch
+
+    def count(texts):
+        counted.extend(texts)
+        return count_tokens_batch(texts)
+
+    monkeypatch.setattr(chat, "count_tokens_batch", count)
+    chat.run_main([{"role": "system", "content": "Not used."}])
+    # The history is not tokenized again.
+    assert not {x["content"] for x in messages} & set(counted)
+    assert sent[0] == [*messages, {"role": "user", "content": "again"}]
+    assert store.ids() == [chat.session_id]
+    assert len(store.load(chat.session_id)[1]) == 7
@@ -0,0 +1,165 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt.chatgpt import ChatGPT
+
+
+@pytest.mark.benchmark(group="tokens")
+@pytest.mark.parametrize("token_cache_size", [0, 10000])
+def test_num_tokens_from_messages(
+    benchmark, encoding_params, token_cache_size
+):
+    gpt = ChatGPT(
+        key="dummy",
+        model="dummy",
+        context_window=1000000,
+        token_cache_size=token_cache_size,
+        **encoding_params,
+    )
+    messages = [
+        {
+            "role": "user" if i % 2 else "assistant",
+            "content": f"message {i} " + "abc def ghi " * 500,
+        }
+        for i in range(100)
+    ]
+    num_tokens = benchmark(gpt.num_tokens_from_messages, messages)
+    assert num_tokens > 100 * 500
+
+
+def test_num_tokens_per_message(encoding_params):
+    gpt = ChatGPT(
+        key="dummy",
+        model="dummy",
+        context_window=1000000,
+        tokenizer_threads=4,
+        **encoding_params,
+    )
+    messages = [
+        {"role": "system", "content": "abc " * 30000},
+        {"role": "user", "content": "hello", "name": "me"},
+        {"role": "assistant", "content": "abc " * 30000},
+    ]
+    tokens = gpt.num_tokens_per_message(messages)
+    assert tokens == [
+        gpt.tokens_per_message
+        + sum(len(gpt.encoding.encode(v)) for v in x.values())
+        + (gpt.tokens_per_name if "name" in x else 0)
+        for x in messages
+    ]
+    assert tokens[1] == gpt.num_tokens_from_message(messages[1])
+    assert gpt.num_tokens_per_message(messages, only_content=True)[0] == (
+        len(gpt.encoding.encode(messages[0]["content"]))
+    )
+    assert gpt.num_tokens_from_messages(messages) == gpt.num_total_tokens(
+        sum(tokens),
+    )
+
+
+def test_cached_tokens(encoding_params):
+    gpt = ChatGPT(
+        key="dummy",
+        model="dummy",
+        prices={"dummy": (1.0, 2.0, 0.5)},
+        **encoding_params,
+    )
+    assert gpt.get_cost(1000, 1000, 400) == pytest.approx(0.6 + 0.2 + 2.0)
+    gpt.add_usage(1000, 1000, 1.0, cached_tokens=400)
+    assert gpt.usages[-1]["cached_tokens"] == 400
+    assert gpt.usages[-1]["cost"] == pytest.approx(2.8)
+    gpt.prices["dummy"] = (1.0, 2.0)
+    assert gpt.get_cost(1000, 1000, 400) == pytest.approx(3.0)
+
+    usage = SimpleNamespace(
+        prompt_tokens=10,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=3),
+    )
+    assert gpt.get_cached_tokens(usage) == 3
+    usage.prompt_tokens_details = None
+    assert gpt.get_cached_tokens(usage) == 0
+
+
+def test_stream_options(encoding_params):
+    gpt = ChatGPT(
+        key="dummy",
+        model="dummy",
+        context_window=100000,
+        **encoding_params,
+    )
+    messages = [{"role": "user", "content": "hello"}]
+    assert gpt.completion_params(messages, stream=True)["stream_options"] == {
+        "include_usage": True,
+    }
+    assert "stream_options" not in gpt.completion_params(messages)
+    gpt.stream_usage = False
+    assert "stream_options" not in gpt.completion_params(messages, True)
+    assert (
+        gpt.num_tokens_with_content(
+            {**messages[0], "content": "abc"},
+            3,
+        )
+        == gpt.num_tokens_from_message(messages[0]) - 5 + 3
+    )
+
+
+def make_hedged(encoding_params):
+    gpt = ChatGPT(
+        key="dummy",
+        model="dummy",
+        context_window=100000,
+        prices={"dummy": (1.0, 2.0), "fast": (0.5, 1.0)},
+        hedge_delay=0.05,
+        hedge_model="fast",
+        **encoding_params,
+    )
+    assert gpt.hedge is not None
+    assert gpt.hedge.model == "fast"
+    return gpt
+
+
+def test_hedge(encoding_params, make_chunk):
+    gpt = make_hedged(encoding_params)
+    release = threading.Event()
+    models = []
+
+    def slow(params, tokens):
+        models.append(params["model"])
+        release.wait(5)
+        yield make_chunk(role="assistant", content="slow")
+
+    def fast(params, tokens):
+        models.append(params["model"])
+        yield make_chunk(role="assistant", content="fast")
+
+    gpt.create = slow
+    gpt.hedge.create = fast
+    messages = [{"role": "user", "content": "hello"}]
+    try:
+        response = gpt.completion(messages, stream=True, prompt_tokens=1000)
+        chunks = list(response)
+    finally:
+        release.set()
+    assert models == ["dummy", "fast"]
+    assert [x.choices[0].delta.content for x in chunks] == ["fast"]
+    assert gpt.hedged
+    # The cancelled request is billed for its prompt.
+    assert gpt.usages[-1]["cancelled"]
+    assert gpt.usages[-1]["model"] == "dummy"
+    assert gpt.hedge_cost == pytest.approx(1.0)
+    gpt.add_usage(1000, 1000, 1.0)
+    assert gpt.usages[-1]["model"] == "fast"
+    assert gpt.usages[-1]["hedged"]
+    assert gpt.usages[-1]["cost"] == pytest.approx(1.5)
+
+
+def test_hedge_not_needed(encoding_params):
+    gpt = make_hedged(encoding_params)
+    reply = SimpleNamespace(usage=None)
+    gpt.create = lambda params, tokens: reply
+    gpt.hedge.create = lambda params, tokens: pytest.fail("hedged")
+    messages = [{"role": "user", "content": "hello"}]
+    assert gpt.completion(messages, prompt_tokens=10) is reply
+    assert not gpt.hedged
+    assert gpt.usages == []
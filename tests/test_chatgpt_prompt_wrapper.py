@@ -0,0 +1,168 @@
+import inspect
+import json
+
+import pytest
+
+from chatgpt_prompt_wrapper.arg_parser import parse_args
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper import (
+    ChatGPTPromptWrapper,
+    configs,
+)
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper_exception import (
+    ChatGPTPromptWrapperError,
+)
+from chatgpt_prompt_wrapper.config import example_config
+from chatgpt_prompt_wrapper.config_snapshot import ConfigSnapshot
+from chatgpt_prompt_wrapper.cost_ledger import KINDS, CostLedger
+from chatgpt_prompt_wrapper.metrics import MetricsStore
+
+
+@pytest.fixture
+def large_conf_file(tmp_path):
+    file = tmp_path / "config.toml"
+    sections = [example_config()]
+    for i in range(200):
+        sections.append(
+            f"""
+[cmd{i}]
+description = "Command {i}"
+model = "gpt-4o-mini"
+max_output_tokens = {i + 100}
+[[cmd{i}.messages]]
+role = "system"
+content = \"\"\"{"Answer the question in detail. " * 20}\"\"\"
+""",
+        )
+    file.write_text("".join(sections))
+    return file
+
+
+def test_get_cmd_config(conf_file):
+    wrapper = ChatGPTPromptWrapper(
+        argv=["test", "-c", str(conf_file), "--show", "hello"],
+    )
+    wrapper.set_files()
+    config = wrapper.get_cmd_config(wrapper.load_config())
+    assert config["mode"] == "ask"
+    assert config["show"] is True
+    assert config["messages"][-1] == {"role": "user", "content": "hello"}
+    # The loaded configuration is not modified.
+    assert len(wrapper.load_config()["test"]["messages"]) == 4
+
+
+def test_get_cmd_config_file(conf_file):
+    wrapper = ChatGPTPromptWrapper(
+        argv=["ask", "-c", str(conf_file), "--file", "-"],
+    )
+    wrapper.set_files()
+    # The input file is enough for ask without a message.
+    config = wrapper.get_cmd_config(wrapper.load_config())
+    assert config["file"] == "-"
+    assert config["messages"] == []
+
+
+def test_get_hedge_delay(conf_file):
+    wrapper = ChatGPTPromptWrapper(argv=["ask", "-c", str(conf_file)])
+    wrapper.set_files()
+    args = {
+        "model": inspect.Parameter(
+            "model", inspect.Parameter.KEYWORD_ONLY, default="gpt"
+        ),
+        "base_url": inspect.Parameter(
+            "base_url", inspect.Parameter.KEYWORD_ONLY, default="url"
+        ),
+    }
+    config = {"hedge_percentile": 90, "hedge_delay": 3.0}
+    # Not enough records of the command.
+    assert wrapper.get_hedge_delay(config, args) == 3.0
+    records = [
+        {"model": "gpt", "base_url": "url", "ttft": i, "latency": i}
+        for i in range(1, 21)
+    ]
+    MetricsStore(wrapper.metrics_file).append(records, "ask")
+    assert wrapper.get_hedge_delay(config, args) == pytest.approx(18.1)
+    with pytest.raises(ChatGPTPromptWrapperError, match="hedge_percentile"):
+        wrapper.get_hedge_delay({"hedge_percentile": 100}, args)
+
+
+@pytest.mark.benchmark(group="config")
+def test_parse_args_benchmark(benchmark):
+    argv = [
+        "chat",
+        "-m",
+        "gpt-4o-mini",
+        "--max_output_tokens",
+        "100",
+        "--no-show",
+        "--vi",
+        "message",
+        "--",
+        "-k",
+        "in message",
+    ]
+    args = benchmark(parse_args, argv)
+    assert args.subcommand == ["chat"]
+
+
+@pytest.mark.benchmark(group="config")
+def test_load_config_benchmark(benchmark, large_conf_file):
+    wrapper = ChatGPTPromptWrapper(
+        argv=["cmd199", "-c", str(large_conf_file), "hello"],
+    )
+    wrapper.set_files()
+
+    def load():
+        # A command runs in a new process, without the parsed configuration.
+        configs.clear()
+        return wrapper.get_cmd_config(wrapper.load_config())
+
+    config = benchmark(load)
+    assert config["max_output_tokens"] == 299
+
+
+@pytest.mark.benchmark(group="cost")
+def test_update_cost_benchmark(benchmark, tmp_path, conf_file):
+    cost_file = tmp_path / "cost.json"
+    rollup = {kind: {} for kind in KINDS}
+    for i in range(3650):
+        day = f"{2000 + i // 365}{i % 12 + 1:02}{i % 28 + 1:02}"
+        rollup["day"][day] = {"cost": 1.0, "requests": 1}
+        rollup["month"][day[:6]] = {"cost": 1.0, "requests": 1}
+    cost_file.write_text(json.dumps(rollup))
+    ledger = CostLedger(cost_file)
+    ledger.append(
+        [
+            {"model": "gpt", "cost": 0.1, "prompt_tokens": 10}
+            for _ in range(ledger.compact_size // 128)
+        ],
+    )
+    wrapper = ChatGPTPromptWrapper(argv=["test", "-c", str(conf_file)])
+    records = [
+        {
+            "model": "gpt",
+            "prompt_tokens": 10,
+            "completion_tokens": 5,
+            "cost": 0.1,
+            "latency": 0.5,
+        },
+    ]
+    benchmark(wrapper.update_cost, cost_file, 0.1, False, records)
+    assert ledger.aggregates("command")["test"]["cost"] > 0
+
+
+@pytest.mark.benchmark(group="config")
+def test_config_snapshot_benchmark(benchmark, large_conf_file, tmp_path):
+    wrapper = ChatGPTPromptWrapper(
+        argv=["cmd199", "-c", str(large_conf_file), "hello"],
+    )
+    wrapper.set_files()
+    snapshot_dir = tmp_path / "snapshot"
+
+    def load():
+        # A command runs in a new process, with the compiled snapshot.
+        snapshot = ConfigSnapshot(large_conf_file, snapshot_dir)
+        snapshot.names()
+        return wrapper.get_cmd_config(snapshot.config(["cmd199"]))
+
+    config = benchmark(load)
+    assert config["max_output_tokens"] == 299
@@ -0,0 +1,74 @@
+import os
+from types import SimpleNamespace
+
+from chatgpt_prompt_wrapper import config_snapshot
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper import ChatGPTPromptWrapper
+from chatgpt_prompt_wrapper.config_snapshot import ConfigSnapshot
+
+
+def count_parses(monkeypatch):
+    parses = []
+    loads = config_snapshot.tomllib.loads
+
+    def counted(text):
+        parses.append(text)
+        return loads(text)
+
+    monkeypatch.setattr(config_snapshot.tomllib, "loads", counted)
+    return parses
+
+
+def test_config(tmp_path, conf_file, monkeypatch):
+    parses = count_parses(monkeypatch)
+    snapshot = ConfigSnapshot(conf_file, tmp_path / "snapshot")
+    assert "test" in snapshot.names()
+    config = snapshot.config(["test", "unknown"])
+    assert list(config) == ["test"]
+    assert len(config["test"]["messages"]) == 4
+    assert snapshot.summary()["test"]["description"]
+    assert len(parses) == 1
+
+    # Reused by other processes, and kept if the file is only touched.
+    os.utime(conf_file, ns=(0, 0))
+    snapshot = ConfigSnapshot(conf_file, tmp_path / "snapshot")
+    assert snapshot.config(["test"]) == config
+    assert len(parses) == 1
+
+    conf_file.write_text(
+        conf_file.read_text() + '\n[new]\ndescription = "New"\n'
+    )
+    snapshot = ConfigSnapshot(conf_file, tmp_path / "snapshot")
+    assert snapshot.summary()["new"] == {"description": "New", "tokens": {}}
+    assert len(parses) == 2
+    # Only the current version is kept.
+    assert len([x for x in snapshot.directory.iterdir() if x.is_dir()]) == 1
+
+
+def test_tokens(tmp_path, conf_file):
+    snapshot = ConfigSnapshot(conf_file, tmp_path / "snapshot")
+    assert snapshot.get_tokens("test", "enc") is None
+    snapshot.set_tokens("test", "enc", 42)
+    snapshot = ConfigSnapshot(conf_file, tmp_path / "snapshot")
+    assert snapshot.get_tokens("test", "enc") == 42
+    # Token counts are dropped with the old version.
+    conf_file.write_text(conf_file.read_text() + "\n")
+    snapshot = ConfigSnapshot(conf_file, tmp_path / "snapshot")
+    assert snapshot.get_tokens("test", "enc") is None
+
+
+def test_commands(conf_file, caplog):
+    wrapper = ChatGPTPromptWrapper(argv=["test", "-c", str(conf_file)])
+    wrapper.set_files()
+    wrapper.get_cmd_config(
+        wrapper.config_snapshot.config(wrapper.config_snapshot.names()),
+    )
+    gpt = SimpleNamespace(
+        encoding=SimpleNamespace(name="enc"),
+        num_tokens_from_messages=lambda messages: len(messages) * 10,
+    )
+    wrapper.store_prompt_tokens(gpt)
+
+    ChatGPTPromptWrapper(
+        argv=["commands", "-c", str(conf_file), "-k", "dummy"]
+    ).main()
+    assert "(40 prompt tokens)" in caplog.text
@@ -0,0 +1,96 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from chatgpt_prompt_wrapper.cost_ledger import CostLedger
+
+
+def record(timestamp, model="gpt", command="ask", cost=1.0):
+    return {
+        "timestamp": timestamp,
+        "model": model,
+        "command": command,
+        "prompt_tokens": 10,
+        "completion_tokens": 5,
+        "cost": cost,
+        "latency": 0.5,
+    }
+
+
+def test_aggregates(tmp_path):
+    ledger = CostLedger(tmp_path / "cost.json")
+    ledger.append(
+        [
+            record("2024-01-31T10:00:00"),
+            record("2024-02-01T10:00:00", model="gpt2"),
+            record("2024-02-01T11:00:00", command="sh", cost=2.0),
+        ],
+    )
+    assert ledger.ledger_file.is_file()
+    month = ledger.aggregates("month")
+    assert list(month) == ["202401", "202402"]
+    assert month["202402"]["cost"] == 3.0
+    assert month["202402"]["requests"] == 2
+    assert month["202402"]["prompt_tokens"] == 20
+    assert list(ledger.aggregates("day")) == ["20240131", "20240201"]
+    assert ledger.aggregates("model")["gpt"]["cost"] == 3.0
+    assert ledger.aggregates("command")["sh"]["latency"] == 0.5
+
+
+def test_compact(tmp_path):
+    ledger = CostLedger(tmp_path / "cost.json", compact_size=0)
+    ledger.append([record("2023-12-31T10:00:00")])
+    ledger.append([record("2024-01-01T10:00:00")])
+    assert not ledger.ledger_file.exists()
+    assert (tmp_path / "cost-2023.jsonl").read_text().count("\n") == 1
+    assert (tmp_path / "cost-2024.jsonl").read_text().count("\n") == 1
+    assert list(ledger.aggregates("month")) == ["202312", "202401"]
+    assert ledger.aggregates("model")["gpt"]["requests"] == 2
+
+
+def test_legacy(tmp_path):
+    with open(tmp_path / "cost.json", "w") as f:
+        json.dump({"202301": 1.5}, f)
+    ledger = CostLedger(tmp_path / "cost.json")
+    ledger.append([record("2023-01-02T00:00:00")])
+    assert ledger.aggregates("month")["202301"]["cost"] == 2.5
+    ledger.compact()
+    with open(tmp_path / "cost.json") as f:
+        assert json.load(f)["month"]["202301"]["cost"] == 2.5
+
+
+def test_concurrent_append(tmp_path):
+    ledger = CostLedger(tmp_path / "cost.json", compact_size=1000)
+
+    def append(i):
+        CostLedger(tmp_path / "cost.json", compact_size=1000).append(
+            [record("2024-01-01T00:00:00")],
+        )
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(append, range(100)))
+    assert ledger.aggregates("month")["202401"]["requests"] == 100
+
+
+def test_cached_tokens(tmp_path):
+    # Rollup of an older version without cached_tokens.
+    with open(tmp_path / "cost.json", "w") as f:
+        json.dump(
+            {
+                "month": {
+                    "202401": {
+                        "cost": 1.0,
+                        "requests": 1,
+                        "prompt_tokens": 10,
+                        "completion_tokens": 5,
+                        "latency": 0.5,
+                    },
+                },
+            },
+            f,
+        )
+    ledger = CostLedger(tmp_path / "cost.json")
+    ledger.append([{**record("2024-01-02T00:00:00"), "cached_tokens": 8}])
+    month = ledger.aggregates("month")["202401"]
+    assert month["cached_tokens"] == 8
+    assert month["prompt_tokens"] == 20
+    assert ledger.aggregates("command")["ask"]["cached_tokens"] == 8
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper_exception import (
+    ChatGPTPromptWrapperError,
+)
+
+
+def test_headless(monkeypatch, tmp_path, make_discuss, async_client):
+    themes = tmp_path / "themes.txt"
+    themes.write_text("theme 1\n\ntheme 2\ntheme 3\n")
+    discuss = make_discuss(
+        rounds=2,
+        themes=str(themes),
+        transcript_dir=str(tmp_path / "out"),
+        concurrency=2,
+    )
+    monkeypatch.setattr(
+        "openai.AsyncOpenAI",
+        lambda **_: async_client(lambda x: f"reply {len(x)}"),
+    )
+    cost = discuss.run([{"role": "gpt1", "content": "Agree."}])
+    assert len(discuss.usages) == 3 * 2 * 2
+    assert abs(cost - 12 * (10 * 1.0 + 5 * 2.0) / 1000.0) < 1e-9
+    transcripts = sorted((tmp_path / "out").iterdir())
+    assert len(transcripts) == 3
+    with open(transcripts[1]) as f:
+        transcript = json.load(f)
+    assert transcript["theme"] == "theme 2"
+    assert [x["name"] for x in transcript["messages"]] == [
+        "gpt1",
+        "gpt2",
+        "gpt1",
+        "gpt2",
+    ]
+    assert transcript["messages"][0]["content"] == "reply 2"
+    assert transcript["messages"][3]["content"] == "reply 5"
+
+
+def test_themes_without_rounds(make_discuss):
+    with pytest.raises(ChatGPTPromptWrapperError, match="rounds"):
+        make_discuss(themes="themes.txt")
+
+
+def test_headless_close(monkeypatch, tmp_path, make_discuss, async_client):
+    client = async_client(lambda x: "reply")
+    monkeypatch.setattr("openai.AsyncOpenAI", lambda **_: client)
+    discuss = make_discuss(rounds=1, transcript_dir=str(tmp_path))
+
+    async def discuss_error(*args):
+        msg = "unexpected"
+        raise RuntimeError(msg)
+
+    monkeypatch.setattr(discuss, "discuss", discuss_error)
+    with pytest.raises(RuntimeError):
+        discuss.run([{"role": "user", "content": "theme"}])
+    assert client.closed
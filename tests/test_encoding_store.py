@@ -0,0 +1,49 @@
+from chatgpt_prompt_wrapper.chatgpt.encoding_store import (
+    encoding_file,
+    get_encoding,
+    load_encoding,
+    save_encoding,
+)
+
+
+def test_save_load(tmp_path, make_encoding):
+    encoding = make_encoding("test_save_load")
+    path = save_encoding(encoding, tmp_path)
+    assert path == encoding_file(tmp_path, "test_save_load")
+
+    loaded = load_encoding(tmp_path, "test_save_load")
+    assert loaded is not None
+    assert loaded.name == encoding.name
+    assert loaded._mergeable_ranks == encoding._mergeable_ranks
+    assert loaded._special_tokens == encoding._special_tokens
+    text = "abc ab aあ"
+    assert loaded.encode(text) == encoding.encode(text)
+
+
+def test_load_missing(tmp_path):
+    assert load_encoding(tmp_path, "missing") is None
+    encoding_file(tmp_path, "broken").write_bytes(b"broken")
+    assert load_encoding(tmp_path, "broken") is None
+
+
+def test_load_broken(tmp_path, make_encoding):
+    data = save_encoding(make_encoding("broken"), tmp_path).read_bytes()
+    path = encoding_file(tmp_path, "broken")
+    header_end = data.index(b"}") + 1
+    for broken in [
+        b"",
+        data[:10],
+        data[: header_end - 5],
+        data[: header_end + 100],
+        data[:-1],
+        data + b"x",
+        data[:12] + b"{" * (header_end - 12) + data[header_end:],
+    ]:
+        path.write_bytes(broken)
+        assert load_encoding(tmp_path, "broken") is None
+
+
+def test_get_encoding(tmp_path, make_encoding):
+    save_encoding(make_encoding("test_get_encoding"), tmp_path)
+    encoding = get_encoding("test_get_encoding", tmp_path)
+    assert get_encoding("test_get_encoding") is encoding
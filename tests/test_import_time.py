@@ -0,0 +1,44 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ["openai", "tiktoken", "prompt_toolkit"]
+IMPORT_TIME_BUDGET_US = 300000
+
+
+def run_python(code):
+    return subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_import_time():
+    # The package itself is lazy, so measure the module which runs commands.
+    result = run_python("import chatgpt_prompt_wrapper.chatgpt_prompt_wrapper")
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    for module in HEAVY_MODULES:
+        assert module not in cumulative
+    assert (
+        cumulative["chatgpt_prompt_wrapper.chatgpt_prompt_wrapper"]
+        < IMPORT_TIME_BUDGET_US
+    )
+
+
+def test_no_heavy_imports_wo_api(conf_file):
+    code = f"""
+import sys
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper import ChatGPTPromptWrapper
+
+for cmd in ["help", "version", "cost", "commands"]:
+    ChatGPTPromptWrapper(argv=[cmd, "-c", "{conf_file}", "-k", "dummy"]).main()
+print(",".join(m for m in {HEAVY_MODULES} if m in sys.modules))
+"""
+    result = run_python(code)
+    assert result.stdout.splitlines()[-1] == ""
@@ -0,0 +1,113 @@
+import logging
+import time
+
+from chatgpt_prompt_wrapper.chatgpt.stream import Stream
+from chatgpt_prompt_wrapper.cmds import stats
+from chatgpt_prompt_wrapper.metrics import MetricsStore, percentile
+
+
+def record(latency, model="gpt", **kwargs):
+    return {
+        "model": model,
+        "base_url": "http://localhost/v1",
+        "ttft": latency / 2,
+        "latency": latency,
+        "tps": 100 / latency,
+        "retries": 0,
+        **kwargs,
+    }
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.5) == 50.5
+    assert round(percentile(values, 0.99), 2) == 99.01
+    assert percentile([3.0], 0.95) == 3.0
+
+
+def test_values(tmp_path):
+    store = MetricsStore(tmp_path / "metrics.jsonl")
+    store.append([record(i / 10) for i in range(1, 11)], "ask")
+    store.append(
+        [
+            record(1.0, model="gpt2"),
+            record(100.0, cached=True),
+            record(100.0, cancelled=True),
+        ],
+        "chat",
+    )
+    values = store.values(3600)
+    assert list(values) == [
+        ("gpt", "http://localhost/v1", "ask"),
+        ("gpt2", "http://localhost/v1", "chat"),
+    ]
+    latency = values[("gpt", "http://localhost/v1", "ask")]["latency"]
+    assert latency == [i / 10 for i in range(1, 11)]
+    # Out of the window.
+    assert store.values(3600, now=time.time() + 7200) == {}
+
+
+def test_compact(tmp_path, monkeypatch):
+    store = MetricsStore(tmp_path / "metrics.jsonl", compact_size=0)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now - store.retention - 1)
+    store.append([record(1.0)], "ask")
+    monkeypatch.setattr(time, "time", lambda: now)
+    store.append([record(2.0)], "ask")
+    assert [x["latency"] for x in store.read()] == [2.0]
+
+
+def test_prometheus(tmp_path):
+    store = MetricsStore(tmp_path / "metrics.jsonl")
+    store.append([record(1.0, model='g"pt'), record(3.0, model='g"pt')], "ask")
+    text = store.prometheus()
+    assert "# TYPE cg_request_latency_seconds summary" in text
+    labels = 'model="g\\"pt",base_url="http://localhost/v1",command="ask",window="1d"'
+    assert f'cg_request_latency_seconds{{{labels},quantile="0.5"}} 2' in text
+    assert f"cg_request_latency_seconds_count{{{labels}}} 2" in text
+    assert f"cg_request_latency_seconds_sum{{{labels}}} 4" in text
+
+
+def test_stats(tmp_path, caplog, capsys):
+    log = logging.getLogger("test_stats")
+    caplog.set_level(logging.INFO, logger="test_stats")
+    file = tmp_path / "metrics.jsonl"
+    stats(file, log)
+    assert "No metrics in 1d." in caplog.text
+    MetricsStore(file).append([record(1.0)], "ask")
+    stats(file, log, "7d")
+    assert "TTFT(s)p50" in caplog.text
+    assert "gpt, http://localhost/v1, ask, 1, 0.50" in caplog.text
+    stats(file, log, "prometheus")
+    assert "cg_tokens_per_second_count" in capsys.readouterr().out
+
+
+def test_ttft(stand_in, encoding_params, capsys):
+    server = stand_in(ttft=0.1, chunk_delay=0.02)
+    stream = Stream(
+        key="dummy",
+        base_url=server.url,
+        model="dummy",
+        context_window=1000,
+        **encoding_params,
+    )
+    messages = [{"role": "user", "content": "Hello, metrics!"}]
+    start = time.monotonic()
+    response = stream.completion_stream(messages)
+    stream.show_stream(response, 10)
+    latency = time.monotonic() - start
+    assert 0.1 <= response.ttft < latency
+    stream.add_usage(10, 4, latency, ttft=response.ttft)
+    usage = stream.usages[-1]
+    assert usage["base_url"] == server.url
+    assert usage["tps"] == 4 / (latency - response.ttft)
+    assert usage["retries"] == 0
+
+
+def test_quantile(tmp_path):
+    store = MetricsStore(tmp_path / "metrics.jsonl")
+    store.append([record(i / 10) for i in range(1, 11)], "ask")
+    labels = ("gpt", "http://localhost/v1", "ask")
+    assert store.quantile("ttft", labels, 0.5) == 0.275
+    assert store.quantile("ttft", labels, 0.5, min_samples=20) is None
+    assert store.quantile("ttft", ("gpt", "", "ask"), 0.5) is None
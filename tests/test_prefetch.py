@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt.prefetch import Prefetch
+
+
+def test_prefetch():
+    done = threading.Event()
+
+    def request():
+        yield from range(5)
+        done.set()
+
+    prefetch = Prefetch(request)
+    # The stream is consumed before it is iterated.
+    assert done.wait(5)
+    assert list(prefetch) == [0, 1, 2, 3, 4]
+    assert prefetch.latency >= 0
+
+
+def test_prefetch_cancel():
+    release = threading.Event()
+    closed = threading.Event()
+
+    class Response:
+        def __iter__(self):
+            yield 0
+            release.wait(5)
+            yield 1
+            yield 2
+
+        def close(self):
+            closed.set()
+
+    prefetch = Prefetch(Response)
+    prefetch.cancel()
+    release.set()
+    assert closed.wait(5)
+    assert list(prefetch) in [[], [0]]
+
+
+def test_prefetch_error():
+    def request():
+        yield 0
+        raise ValueError("failed")
+
+    prefetch = Prefetch(request)
+    with pytest.raises(ValueError, match="failed"):
+        list(prefetch)
+
+
+def test_discuss_prefetch(monkeypatch, make_discuss, make_chunk):
+    discuss = make_discuss(prefetch=True)
+    requests = []
+
+    def completion_stream(messages, prompt_tokens=None):
+        requests.append(messages)
+        return [make_chunk(role="assistant"), make_chunk(content="reply")]
+
+    monkeypatch.setattr(discuss, "completion_stream", completion_stream)
+    inputs = iter(["", ""])
+
+    def fake_input():
+        if (x := next(inputs, None)) is None:
+            raise KeyboardInterrupt
+        return x
+
+    monkeypatch.setattr("builtins.input", fake_input)
+    discuss.set_no_line_break_log()
+    discuss.run_main([{"role": "user", "content": "theme"}])
+    discuss.reset_no_line_break_log()
+    # The third reply was requested in advance but not shown. It is still
+    # recorded as it was sent.
+    assert len(requests) == 3
+    assert len(discuss.usages) == 3
+    assert discuss.usages[2]["prompt_tokens"] > 0
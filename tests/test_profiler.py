@@ -0,0 +1,78 @@
+import pstats
+
+from chatgpt_prompt_wrapper.chatgpt.token_cache import TokenCache
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper import ChatGPTPromptWrapper
+from chatgpt_prompt_wrapper.profiler import PHASES, Profiler, get_phase
+
+
+def test_get_phase():
+    assert get_phase("/lib/chatgpt/token_cache.py", "count") == "tokenization"
+    assert get_phase("/lib/chatgpt/token_cache.py", "count_batch") == (
+        "tokenization"
+    )
+    assert get_phase("/lib/openai/_base_client.py", "request") == "network"
+    assert get_phase("<frozen importlib._bootstrap>", "_find_and_load") == (
+        "import"
+    )
+    assert get_phase("/lib/foo.py", "count") is None
+
+
+def test_phases(tmp_path, make_encoding):
+    encoding = make_encoding("test_phases")
+    with Profiler(tmp_path / "cg.prof") as profiler:
+        TokenCache().count_batch(encoding, [f"abc {i}" for i in range(1000)])
+    phases = profiler.phases(pstats.Stats(profiler.profile))
+    assert phases["tokenization"] > 0
+    assert phases["network"] == 0
+
+
+def test_profile(tmp_path, conf_file, capsys):
+    output = tmp_path / "profile" / "cg.prof"
+    ChatGPTPromptWrapper(
+        argv=[
+            "commands",
+            "-c",
+            str(conf_file),
+            "-k",
+            "dummy",
+            "--profile",
+            str(output),
+            "--profile-memory",
+        ],
+    ).main()
+    assert pstats.Stats(str(output)).total_calls > 0
+    summary = output.with_name("cg.prof.txt").read_text()
+    assert capsys.readouterr().err == summary
+    for phase in PHASES:
+        assert f"  {phase} " in summary
+    assert "Peak memory:" in summary
+
+
+def test_profile_config(tmp_path, conf_file, stand_in, capsys):
+    output = tmp_path / "cg.prof"
+    with open(conf_file, "a") as f:
+        f.write(f'\n[echo]\nmodel = "dummy"\nprofile = "{output}"\n')
+    server = stand_in()
+    ChatGPTPromptWrapper(
+        argv=["echo", "-c", str(conf_file), "-k", "dummy"]
+        + ["-b", server.url, "hello"],
+    ).main()
+    captured = capsys.readouterr()
+    assert output.is_file()
+    assert "network" in captured.err
+    assert "Peak memory:" not in captured.err
+
+
+def test_profile_set_files_once(conf_file, monkeypatch):
+    calls = []
+    set_files = ChatGPTPromptWrapper.set_files
+
+    def count(self):
+        calls.append(1)
+        set_files(self)
+
+    monkeypatch.setattr(ChatGPTPromptWrapper, "set_files", count)
+    ChatGPTPromptWrapper(
+        argv=["commands", "-c", str(conf_file), "-k", "dummy"],
+    ).main()
+    assert len(calls) == 1
@@ -0,0 +1,183 @@
+import time
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt.chatgpt import ChatGPT
+from chatgpt_prompt_wrapper.chatgpt.rate_limiter import (
+    RateLimiter,
+    limits_key,
+    parse_duration,
+    parse_retry_after,
+)
+
+HEADERS = {
+    "x-ratelimit-limit-requests": "10",
+    "x-ratelimit-remaining-requests": "1",
+    "x-ratelimit-reset-requests": "6m0s",
+    "x-ratelimit-limit-tokens": "1000",
+    "x-ratelimit-remaining-tokens": "500",
+    "x-ratelimit-reset-tokens": "20ms",
+}
+
+
+def test_parse_duration():
+    assert parse_duration("1s") == 1
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("1h2m3.5s") == 3723.5
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("2.5") == 2.5
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({"retry-after": "3"}) == 3
+    assert parse_retry_after({"retry-after-ms": "1500"}) == 1.5
+    assert (
+        parse_retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) < 0
+    )
+
+
+def test_reserve(tmp_path):
+    limiter = RateLimiter(tmp_path / "rate_limits.json")
+    # No limits are known before the first response.
+    assert limiter.reserve("gpt", 10000) == 0
+    limiter.update("gpt", HEADERS)
+    assert limiter.reserve("gpt", 100) == 0
+    # The last request was reserved by the previous one.
+    wait = limiter.reserve("gpt", 100)
+    assert 350 < wait <= 360
+    # Other models are not affected.
+    assert limiter.reserve("gpt2", 100) == 0
+
+    # Shared by another limiter (process) with the same file.
+    other = RateLimiter(tmp_path / "rate_limits.json")
+    assert other.reserve("gpt", 100) > 350
+
+
+def test_limits_key(tmp_path):
+    openai_key = limits_key("https://api.openai.com/v1", "sk-a", "gpt")
+    assert openai_key.endswith("/gpt")
+    assert "sk-a" not in openai_key
+    assert openai_key == limits_key("https://api.openai.com/v1", "sk-a", "gpt")
+    # Other accounts and endpoints have their own limits.
+    other_key = limits_key("https://api.openai.com/v1", "sk-b", "gpt")
+    local_key = limits_key("http://localhost:8000/v1", "sk-a", "gpt")
+    assert len({openai_key, other_key, local_key}) == 3
+
+    path = tmp_path / "rate_limits.json"
+    limiter = RateLimiter(path)
+    limiter.update(openai_key, HEADERS)
+    limiter.reserve(openai_key, 100)
+    assert limiter.reserve(openai_key, 100) > 350
+    assert limiter.reserve(other_key, 100) == 0
+    assert limiter.reserve(local_key, 100) == 0
+    # Not written again when nothing is changed.
+    mtime = path.stat().st_mtime_ns
+    limiter.reserve(openai_key, 100)
+    assert path.stat().st_mtime_ns == mtime
+
+
+def test_rate_limit_default():
+    assert ChatGPT(key="dummy", model="dummy").rate_limiter is not None
+    local = ChatGPT(key="dummy", model="dummy", base_url="http://localhost/v1")
+    assert local.rate_limiter is None
+    local = ChatGPT(
+        key="dummy",
+        model="dummy",
+        base_url="http://localhost/v1",
+        rate_limit=True,
+    )
+    assert local.rate_limiter is not None
+
+
+def test_reserve_tokens():
+    limiter = RateLimiter()
+    limiter.update("gpt", {**HEADERS, "x-ratelimit-remaining-requests": "10"})
+    assert limiter.reserve("gpt", 400) == 0
+    assert 0 < limiter.reserve("gpt", 400) <= 0.02
+    time.sleep(0.03)
+    # Refilled after the reset time.
+    assert limiter.reserve("gpt", 400) == 0
+    # Too large requests are admitted when the limit is not used.
+    time.sleep(0.03)
+    assert limiter.reserve("gpt", 5000) == 0
+
+
+def test_backoff():
+    limiter = RateLimiter(backoff_base=1, backoff_max=4)
+    for attempt in range(5):
+        delay = limiter.backoff("gpt", attempt, {}, block=False)
+        assert min(4, 2**attempt) / 2 <= delay <= min(4, 2**attempt)
+    assert limiter.reserve("gpt", 1) == 0
+    delay = limiter.backoff("gpt", 0, {"retry-after": "30"})
+    assert delay == 30
+    assert 29 < limiter.reserve("gpt", 1) <= 30
+
+
+def make_error(cls, status_code, headers=None, code=None):
+    response = SimpleNamespace(
+        status_code=status_code,
+        headers=headers or {},
+        request=None,
+    )
+    return cls(
+        "error", response=response, body={"code": code} if code else None
+    )
+
+
+def make_gpt(monkeypatch, errors):
+    sleeps = []
+    monkeypatch.setattr("time.sleep", sleeps.append)
+    response = SimpleNamespace(choices=[])
+    calls = []
+
+    def create(**params):
+        calls.append(params)
+        if errors:
+            raise errors.pop(0)
+        return SimpleNamespace(headers=HEADERS, parse=lambda: response)
+
+    gpt = ChatGPT(key="dummy", model="dummy", max_retries=2, rate_limit=True)
+    gpt.rate_limiter.backoff_base = 0.001
+    gpt.client = SimpleNamespace(
+        chat=SimpleNamespace(
+            completions=SimpleNamespace(
+                with_raw_response=SimpleNamespace(create=create),
+            ),
+        ),
+    )
+    return gpt, response, calls, sleeps
+
+
+def test_create_retry(monkeypatch):
+    errors = [
+        make_error(openai.RateLimitError, 429, {"retry-after-ms": "50"}),
+        make_error(openai.InternalServerError, 503),
+    ]
+    gpt, response, calls, sleeps = make_gpt(monkeypatch, errors)
+    assert gpt.create({"messages": []}) is response
+    assert len(calls) == 3
+    assert sleeps[0] == 0.05
+    assert gpt.retries == 2
+
+
+def test_create_no_retry(monkeypatch):
+    error = make_error(openai.BadRequestError, 400)
+    gpt, _, calls, _ = make_gpt(monkeypatch, [error])
+    with pytest.raises(openai.BadRequestError):
+        gpt.create({"messages": []})
+    assert len(calls) == 1
+
+    error = make_error(openai.RateLimitError, 429, code="insufficient_quota")
+    gpt, _, calls, _ = make_gpt(monkeypatch, [error])
+    with pytest.raises(openai.RateLimitError):
+        gpt.create({"messages": []})
+    assert len(calls) == 1
+
+    errors = [openai.APIConnectionError(request=None) for _ in range(3)]
+    gpt, _, calls, _ = make_gpt(monkeypatch, errors)
+    with pytest.raises(openai.APIConnectionError):
+        gpt.create({"messages": []})
+    assert len(calls) == 3
@@ -0,0 +1,84 @@
+import os
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion
+
+from chatgpt_prompt_wrapper.chatgpt.chatgpt import ChatGPT
+from chatgpt_prompt_wrapper.chatgpt.response_cache import ResponseCache
+
+COMPLETION = {
+    "id": "id",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "dummy",
+    "choices": [
+        {
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": "answer"},
+        },
+    ],
+    "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+}
+
+
+def test_get_set(tmp_path):
+    cache = ResponseCache(tmp_path)
+    key = cache.make_key("url", {"model": "a", "messages": []})
+    assert key != cache.make_key("url2", {"model": "a", "messages": []})
+    assert cache.get(key) is None
+    cache.set(key, {"a": 1})
+    assert cache.get(key) == {"a": 1}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_ttl(tmp_path):
+    cache = ResponseCache(tmp_path, ttl=10)
+    cache.set("key", 1)
+    assert cache.get("key") == 1
+    cache.ttl = -1
+    assert cache.get("key") is None
+    assert not cache.path("key").exists()
+
+
+def test_evict(tmp_path):
+    cache = ResponseCache(tmp_path, max_size=2)
+    for i, key in enumerate(["a", "b"]):
+        cache.set(key, i)
+        os.utime(cache.path(key), (i, i))
+    cache.get("a")
+    cache.set("c", 2)
+    assert cache.get("b") is None
+    assert cache.get("a") == 0
+    assert cache.get("c") == 2
+
+
+def test_completion(tmp_path):
+    calls = []
+
+    def create(**params):
+        calls.append(params)
+        return ChatCompletion.model_validate(COMPLETION)
+
+    gpt = ChatGPT(
+        key="dummy",
+        model="dummy",
+        cache=True,
+        cache_dir=tmp_path,
+        rate_limit=False,
+    )
+    gpt.client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create)),
+    )
+    messages = [{"role": "user", "content": "question"}]
+    response = gpt.completion_message(messages)
+    assert not gpt.from_cache
+    cached = gpt.completion_message(messages)
+    assert gpt.from_cache
+    assert cached == response
+    assert len(calls) == 1
+
+    gpt.refresh = True
+    gpt.completion_message(messages)
+    assert not gpt.from_cache
+    assert len(calls) == 2
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper_exception import (
+    ChatGPTPromptWrapperError,
+)
+from chatgpt_prompt_wrapper.client import forward, is_private, socket_path
+from chatgpt_prompt_wrapper.server import serve
+
+
+@pytest.fixture
+def server(tmp_path, conf_file, monkeypatch):
+    path = tmp_path / "cg.sock"
+    monkeypatch.setenv("CG_SOCKET", str(path))
+    monkeypatch.delenv("CG_NO_SERVER", raising=False)
+    proc = subprocess.Popen(  # noqa: S603
+        [
+            sys.executable,
+            "-c",
+            "import sys; from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper import main; sys.argv = ['cg', 'serve']; main()",
+        ],
+        env=os.environ,
+        stdout=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        if path.exists():
+            break
+        time.sleep(0.05)
+    yield path
+    proc.terminate()
+    proc.wait(timeout=10)
+    assert not path.exists()
+
+
+def test_forward(server, conf_file, capsys):
+    assert forward(["commands", "-c", str(conf_file), "-k", "dummy"]) == 0
+    assert "Available subcommands:" in capsys.readouterr().out
+    assert forward(["not_defined", "-c", str(conf_file), "-k", "dummy"]) == 1
+    assert "is not defined" in capsys.readouterr().out
+
+
+def test_fallback(server, conf_file):
+    assert forward(["version"]) is None
+    assert forward(["chat", "-k", "dummy"]) is None
+    argv = ["commands", "-c", str(conf_file), "-k", "dummy"]
+    assert (
+        forward([*argv, "--profile", str(conf_file.with_name("cg.prof"))])
+        is None
+    )
+
+
+def test_no_server(tmp_path, monkeypatch):
+    monkeypatch.setenv("CG_SOCKET", str(tmp_path / "none.sock"))
+    assert forward(["commands"]) is None
+
+
+def test_socket_path(tmp_path, monkeypatch):
+    monkeypatch.delenv("CG_SOCKET", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert socket_path() == tmp_path / f"cg-{os.getuid()}" / "cg.sock"
+
+
+def test_not_private(server, conf_file):
+    os.chmod(server, 0o666)  # noqa: S103
+    assert not is_private(server)
+    assert forward(["commands", "-c", str(conf_file), "-k", "dummy"]) is None
+    os.chmod(server, 0o600)
+    assert is_private(server)
+
+
+def test_already_running(server, caplog):
+    import logging
+
+    with pytest.raises(ChatGPTPromptWrapperError, match="already running"):
+        serve(server, logging.getLogger(__name__))
+    assert server.exists()
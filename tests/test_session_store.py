@@ -0,0 +1,97 @@
+import logging
+import os
+
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper import ChatGPTPromptWrapper
+from chatgpt_prompt_wrapper.chatgpt_prompt_wrapper_exception import (
+    ChatGPTPromptWrapperError,
+)
+from chatgpt_prompt_wrapper.cmds import sessions
+from chatgpt_prompt_wrapper.session_store import SessionStore
+
+
+def user(content):
+    return {"role": "user", "content": content}
+
+
+def test_append_load(tmp_path):
+    store = SessionStore(tmp_path / "sessions")
+    store.append("s1", [(user("a"), 4), (user("b"), 5)], {"encoding": "e"})
+    store.append("s1", [(user("c"), 6)], {"encoding": "other"})
+    with open(store.path("s1"), "a") as f:
+        f.write('{"message": {"role": "us')
+    header, messages, tokens = store.load("s1")
+    assert header == {"session": "s1", "encoding": "e"}
+    assert [x["content"] for x in messages] == ["a", "b", "c"]
+    assert tokens == [4, 5, 6]
+
+
+def test_resolve(tmp_path):
+    store = SessionStore(tmp_path)
+    with pytest.raises(ChatGPTPromptWrapperError, match="no session"):
+        store.resolve("last")
+    for i, session_id in enumerate(["s1", "s2"]):
+        store.append(session_id, [(user("a"), 1)], {})
+        os.utime(store.path(session_id), ns=(i * 10**9, i * 10**9))
+    assert store.resolve("last") == "s2"
+    assert store.resolve("s1") == "s1"
+    for session_id in ["s3", "../s1"]:
+        with pytest.raises(ChatGPTPromptWrapperError, match="not exist"):
+            store.resolve(session_id)
+
+
+def test_prune(tmp_path):
+    store = SessionStore(tmp_path, max_sessions=3)
+    for i in range(5):
+        store.append(f"s{i}", [(user("a"), 1)], {})
+        os.utime(store.path(f"s{i}"), ns=(i * 10**9, i * 10**9))
+    # Pruned when each new session is created.
+    assert store.ids() == ["s4", "s3", "s2"]
+    assert store.prune(1) == ["s3", "s2"]
+    assert store.ids() == ["s4"]
+
+
+def test_sessions(tmp_path, caplog):
+    log = logging.getLogger("test_sessions")
+    caplog.set_level(logging.INFO, logger="test_sessions")
+    sessions(tmp_path, log, [])
+    assert "No sessions." in caplog.text
+    store = SessionStore(tmp_path)
+    store.append(
+        "s1",
+        [({"role": "system", "content": "prompt"}, 3), (user("a\n" * 30), 60)],
+        {"model": "gpt"},
+    )
+    sessions(tmp_path, log, [])
+    assert "s1, " in caplog.text
+    assert ", gpt, 2, 63, " + "a " * 18 + "a..." in caplog.text
+    # Without N, max_sessions are kept.
+    sessions(tmp_path, log, ["prune"])
+    assert "Removed 0 sessions." in caplog.text
+    assert store.ids() == ["s1"]
+    sessions(tmp_path, log, ["prune", "0"])
+    assert "Removed 1 sessions." in caplog.text
+    assert store.ids() == []
+    with pytest.raises(ChatGPTPromptWrapperError, match="Invalid"):
+        sessions(tmp_path, log, ["prune", "x"])
+
+
+def test_sessions_cmd(tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    conf_file = tmp_path / "config.toml"
+    conf_file.write_text("[global]\nmax_sessions = 2\n")
+    argv = ["sessions", "-c", str(conf_file)]
+    wrapper = ChatGPTPromptWrapper(argv=argv)
+    wrapper.set_files()
+    store = SessionStore(wrapper.session_dir, max_sessions=0)
+    for i in range(5):
+        store.append(f"s{i}", [(user("a"), 1)], {})
+        os.utime(store.path(f"s{i}"), ns=(i * 10**9, i * 10**9))
+    caplog.set_level(logging.INFO)
+    ChatGPTPromptWrapper(argv=[*argv, "prune", "3"]).main()
+    assert store.ids() == ["s4", "s3", "s2"]
+    assert "Removed 2 sessions." in caplog.text
+    # Without N, max_sessions in the configuration are kept.
+    ChatGPTPromptWrapper(argv=[*argv, "prune"]).main()
+    assert store.ids() == ["s4", "s3"]
@@ -0,0 +1,114 @@
+import json
+import os
+import time
+
+import openai
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt.chatgpt import ChatGPT
+from chatgpt_prompt_wrapper.chatgpt.stream import Stream
+
+MESSAGES = [{"role": "user", "content": "Hello, stand-in!"}]
+
+
+def make_gpt(cls, server, encoding_params, **kwargs):
+    return cls(
+        key="dummy",
+        base_url=server.url,
+        model="dummy",
+        context_window=1000,
+        **encoding_params,
+        **kwargs,
+    )
+
+
+def test_message(stand_in, encoding_params):
+    server = stand_in(usage={"prompt_tokens": 7, "completion_tokens": 3})
+    gpt = make_gpt(ChatGPT, server, encoding_params)
+    response = gpt.completion_message(MESSAGES)
+    assert response.choices[0].message.content == "Hello, stand-in!"
+    assert response.choices[0].finish_reason == "stop"
+    assert response.usage.prompt_tokens == 7
+    assert response.usage.total_tokens == 10
+
+
+def test_stream(stand_in, encoding_params, capsys):
+    server = stand_in(ttft=0.05, chunk_delay=0.01, chunk_size=1)
+    stream = make_gpt(Stream, server, encoding_params, frame_rate=0)
+    start = time.monotonic()
+    message = stream.show_stream(stream.completion_stream(MESSAGES), 10)
+    assert time.monotonic() - start >= 0.05 + 0.01 * 15
+    assert message == {"role": "assistant", "content": "Hello, stand-in!"}
+    assert capsys.readouterr().out.endswith("Hello, stand-in!\n")
+
+
+@pytest.mark.parametrize(
+    ("error", "exception"),
+    [
+        ("429", openai.RateLimitError),
+        ("500", openai.InternalServerError),
+        ("truncate", openai.APIConnectionError),
+    ],
+)
+def test_errors(stand_in, encoding_params, error, exception):
+    server = stand_in(errors={error: 1.0}, retry_after=0.001)
+    gpt = make_gpt(
+        ChatGPT, server, encoding_params, max_retries=2, rate_limit=True
+    )
+    gpt.rate_limiter.backoff_base = 0.001
+    with pytest.raises(exception):
+        gpt.completion_message(MESSAGES)
+    assert server.requests == 3
+    assert gpt.retries == 2
+
+
+def test_truncated_stream(stand_in, encoding_params):
+    server = stand_in(errors={"truncate": 1.0})
+    stream = make_gpt(Stream, server, encoding_params)
+    chunks = []
+    with pytest.raises(openai.APIConnectionError):
+        for chunk in stream.completion_stream(MESSAGES):
+            chunks.extend(x.delta.content for x in chunk.choices)
+    assert "".join(chunks) == "Hello, s"
+
+
+def test_record(stand_in, encoding_params, tmp_path):
+    upstream = stand_in(usage={"prompt_tokens": 7}, chunk_size=3)
+    recorder = stand_in(record=upstream.url, fixture_dir=str(tmp_path))
+    stream = make_gpt(Stream, recorder, encoding_params)
+    chunks = [
+        x.choices[0].delta.content
+        for x in stream.completion_stream(MESSAGES)
+        if x.choices
+    ]
+    fixtures = list(tmp_path.glob("*.json"))
+    assert len(fixtures) == 1
+    fixture = json.loads(fixtures[0].read_text())
+    assert fixture["request"]["messages"] == MESSAGES
+    assert fixture["chunks"] == ["Hel", "lo,", " st", "and", "-in", "!"]
+    upstream.stop()
+
+    replay = stand_in(fixture_dir=str(tmp_path), strict=True)
+    stream = make_gpt(Stream, replay, encoding_params)
+    assert [
+        x.choices[0].delta.content
+        for x in stream.completion_stream(MESSAGES)
+        if x.choices
+    ] == chunks
+    with pytest.raises(openai.NotFoundError):
+        stream.completion_stream([{"role": "user", "content": "unknown"}])
+
+
+@pytest.mark.benchmark(group="stream")
+def test_stream_round_trip_benchmark(
+    benchmark, monkeypatch, stand_in, encoding_params
+):
+    server = stand_in(chunk_size=1)
+    stream = make_gpt(Stream, server, encoding_params)
+    messages = [{"role": "user", "content": "abc " * 250}]
+    with open(os.devnull, "w") as devnull:
+        monkeypatch.setattr("sys.stdout", devnull)
+        message = benchmark(
+            lambda: stream.show_stream(stream.completion_stream(messages), 10),
+        )
+    assert message["content"] == "abc " * 250
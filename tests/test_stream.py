@@ -0,0 +1,165 @@
+import io
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from chatgpt_prompt_wrapper.chatgpt.stream import Stream
+from chatgpt_prompt_wrapper.chatgpt.stream_writer import StreamWriter
+from chatgpt_prompt_wrapper.chatgpt.window import MessageWindow
+
+
+class CountingIO(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, s):
+        self.writes += 1
+        return super().write(s)
+
+
+def test_stream_writer():
+    out = CountingIO()
+    writer = StreamWriter(frame_rate=1e-6, stream=out)
+    for _ in range(10000):
+        writer.write("a")
+    assert out.writes == 1
+    writer.flush()
+    assert out.writes == 2
+    assert out.getvalue() == "a" * 10000
+
+
+def test_stream_writer_no_buffer():
+    out = CountingIO()
+    writer = StreamWriter(frame_rate=0, stream=out)
+    for _ in range(10):
+        writer.write("a")
+    assert out.writes == 10
+
+
+def test_stream_writer_stall():
+    out = CountingIO()
+    writer = StreamWriter(frame_rate=20, stream=out)
+    writer.write("a")
+    writer.write("b")
+    assert out.getvalue() == "a"
+    # The stream stalls: "b" is shown without the next chunk.
+    for _ in range(100):
+        if out.getvalue() == "ab":
+            break
+        time.sleep(0.01)
+    assert out.getvalue() == "ab"
+    writer.write("c")
+    writer.flush()
+    assert out.getvalue() == "abc"
+
+
+def test_show_stream(capsys, make_chunk):
+    stream = Stream(key="dummy", model="dummy")
+    chunks = [make_chunk(role="assistant", content="")]
+    chunks += [make_chunk(content=f"{i} ") for i in range(100)]
+    chunks += [make_chunk(finish_reason="stop")]
+    message = stream.show_stream(iter(chunks), 10, name="gpt1")
+    expected = "".join(f"{i} " for i in range(100))
+    assert message == {"role": "assistant", "content": expected}
+    assert capsys.readouterr().out.endswith(f"gpt1> {expected}\n")
+
+
+def test_show_stream_usage(monkeypatch, make_chunk, encoding_params):
+    stream = Stream(
+        key="dummy",
+        model="dummy",
+        context_window=100000,
+        **encoding_params,
+    )
+    chunks = [make_chunk(role="assistant", content="")]
+    chunks += [make_chunk(content=f"{i} ") for i in range(10)]
+    chunks += [make_chunk(finish_reason="stop")]
+    content = "".join(f"{i} " for i in range(10))
+    tokens = len(stream.encoding.encode(content))
+    deltas = []
+    encode_ordinary = stream.encoding.encode_ordinary
+
+    def count_delta(text):
+        deltas.append(text)
+        return encode_ordinary(text)
+
+    monkeypatch.setattr(stream.encoding, "encode_ordinary", count_delta)
+    # The usage was requested but not sent: counted once after the stream.
+    stream.show_stream(iter(chunks), 10)
+    assert deltas == []
+    assert stream.content_tokens == tokens
+    assert stream.stream_tokens(99) == (99, tokens, 0)
+    # Without stream_usage, counted for each chunk.
+    stream.stream_usage = False
+    stream.show_stream(iter(chunks), 10)
+    assert len(deltas) == 10
+    assert stream.content_tokens == tokens
+    stream.stream_usage = True
+
+    # The usage chunk at the end of the stream has no choices.
+    usage = SimpleNamespace(
+        prompt_tokens=12,
+        completion_tokens=7,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=4),
+        completion_tokens_details=SimpleNamespace(reasoning_tokens=2),
+    )
+    chunks.append(SimpleNamespace(choices=[], usage=usage))
+    message = stream.show_stream(iter(chunks), 10)
+    assert message["content"] == content
+    assert stream.content_tokens == 5
+    assert stream.stream_tokens(99) == (12, 7, 4)
+
+
+@pytest.mark.benchmark(group="stream")
+def test_show_stream_benchmark(benchmark, monkeypatch, make_chunk):
+    stream = Stream(key="dummy", model="dummy")
+    chunks = [make_chunk(role="assistant", content="")]
+    chunks += [make_chunk(content=f"{i} ") for i in range(10000)]
+    chunks += [make_chunk(finish_reason="stop")]
+    with open(os.devnull, "w") as devnull:
+        monkeypatch.setattr("sys.stdout", devnull)
+        message = benchmark(stream.show_stream, chunks, 10)
+    assert len(message["content"]) == sum(len(f"{i} ") for i in range(10000))
+
+
+def test_fit_window_in_batches(encoding_params):
+    stream = Stream(
+        key="dummy",
+        model="dummy",
+        context_window=100000,
+        prompt_budget=100,
+        compact_ratio=0.5,
+        **encoding_params,
+    )
+    window = MessageWindow(pinned=1)
+    window.extend([{"role": "system", "content": "s"}], [10])
+    for i in range(9):
+        window.append({"role": "user", "content": str(i)}, 10)
+    stream.fit_window(window)
+    assert window.total_tokens == 100
+
+    # Exceeding the budget drops old messages down to the half at once, so
+    # that the prefix stays the same for the next turns.
+    window.append({"role": "user", "content": "9"}, 10)
+    stream.fit_window(window)
+    assert window.total_tokens == 50
+    assert [m["content"] for m in window.messages][1:] == [
+        "6",
+        "7",
+        "8",
+        "9",
+    ]
+    window.append({"role": "user", "content": "10"}, 10)
+    stream.fit_window(window)
+    assert [m["content"] for m in window.messages][1] == "6"
+
+    # By default, only the messages needed to fit are dropped.
+    stream.compact_ratio = Stream.compact_ratio
+    for i in range(11, 17):
+        window.append({"role": "user", "content": str(i)}, 10)
+    stream.fit_window(window)
+    assert window.total_tokens == 100
+    assert [m["content"] for m in window.messages][1] == "8"
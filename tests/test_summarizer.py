@@ -0,0 +1,64 @@
+from chatgpt_prompt_wrapper.chatgpt.chatgpt import ChatGPT
+from chatgpt_prompt_wrapper.chatgpt.summarizer import (
+    SUMMARY_HEADER,
+    Summarizer,
+)
+from chatgpt_prompt_wrapper.chatgpt.window import MessageWindow
+
+
+def make_summarizer(server, **kwargs):
+    gpt = ChatGPT(
+        key="dummy",
+        base_url=server.url,
+        model="dummy",
+        prices={"dummy": (1.0, 2.0)},
+        **kwargs,
+    )
+    return Summarizer(gpt)
+
+
+def test_fold(stand_in):
+    server = stand_in(usage={"prompt_tokens": 30, "completion_tokens": 10})
+    summarizer = make_summarizer(server)
+    window = MessageWindow(pinned=1, summarizer=summarizer)
+    window.append({"role": "system", "content": "system"}, 3)
+    summarizer.update(window, len)
+    assert window.summary is None
+
+    summarizer.fold([({"role": "user", "content": "first"}, 3)])
+    summarizer.executor.submit(lambda: None).result()
+    summarizer.fold([({"role": "assistant", "content": "second"}, 3)])
+    summarizer.executor.submit(lambda: None).result()
+    cost = summarizer.close()
+    assert server.requests == 2
+    # The stand-in echoes the request, which has the previous summary.
+    assert "user: first" in summarizer.text
+    assert "assistant: second" in summarizer.text
+    assert cost == 2 * (0.03 + 0.02)
+    assert len(summarizer.gpt.usages) == 2
+
+    summarizer.update(window, lambda x: len(x["content"]))
+    assert window.messages[1]["content"] == SUMMARY_HEADER + summarizer.text
+    assert window.summary_tokens == len(window.messages[1]["content"])
+    assert window.total_tokens == 3 + window.summary_tokens
+
+
+def test_fold_error(stand_in, caplog):
+    server = stand_in(errors={"500": 1.0})
+    summarizer = make_summarizer(server, max_retries=0)
+    summarizer.fold([({"role": "user", "content": "first"}, 3)])
+    summarizer.close()
+    assert "Failed to summarize messages" in caplog.text
+    assert summarizer.version == 0
+    # Kept to be summarized with the next messages.
+    assert summarizer.backlog == [{"role": "user", "content": "first"}]
+
+
+def test_close_cancels_queued(stand_in):
+    server = stand_in(ttft=0.2)
+    summarizer = make_summarizer(server)
+    for i in range(3):
+        summarizer.fold([({"role": "user", "content": str(i)}, 1)])
+    summarizer.close()
+    # Only the summary in progress is waited for.
+    assert server.requests == 1
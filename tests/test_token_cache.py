@@ -0,0 +1,85 @@
+from chatgpt_prompt_wrapper.chatgpt.token_cache import (
+    BATCH_MIN_CHARS,
+    TokenCache,
+)
+
+
+class DummyEncoding:
+    name = "dummy"
+
+    def __init__(self):
+        self.calls = 0
+        self.batches = 0
+
+    def encode(self, text):
+        self.calls += 1
+        return text.split()
+
+    def encode_batch(self, texts, num_threads=8):
+        self.batches += 1
+        return [self.encode(x) for x in texts]
+
+
+def test_count():
+    encoding = DummyEncoding()
+    cache = TokenCache()
+    assert cache.count(encoding, "a b c") == 3
+    assert cache.count(encoding, "a b c") == 3
+    assert encoding.calls == 1
+    assert cache.get("other", "a b c") is None
+
+
+def test_lru():
+    encoding = DummyEncoding()
+    cache = TokenCache(max_size=2)
+    cache.count(encoding, "a")
+    cache.count(encoding, "a b")
+    cache.count(encoding, "a")
+    cache.count(encoding, "a b c")
+    assert cache.get("dummy", "a") == 1
+    assert cache.get("dummy", "a b") is None
+    assert cache.get("dummy", "a b c") == 3
+
+
+def test_save_load(tmp_path):
+    path = tmp_path / "cg" / "token_cache.json"
+    encoding = DummyEncoding()
+    cache = TokenCache(path)
+    cache.count(encoding, "a b")
+    cache.save()
+    assert path.is_file()
+
+    cache = TokenCache(path)
+    assert cache.count(encoding, "a b") == 2
+    assert encoding.calls == 1
+
+
+def test_count_batch():
+    encoding = DummyEncoding()
+    cache = TokenCache()
+    cache.count(encoding, "a")
+    assert cache.count_batch(encoding, ["a b", "a", "a b", "c"]) == [
+        2,
+        1,
+        2,
+        1,
+    ]
+    # Cached and duplicated texts are not encoded.
+    assert encoding.calls == 3
+    assert encoding.batches == 0
+    assert cache.count_batch(encoding, ["a b", "c"]) == [2, 1]
+    assert encoding.calls == 3
+
+
+def test_count_batch_threads(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 4)
+    encoding = DummyEncoding()
+    cache = TokenCache()
+    texts = ["a " * BATCH_MIN_CHARS, "b c"]
+    assert cache.count_batch(encoding, texts) == [BATCH_MIN_CHARS, 2]
+    assert encoding.batches == 1
+    assert cache.count_batch(encoding, texts, num_threads=1) == [
+        BATCH_MIN_CHARS,
+        2,
+    ]
+    assert encoding.batches == 1
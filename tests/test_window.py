@@ -0,0 +1,103 @@
+from chatgpt_prompt_wrapper.chatgpt.window import MessageWindow
+
+
+def make_window(tokens, pinned=0):
+    window = MessageWindow(pinned=pinned)
+    window.extend(
+        [{"role": "user", "content": str(i)} for i in range(len(tokens))],
+        tokens,
+    )
+    return window
+
+
+def test_total_tokens():
+    window = make_window([1, 2, 3, 4], pinned=1)
+    assert len(window) == 4
+    assert window.total_tokens == 10
+    assert window.tokens == [2, 3, 4]
+
+
+def test_trim():
+    window = make_window([5, 1, 2, 3, 4], pinned=1)
+    dropped = window.trim(12)
+    assert [t for _, t in dropped] == [1, 2]
+    assert [m["content"] for m in window.messages] == ["0", "3", "4"]
+    assert window.total_tokens == 12
+    assert window.trim(12) == []
+
+    window.append({"role": "user", "content": "5"}, 6)
+    window.trim(15)
+    assert [m["content"] for m in window.messages] == ["0", "4", "5"]
+    assert window.total_tokens == 15
+
+
+def test_trim_all():
+    window = make_window([5, 1, 2], pinned=1)
+    window.trim(0)
+    assert [m["content"] for m in window.messages] == ["0"]
+    assert window.total_tokens == 5
+    window.append({"role": "user", "content": "3"}, 3)
+    assert window.total_tokens == 8
+
+
+def test_trim_matches_naive():
+    tokens = [(i * 7) % 13 + 1 for i in range(200)]
+    window = MessageWindow()
+    naive = []
+    for i, t in enumerate(tokens):
+        window.append({"role": "user", "content": str(i)}, t)
+        naive.append(t)
+        window.trim(50)
+        while sum(naive) > 50:
+            naive = naive[1:]
+        assert window.tokens == naive
+        assert window.total_tokens == sum(naive)
+
+
+def test_fit_window_no_recount(monkeypatch, encoding_params):
+    from chatgpt_prompt_wrapper.chatgpt.chatgpt import ChatGPT
+
+    gpt = ChatGPT(
+        key="dummy",
+        model="dummy",
+        context_window=1000,
+        max_output_tokens=100,
+        min_output_tokens=10,
+        **encoding_params,
+    )
+    window = MessageWindow()
+    for i in range(100):
+        message = {"role": "user", "content": f"message {i}"}
+        window.append(message, gpt.num_tokens_from_message(message))
+    prompt_tokens = gpt.fit_window(window)
+    assert prompt_tokens == gpt.num_tokens_from_messages(window.messages)
+
+    def count(messages):
+        raise AssertionError("messages are counted again")
+
+    monkeypatch.setattr(gpt, "num_tokens_from_messages", count)
+    params = gpt.completion_params(window.messages, True, prompt_tokens)
+    assert params["max_completion_tokens"] == min(100, 1000 - prompt_tokens)
+
+
+def test_summary():
+    window = make_window([5, 1, 2], pinned=1)
+    window.set_summary({"role": "system", "content": "summary"}, 3)
+    assert len(window) == 4
+    assert window.total_tokens == 11
+    assert [m["content"] for m in window.messages] == [
+        "0",
+        "summary",
+        "1",
+        "2",
+    ]
+    window.trim(10)
+    assert [m["content"] for m in window.messages] == ["0", "summary", "2"]
+
+
+def test_trim_keep():
+    window = make_window([5, 1, 2, 3], pinned=1)
+    dropped = window.trim(0, keep=1)
+    assert [t for _, t in dropped] == [1, 2]
+    assert [m["content"] for m in window.messages] == ["0", "3"]
+    assert window.trim(0, keep=1) == []